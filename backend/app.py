@@ -61,14 +61,63 @@ GOOGLE_REDIRECT_URI = os.environ.get('GOOGLE_REDIRECT_URI', 'http://localhost:50
 
 # Cache for API responses (simple in-memory cache)
 places_cache = {}
-# Cache for geocoding (ZIP/address -> lat,lng) to avoid repeated lookups
-geocode_cache = {}
+# Geocoding (ZIP/address -> lat,lng): offline gazetteer, then a SQLite-backed cache
+# shared by every worker in front of Nominatim (see geocode_to_lat_lng). All Nominatim
+# requests, forward and reverse, go through one rate-limited scheduler; reverse answers
+# are cached per geohash cell.
+import gazetteer
+import geocoding
+import nominatim
 # Cache for image search (query -> url) to avoid hitting API limits
 image_search_cache = {}
-# In-memory warm cache for recommendations (key -> {items, sources, timestamp})
-_warm_cache = {}
-_warm_cache_lock = None  # Lazy-initialized threading lock
-_background_refresh_in_progress = set()  # Track in-flight background refreshes
+# In-memory warm cache for recommendations (key -> {items, sources, timestamp}),
+# bounded by entry count and bytes (see warm_cache.py)
+from warm_cache import WarmCache
+_warm_cache = WarmCache()
+# One live fetch / background refresh per warm cache key at a time (see get_recommendations)
+from concurrency import (SingleFlight, Deadline, AdaptiveLimiter, Overloaded, LaneFull,
+                         fan_out, upstream, jobs, current_lane)
+import time as _time_mod
+import concurrency
+import concurrent.futures
+_recs_flight = SingleFlight('recommendations')
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.environ.get('SINGLE_FLIGHT_WAIT_SECONDS', '15'))
+# Adaptive cap on concurrent live fetches (AIMD on fetch latency). When it is reached,
+# requests get a degraded result (see _fallback_recommendations) instead of piling onto
+# slow upstreams; background refreshes / warming only get a share of it.
+_live_limiter = AdaptiveLimiter(
+    'live_fetch',
+    initial=int(os.environ.get('LIVE_FETCH_LIMIT_INITIAL', '8')),
+    min_limit=int(os.environ.get('LIVE_FETCH_LIMIT_MIN', '2')),
+    max_limit=int(os.environ.get('LIVE_FETCH_LIMIT_MAX', '32')),
+    target_latency=float(os.environ.get('LIVE_FETCH_TARGET_SECONDS', '6')),
+)
+LIVE_FETCH_BACKGROUND_SHARE = float(os.environ.get('LIVE_FETCH_BACKGROUND_SHARE', '0.5'))
+# Sources that mean the result did not come from a live upstream fetch
+DEGRADED_SOURCES = {'stale_cache', 'cache', 'nearby_pool', 'mock'}
+# How long warm / pool entries are kept past their serving TTL as degraded fallbacks
+DEGRADED_MAX_AGE_SECONDS = int(os.environ.get('DEGRADED_MAX_AGE_SECONDS', str(6 * 3600)))
+# Default total latency budget for a live recommendation fetch (upstream fan-out + enrichment)
+RECS_FETCH_BUDGET_SECONDS = float(os.environ.get('RECS_FETCH_BUDGET_SECONDS', '10'))
+# Bounds for a client-supplied budget (max_latency_ms / X-Max-Latency-Ms, see _request_deadline)
+MIN_LATENCY_BUDGET_MS = int(os.environ.get('MIN_LATENCY_BUDGET_MS', '100'))
+MAX_LATENCY_BUDGET_MS = int(os.environ.get('MAX_LATENCY_BUDGET_MS', '30000'))
+# Below this much time left, image enrichment only uses cached photos
+IMAGE_ENRICH_MIN_SECONDS = float(os.environ.get('IMAGE_ENRICH_MIN_SECONDS', '0.5'))
+# Shared candidate pool: upstream (Google Places + local feeds) results per geo cell,
+# radius bucket and source-affecting prefs, reused by every user in that cell
+# (see _get_candidate_pool). Per-user dedup/ranking runs on top of it.
+CANDIDATE_POOL_TTL_SECONDS = int(os.environ.get('CANDIDATE_POOL_TTL_SECONDS', '900'))
+# Pools fetched under a budget too tight to geocode every item are refetched sooner
+CANDIDATE_POOL_PARTIAL_TTL_SECONDS = int(os.environ.get('CANDIDATE_POOL_PARTIAL_TTL_SECONDS', '60'))
+CANDIDATE_POOL_CELL_DEG = float(os.environ.get('CANDIDATE_POOL_CELL_DEG', '0.05'))
+_candidate_pool = WarmCache(
+    max_entries=int(os.environ.get('CANDIDATE_POOL_MAX_ENTRIES', '200')),
+    max_bytes=int(os.environ.get('CANDIDATE_POOL_MAX_BYTES', str(64 * 1024 * 1024))),
+)
+_pool_flight = SingleFlight('candidate_pool')
+# Activity-aware pre-warming of _warm_cache (scheduler wired up near the end of this file)
+from warming import WarmingScheduler
 
 # Circuit breaker pattern for external APIs
 _circuit_breakers = {}  # {source: {failures: int, last_failure: datetime, total_calls: int}}
@@ -83,13 +132,18 @@ UNSPLASH_ACCESS_KEY = os.environ.get('UNSPLASH_ACCESS_KEY', '')
 import db as _db
 db = _db
 db.init_db()
+# Executor / background threads close their pooled SQLite connection when they end
+concurrency.on_thread_exit(db.close_conn)
 
-# Clean expired cache entries on startup
-try:
-    db.clean_expired_cache()
-    print("[CACHE] Cleaned expired cache entries")
-except Exception as e:
-    print(f"[CACHE] Error cleaning cache: {e}")
+# Clicks/feedback/visited/saved are buffered and committed in batches
+import write_queue
+import place_catalog
+import distance
+
+# Expired cache rows / tokens are purged by a background janitor (see _start_cache_janitor)
+CACHE_JANITOR_INTERVAL_SECONDS = int(os.environ.get('CACHE_JANITOR_INTERVAL_SECONDS', '600'))
+_janitor_stats = {'runs': 0, 'last_run': None, 'last_deleted': {}, 'total_deleted': 0, 'last_compacted': {},
+                  'total_compacted': 0, 'pages_freed': 0, 'last_analyzed': [], 'last_error': None}
 
 # Local feeds (RSS, Facebook, Eventbrite) to complement Google Places
 try:
@@ -270,6 +324,7 @@ MOCK_PLACES = [
         "google_maps_url": "https://www.google.com/maps/place/Japanese+Tea+Garden/@37.7701656,-122.4700706,17z"
     }
 ]
+MOCK_PLACES_BY_ID = {p['place_id']: p for p in MOCK_PLACES}
 
 def get_user_id_from_token(token):
     """Extract user ID from auth token"""
@@ -372,48 +427,20 @@ def reverse_geocode():
     if lat == 0 and lng == 0:
         return jsonify({"error": "Valid lat and lng parameters required"}), 400
     
-    try:
-        url = "https://nominatim.openstreetmap.org/reverse"
-        r = requests.get(
-            url, 
-            params={"lat": lat, "lon": lng, "format": "json"},
-            headers={"User-Agent": "ActivityPlanner/1.0"},
-            timeout=5
-        )
-        
-        if r.status_code == 200:
-            data = r.json()
-            address = data.get('address', {})
-            
-            # Build formatted address
-            parts = []
-            if address.get('city'):
-                parts.append(address['city'])
-            elif address.get('town'):
-                parts.append(address['town'])
-            elif address.get('village'):
-                parts.append(address['village'])
-            elif address.get('county'):
-                parts.append(address['county'])
-            
-            if address.get('state'):
-                parts.append(address['state'])
-            
-            formatted = ", ".join(parts) if parts else data.get('display_name', 'Unknown location')
-            
-            return jsonify({
-                "lat": lat,
-                "lng": lng,
-                "formatted_address": formatted,
-                "display_name": data.get('display_name', '')
-            })
-        else:
-            return jsonify({"error": "Reverse geocoding failed"}), 500
-            
-    except Exception as e:
-        print(f"[REVERSE_GEOCODE] Error: {e}")
+    # City-level answer shared by every point in the same geohash cell (see geocoding.reverse)
+    place = geocoding.reverse(lat, lng)
+    if not place:
         return jsonify({"error": "Reverse geocoding failed"}), 500
 
+    parts = [p for p in (place['city'] or place['county'], place['state']) if p]
+    formatted = ", ".join(parts) if parts else place['display_name'] or 'Unknown location'
+    return jsonify({
+        "lat": lat,
+        "lng": lng,
+        "formatted_address": formatted,
+        "display_name": place['display_name'] or ''
+    })
+
 
 def scrape_og_image(url, timeout=3):
     """Fetch a page and extract og:image or first large image. Fast and reliable for event pages."""
@@ -707,76 +734,108 @@ def image_search():
 
 # ========== USER AFFINITY / PERSONALIZATION ==========
 
+class UserContext:
+    """
+    Request-scoped snapshot of a user's history (visited, saved, feedback, affinity).
+    Loaded once per recommendation request so candidate filtering is O(1) lookups
+    instead of a DB query per item.
+    """
+
+    def __init__(self, user_id, visited_rows=None, saved_ids=None, feedback_rows=None, affinity=None):
+        self.user_id = user_id
+        self.visited_rows = visited_rows or []
+        self.saved_ids = list(saved_ids or [])
+        self.feedback_rows = feedback_rows or []
+        # place_id -> most recent visited_at (parsed once)
+        self.visited = {}
+        for v in self.visited_rows:
+            try:
+                visited_at = datetime.fromisoformat(v['visited_at'])
+            except (ValueError, TypeError):
+                continue
+            prev = self.visited.get(v['place_id'])
+            if prev is None or visited_at > prev:
+                self.visited[v['place_id']] = visited_at
+        self.saved = set(self.saved_ids)
+        self.feedback = {f['place_id']: f for f in self.feedback_rows}
+        self._affinity = affinity
+        # write_queue interaction version this snapshot reflects (set by load())
+        self.version = None
+
+    @classmethod
+    def load(cls, user_id):
+        # Read the version before flushing so a concurrent write can only make it look older
+        version = write_queue.interaction_version(user_id)
+        write_queue.flush_user(user_id)
+        data = db.get_user_interactions(user_id)
+        ctx = cls(user_id, data['visited'], data['saved'], data['feedback'], data['affinity'])
+        ctx.version = version
+        return ctx
+
+    @property
+    def affinity(self):
+        if self._affinity is None:
+            self._affinity = get_user_affinity_scores(self.user_id)
+        return self._affinity
+
+    def visited_within(self, place_id, window):
+        """True if place_id was marked visited less than `window` (timedelta) ago."""
+        visited_at = self.visited.get(place_id)
+        return visited_at is not None and datetime.now() - visited_at < window
+
+
 def get_user_affinity_scores(user_id):
     """
-    Compute category affinity scores from user behavior.
+    Category affinity scores learned from user behavior.
     Weights: saves (strong+), visits (moderate+), thumbs_up (strong+), thumbs_down (negative), clicks (weak+).
     Returns dict like {"parks": 0.8, "food": 0.3, "museums": -0.2} or {} for new users.
-    Cached per user, recomputed hourly or on new interaction.
+    Backed by running counters that every interaction write updates (db.user_category_affinity),
+    so this is a single indexed read.
     """
-    # Check cache first
-    cached = db.get_affinity_cache(user_id)
-    if cached is not None:
-        return cached
+    return db.get_category_affinity(user_id)
 
-    affinity = {}
 
-    def _add(category, weight):
-        if category:
-            affinity[category] = affinity.get(category, 0.0) + weight
+def _get_category_for_place(user_id, place_id):
+    """Look up category for a place_id from mock data or the place catalog."""
+    mock = MOCK_PLACES_BY_ID.get(place_id)
+    if mock:
+        return mock.get('category')
+    return place_catalog.category_for(place_id)
 
-    # Saves: strong positive (+0.3 each)
-    saved = db.get_saved_list(user_id)
-    for s in saved:
-        # Need category - look up from mock or recent recs
-        cat = _get_category_for_place(user_id, s['place_id'])
-        _add(cat, 0.3)
 
-    # Visits: moderate positive (+0.2 each)
-    visited = db.get_visited_list(user_id)
-    for v in visited:
-        cat = _get_category_for_place(user_id, v['place_id'])
-        _add(cat, 0.2)
+def register_served_items(user_id, items):
+    """Record items as served to user_id (rec_id -> item snapshot) for feedback/click/calendar lookups."""
+    if user_id and items:
+        write_queue.enqueue('register_served_recommendations', user_id, db.pack_served_items(items))
 
-    # Feedback: thumbs_up (+0.4), thumbs_down (-0.5)
-    feedback = db.get_all_feedback(user_id)
-    for f in feedback:
-        cat = f.get('category') or _get_category_for_place(user_id, f['place_id'])
-        if f['feedback_type'] == 'thumbs_up':
-            _add(cat, 0.4)
-        elif f['feedback_type'] == 'thumbs_down':
-            _add(cat, -0.5)
-
-    # Clicks: weak positive (+0.1 each)
-    click_counts = db.get_click_counts_by_category(user_id)
-    for cat, cnt in click_counts.items():
-        _add(cat, 0.1 * min(cnt, 10))  # Cap at 10 clicks
-
-    # Normalize to [-1, 1] range
-    if affinity:
-        max_abs = max(abs(v) for v in affinity.values()) or 1.0
-        if max_abs > 1.0:
-            affinity = {k: round(v / max_abs, 2) for k, v in affinity.items()}
-        else:
-            affinity = {k: round(v, 2) for k, v in affinity.items()}
 
-    # Cache result
-    db.set_affinity_cache(user_id, affinity)
-    return affinity
+def get_served_item(user_id, rec_id):
+    """
+    The item served to this user under rec_id (snapshot dict), or None.
+    Snapshots still in the write-behind queue are read from there rather than flushed,
+    so interaction writes stay off the request path.
+    Older mock recommendations only exist in recent_recommendations and come back as {rec_id, place_id}.
+    """
+    if not rec_id:
+        return None
+    served = db.get_served_recommendation(user_id, rec_id)
+    if served:
+        return served['item']
+    for (packed_rows, *_) in reversed(write_queue.pending_args('register_served_recommendations', user_id)):
+        for row_rec_id, _, blob in packed_rows:
+            if row_rec_id == rec_id:
+                return db.decode_items(blob)
+    rec = db.get_recent_recommendation(user_id, rec_id)
+    if rec:
+        return {'rec_id': rec_id, 'place_id': rec['place_id']}
+    return None
 
 
-def _get_category_for_place(user_id, place_id):
-    """Look up category for a place_id from mock data or cached recommendations."""
-    # Check mock data
-    for p in MOCK_PLACES:
-        if p.get('place_id') == place_id:
-            return p.get('category')
-    # Check warm cache
-    for cache_entry in _warm_cache.values():
-        for item in cache_entry.get('items', []):
-            if item.get('place_id') == place_id:
-                return item.get('category')
-    return None
+def _category_for_interaction(user_id, place_id, served=None):
+    """Category of the served snapshot when it is the same place, else the catalog lookup."""
+    if served and served.get('place_id') == place_id and served.get('category'):
+        return served['category']
+    return _get_category_for_place(user_id, place_id)
 
 
 # ========== CIRCUIT BREAKER PATTERN ==========
@@ -837,28 +896,107 @@ def _get_warm_cache_key(user_id, prefs):
     return hashlib.md5(cache_key_data.encode()).hexdigest()[:16]
 
 
+def _warm_entry(items, sources, basis=None, trimmed=False):
+    """
+    Warm cache entry for a live result. With a basis from _fetch_recommendations_live it also
+    keeps the pre-selection candidates, so _rerank_warm_entry can re-run the per-user ranking.
+    A trimmed result (a stage was cut short by the latency budget) is stamped as already past
+    WARM_CACHE_FRESH_SECONDS, so the next hit serves it and refreshes it with a full budget.
+    """
+    timestamp = datetime.now()
+    if trimmed:
+        timestamp -= timedelta(seconds=WARM_CACHE_FRESH_SECONDS)
+    entry = {'items': items, 'sources': sources, 'timestamp': timestamp}
+    if basis and basis.get('candidates'):
+        entry.update(candidates=basis['candidates'], lat=basis['lat'], lng=basis['lng'],
+                     version=basis['version'])
+    return entry
+
+
+def _rerank_warm_entry(user_id, prefs, cache_key, entry):
+    """
+    Re-run dedup, scoring and source-diversity selection over a warm entry's candidates when
+    the user's feedback / visited / saved / affinity changed since it was ranked (write_queue
+    interaction version). No upstream calls: images are carried over from the previous items,
+    newly promoted items go out as the ranker produced them. The entry keeps its timestamp, so
+    the normal refresh schedule is unchanged. Returns the (possibly updated) entry.
+    """
+    candidates = entry.get('candidates')
+    if not candidates or entry.get('version') == write_queue.interaction_version(user_id):
+        return entry
+    start = _time_mod.monotonic()
+    ctx = UserContext.load(user_id)
+    items = _rank_candidates_for_user(user_id, prefs, candidates, entry['lat'], entry['lng'], ctx)
+    if not items:
+        return entry
+    previous = {item.get('place_id') or item.get('id'): item for item in entry['items']}
+    for i, item in enumerate(items):
+        prev = previous.get(item.get('place_id') or item.get('id'))
+        if prev and prev.get('photo_url') and not item.get('photo_url'):
+            items[i] = {**item, 'photo_url': prev['photo_url'], 'photo_source': prev.get('photo_source')}
+    reranked = {**entry, 'items': items, 'version': ctx.version}
+    _warm_cache.put(cache_key, reranked)
+    print(f"[WARM_CACHE] Re-ranked {len(candidates)} candidates for {user_id} after new interactions "
+          f"in {(_time_mod.monotonic() - start) * 1000:.0f}ms")
+    return reranked
+
+
+def _limited_live_fetch(user_id, prefs, cache_key, ctx=None, deadline=None, basis=None):
+    """
+    _fetch_recommendations_live behind the adaptive live-fetch limiter. Raises Overloaded when
+    the limiter is saturated; background lanes only get LIVE_FETCH_BACKGROUND_SHARE of it.
+    """
+    share = 1.0 if current_lane() == 'interactive' else LIVE_FETCH_BACKGROUND_SHARE
+    if not _live_limiter.try_acquire(share):
+        raise Overloaded(f"live fetch limit reached ({_live_limiter.stats()['limit']})")
+    start = _time_mod.monotonic()
+    ok = False
+    try:
+        items, sources = _fetch_recommendations_live(user_id, prefs, cache_key, ctx=ctx, deadline=deadline,
+                                                     basis=basis)
+        ok = bool(items) and not set(sources) <= DEGRADED_SOURCES
+        return items, sources
+    finally:
+        _live_limiter.release(_time_mod.monotonic() - start, ok)
+
+
+def _fetch_and_cache(user_id, prefs, cache_key, ctx=None, deadline=None):
+    """
+    Live fetch that also stores a non-empty result in the warm cache. Run under _recs_flight.
+    Degraded results are not stored, so the next request retries the upstreams.
+    """
+    basis = {}
+    items, sources = _limited_live_fetch(user_id, prefs, cache_key, ctx=ctx, deadline=deadline, basis=basis)
+    if items and not set(sources) <= DEGRADED_SOURCES:
+        _warm_cache.put(cache_key, _warm_entry(items, sources, basis, trimmed=bool(deadline and deadline.cuts)))
+    return items, sources
+
+
 def _refresh_recommendations_background(user_id, prefs, cache_key):
-    """Background thread to refresh recommendations and update warm cache."""
-    global _warm_cache, _background_refresh_in_progress
+    """Background refresh of a stale warm cache entry (run via _recs_flight.start_background)."""
     try:
-        items, sources = _fetch_recommendations_live(user_id, prefs, cache_key)
-        if items:
-            _warm_cache[cache_key] = {
-                'items': items,
-                'sources': sources,
-                'timestamp': datetime.now()
-            }
+        basis = {}
+        items, sources = _limited_live_fetch(user_id, prefs, cache_key, basis=basis)
+        if items and set(sources) <= DEGRADED_SOURCES:
+            # Upstreams failed: the stale entry is still the best answer, keep it as is
+            print(f"[WARM_CACHE] Background refresh for {cache_key} degraded ({', '.join(sources)}), keeping stale entry")
+        elif items:
+            _warm_cache.put(cache_key, _warm_entry(items, sources, basis))
             print(f"[WARM_CACHE] Background refresh done: {len(items)} items for key {cache_key}")
         else:
             # Refresh returned nothing — evict stale cache so next request fetches live
             _warm_cache.pop(cache_key, None)
             print(f"[WARM_CACHE] Background refresh returned empty — evicted cache")
+        return items, sources
+    except Overloaded:
+        # Shed under load: keep serving the stale entry rather than forcing live fetches
+        print(f"[WARM_CACHE] Background refresh for {cache_key} shed (live fetch limit reached)")
+        raise
     except Exception as e:
         print(f"[WARM_CACHE] Background refresh error: {e}")
         # Evict cache on error so next request tries live fetch
         _warm_cache.pop(cache_key, None)
-    finally:
-        _background_refresh_in_progress.discard(cache_key)
+        raise
 
 
 # Warm cache TTL: serve from cache if < 10 min old, trigger background refresh if > 3 min old
@@ -866,20 +1004,25 @@ WARM_CACHE_FRESH_SECONDS = 180   # 3 min: fully fresh, no refresh needed
 WARM_CACHE_STALE_SECONDS = 600   # 10 min: stale but serveable, trigger background refresh
 
 
-def get_recommendations(user_id, prefs):
+def get_recommendations(user_id, prefs, ctx=None, deadline=None, meta=None):
     """
     Main recommendation engine with stale-while-revalidate pattern:
     1. Check in-memory warm cache — serve immediately if available
     2. If cache is stale (>5min), trigger background refresh
-    3. If no cache, fetch live (blocking)
-    4. Fallback chain: Google Places -> Local feeds -> DB cache -> Mock data
+    3. If no cache, fetch live (blocking). Concurrent misses for the same key share one
+       fetch; waiters give up after SINGLE_FLIGHT_WAIT_SECONDS and use DB cache / mock data
+    4. Fallback chain: Google Places -> Local feeds -> degraded options (_fallback_recommendations)
+    5. When the adaptive live-fetch limiter is saturated, skip the upstreams and serve a
+       degraded result straight away
+    ctx: optional UserContext for this request (loaded on demand if a live fetch is needed).
+    deadline: optional concurrency.Deadline for the whole call (default RECS_FETCH_BUDGET_SECONDS).
+    meta: optional dict, filled with 'degraded' and 'degraded_reason' for the response, and
+    'stages_cut' (the deadline's list of stages that trimmed their work to fit the budget).
     """
-    import hashlib
-    import threading
-    global _warm_cache_lock
-    if _warm_cache_lock is None:
-        _warm_cache_lock = threading.Lock()
-    
+    meta = meta if meta is not None else {}
+    meta.setdefault('degraded', False)
+    deadline = deadline or Deadline(RECS_FETCH_BUDGET_SECONDS)
+    meta['stages_cut'] = deadline.cuts
     cache_key = _get_warm_cache_key(user_id, prefs)
     print(f"[RECOMMENDATIONS] Getting recommendations for user {user_id}, cache_key: {cache_key}")
     
@@ -888,44 +1031,55 @@ def get_recommendations(user_id, prefs):
     if cached:
         age_seconds = (datetime.now() - cached['timestamp']).total_seconds()
         if age_seconds < WARM_CACHE_STALE_SECONDS:
+            cached = _rerank_warm_entry(user_id, prefs, cache_key, cached)
             print(f"[WARM_CACHE] Hit! age={age_seconds:.0f}s, items={len(cached['items'])}")
             # If stale (>5min), trigger background refresh
-            if age_seconds > WARM_CACHE_FRESH_SECONDS and cache_key not in _background_refresh_in_progress:
-                _background_refresh_in_progress.add(cache_key)
-                t = threading.Thread(
-                    target=_refresh_recommendations_background,
-                    args=(user_id, prefs, cache_key),
-                    daemon=True
-                )
-                t.start()
-                print(f"[WARM_CACHE] Triggered background refresh (stale)")
+            if age_seconds > WARM_CACHE_FRESH_SECONDS:
+                if _recs_flight.start_background(
+                    cache_key, lambda: _refresh_recommendations_background(user_id, prefs, cache_key),
+                    executor=jobs.executor('background')
+                ):
+                    print(f"[WARM_CACHE] Triggered background refresh (stale)")
             return cached['items'], cached['sources']
     
-    # No warm cache — fetch live (blocking)
-    items, sources = _fetch_recommendations_live(user_id, prefs, cache_key)
-    
-    # Store in warm cache
-    if items:
-        _warm_cache[cache_key] = {
-            'items': items,
-            'sources': sources,
-            'timestamp': datetime.now()
-        }
-    
+    # No warm cache — fetch live (blocking), or wait for the fetch already in flight
+    try:
+        items, sources = _recs_flight.do(
+            cache_key, lambda: _fetch_and_cache(user_id, prefs, cache_key, ctx=ctx, deadline=deadline),
+            timeout=deadline.remaining(SINGLE_FLIGHT_WAIT_SECONDS)
+        )
+    except concurrent.futures.TimeoutError:
+        print(f"[RECOMMENDATIONS] In-flight fetch for {cache_key} did not finish within budget "
+              f"({deadline.elapsed_ms():.0f}ms), using fallback")
+        deadline.cut('live_fetch')
+        return _fallback_recommendations(user_id, prefs, cache_key, ctx=ctx, reason='timeout', meta=meta)
+    except Overloaded as e:
+        print(f"[RECOMMENDATIONS] Shedding live fetch for {cache_key}: {e}")
+        return _fallback_recommendations(user_id, prefs, cache_key, ctx=ctx, reason='overloaded', meta=meta)
+    
+    if set(sources) <= DEGRADED_SOURCES:
+        # Live fetch ran but every upstream failed, so it already fell back
+        meta['degraded'] = True
+        meta['degraded_reason'] = 'upstream_unavailable'
     return items, sources
 
 
-def enrich_items_with_images(items, max_time_seconds=4):
+def enrich_items_with_images(items, max_time_seconds=4, deadline=None):
     """
     Enrich recommendation items with real images using free sources.
-    Uses ThreadPoolExecutor to fetch images in parallel without blocking.
-    Limited to max_time_seconds to avoid adding latency.
+    Lookups run in parallel on the shared upstream executor (caller's lane) without blocking.
+    Limited to max_time_seconds (and the deadline, if given) to avoid adding latency; with
+    less than IMAGE_ENRICH_MIN_SECONDS left only cached photos are used. Either kind of
+    trimming is recorded on the deadline as 'image_enrichment'.
     """
     import concurrent.futures
     import time
     
     start_time = time.time()
     enriched_items = []
+    if deadline is not None:
+        max_time_seconds = deadline.remaining(max_time_seconds)
+    network = max_time_seconds >= IMAGE_ENRICH_MIN_SECONDS
     
     def fetch_image_for_item(item):
         try:
@@ -984,6 +1138,9 @@ def enrich_items_with_images(items, max_time_seconds=4):
                     db.cache_photo(query, cached_url, cached_source)
                     return item_copy
             
+            if not network:
+                return item
+            
             image_url = None
             source = None
             
@@ -1015,33 +1172,53 @@ def enrich_items_with_images(items, max_time_seconds=4):
             print(f"[IMAGE_ENRICH] Error enriching '{item.get('title', 'item')}': {e}")
             return item
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-        # Submit all image search tasks
-        future_to_item = {executor.submit(fetch_image_for_item, item): item for item in items}
-        
-        # Collect results with timeout
+    if not network:
+        # No time for lookups: cached photos only, inline
+        if deadline is not None:
+            deadline.cut('image_enrichment')
+        enriched_items = [fetch_image_for_item(item) for item in items]
+        print(f"[IMAGE_ENRICH] {max_time_seconds:.2f}s left - used cached images only "
+              f"({sum(1 for item in enriched_items if item.get('photo_url'))}/{len(items)})")
+        return enriched_items
+    
+    # Stragglers past the time limit keep running and still fill the photo cache
+    executor = upstream.executor()
+    finished = set()  # id() of items whose lookup completed
+    # Submit all image search tasks (items the lane has no room for stay as they are)
+    future_to_item = {}
+    for item in items:
         try:
-            for future in concurrent.futures.as_completed(future_to_item, timeout=max_time_seconds):
-                try:
-                    enriched_item = future.result(timeout=0.5)
-                    enriched_items.append(enriched_item)
-                except Exception as e:
-                    original_item = future_to_item[future]
-                    enriched_items.append(original_item)
-                    print(f"[IMAGE_ENRICH] Error processing item: {e}")
-                
-                # Check overall time limit
-                if time.time() - start_time > max_time_seconds:
-                    break
-        except (TimeoutError, concurrent.futures.TimeoutError):
-            print(f"[IMAGE_ENRICH] Global timeout after {time.time() - start_time:.1f}s")
+            future_to_item[executor.submit(fetch_image_for_item, item)] = item
+        except LaneFull:
+            break
+    
+    # Collect results with timeout
+    try:
+        for future in concurrent.futures.as_completed(future_to_item, timeout=max_time_seconds):
+            finished.add(id(future_to_item[future]))
+            try:
+                enriched_item = future.result(timeout=0.5)
+                enriched_items.append(enriched_item)
+            except Exception as e:
+                original_item = future_to_item[future]
+                enriched_items.append(original_item)
+                print(f"[IMAGE_ENRICH] Error processing item: {e}")
+            
+            # Check overall time limit
+            if time.time() - start_time > max_time_seconds:
+                break
+    except (TimeoutError, concurrent.futures.TimeoutError):
+        print(f"[IMAGE_ENRICH] Global timeout after {time.time() - start_time:.1f}s")
     
     # Add any remaining items that didn't complete
     completed_items = len(enriched_items)
     if completed_items < len(items):
-        remaining_items = items[completed_items:]
+        # Futures complete out of order, so pick the unfinished items by identity
+        remaining_items = [item for item in items if id(item) not in finished]
         enriched_items.extend(remaining_items)
         print(f"[IMAGE_ENRICH] Timeout: enriched {completed_items}/{len(items)} items")
+        if deadline is not None:
+            deadline.cut('image_enrichment')
     
     elapsed = time.time() - start_time
     success_count = sum(1 for item in enriched_items if item.get('photo_url'))
@@ -1051,51 +1228,127 @@ def enrich_items_with_images(items, max_time_seconds=4):
     return enriched_items
 
 
-def _fetch_recommendations_live(user_id, prefs, cache_key):
+def _candidate_pool_key(prefs, user_lat, user_lng):
     """
-    Live fetch from all sources with fallback chain:
-    1. Try Google Places API (if key configured)
-    2. Try local feeds (parallel fetch, 5s timeout)
-    3. Merge and rank results
-    4. Cache successful results
-    5. If all live sources fail, return cached results
-    6. If no cache, return enriched mock data
+    Shared candidate pool key: quantized geo cell + radius bucket + the prefs that change
+    what the upstream sources return. Nothing user-specific (history, affinity) goes in.
+    Returns (key, cell_lat, cell_lng, max_travel_min).
     """
-    from datetime import datetime, timedelta
+    import hashlib
+    import math
+    deg = CANDIDATE_POOL_CELL_DEG
+    cell_row = math.floor(user_lat / deg)
+    cell_col = math.floor(user_lng / deg)
+    cell_lat = round((cell_row + 0.5) * deg, 6)
+    cell_lng = round((cell_col + 0.5) * deg, 6)
+    # get_max_travel_time already buckets travel ranges into 15/30/60/90 minutes
+    max_travel = get_max_travel_time(prefs.get('travel_time_ranges', []))
+    signature = '|'.join([
+        ','.join(sorted(prefs.get('categories') or [])),
+        str(bool(prefs.get('kid_friendly', False))),
+        str(prefs.get('budget') or ''),
+        str(prefs.get('group_type') or ''),
+        ','.join(sorted(prefs.get('interests') or [])),
+        str(prefs.get('energy_level') or ''),
+    ])
+    digest = hashlib.md5(signature.encode()).hexdigest()[:10]
+    return f"{cell_row}:{cell_col}:{max_travel}:{digest}", cell_lat, cell_lng, max_travel
+
+
+def _cell_margin_miles(cell_lat):
+    """Half-diagonal of a pool cell: how far any user in the cell can be from its center."""
+    import math
+    half = CANDIDATE_POOL_CELL_DEG / 2
+    dlat = half * 69.0
+    dlng = half * 69.0 * math.cos(math.radians(cell_lat))
+    return math.sqrt(dlat * dlat + dlng * dlng)
+
+
+def _dedupe_candidates(all_items):
+    """User-independent filtering of raw source items: cross-source dedup and test/draft items."""
+    candidates = []
+    seen_place_ids = set()
+    seen_title_keys = set()
+    dedup_count = 0
+    for item in all_items:
+        place_id = item.get('place_id')
+        if place_id and place_id in seen_place_ids:
+            dedup_count += 1
+            continue
+        if place_id:
+            seen_place_ids.add(place_id)
+
+        # Filter test/draft items
+        title = item.get('title') or item.get('name') or ''
+        if re.match(r'^test\s*[-–—:]', title, re.IGNORECASE):
+            continue
+
+        # Fuzzy title deduplication (normalize to lowercase, strip punctuation/whitespace)
+        title_key = re.sub(r'[^a-z0-9]', '', title.lower())
+        if title_key and title_key in seen_title_keys:
+            dedup_count += 1
+            continue
+        if title_key:
+            seen_title_keys.add(title_key)
+        
+        candidates.append(item)
     
-    # Resolve user location
+    if dedup_count:
+        print(f"[CANDIDATE_POOL] Deduplicated {dedup_count} duplicate items")
+    return candidates
+
+
+def _merge_late_candidates(pool_key, source_name, items):
+    """Fold a source that answered after the fan-out deadline into the pool entry for the next request."""
+    if not items:
+        return
+    record_success(source_name)
+    place_catalog.remember(items)
+    entry = _candidate_pool.peek(pool_key)
+    if entry:
+        merged = {
+            'items': _dedupe_candidates(entry['items'] + items),
+            'sources': sorted(set(entry['sources']) | {source_name}),
+            'timestamp': entry['timestamp'],
+        }
+    else:
+        merged = {'items': _dedupe_candidates(items), 'sources': [source_name], 'timestamp': datetime.now()}
+    _candidate_pool.put(pool_key, merged)
+    print(f"[CANDIDATE_POOL] Late {source_name} result: merged {len(items)} items into {pool_key}")
+
+
+def _fetch_candidate_pool(prefs, pool_key, cell_lat, cell_lng, max_travel, deadline):
+    """
+    Fan out to Google Places + local feeds for one pool cell (run under _pool_flight).
+    Sources are queried from the cell center with the radius widened by the cell's
+    half-diagonal, so every user in the cell sees everything within their own radius
+    after per-user re-projection. Returns at the deadline with whatever arrived; a
+    source that answers later is merged into the pool entry (_merge_late_candidates).
+    Returns {'items', 'sources', 'timestamp'}.
+    """
     home_location = prefs.get('home_location', {})
-    user_lat, user_lng = resolve_user_location(home_location)
-    categories = prefs.get('categories', [])
-    kid_friendly = prefs.get('kid_friendly', False)
     travel_time_ranges = prefs.get('travel_time_ranges', [])
+    margin_miles = _cell_margin_miles(cell_lat)
+    max_radius_miles = get_max_radius_miles(travel_time_ranges) + margin_miles
+    max_travel_min = max_travel + estimate_travel_time_minutes(margin_miles)
     
-    # Step 1: Try to get from cache first
-    cached = db.get_cached_recommendations(user_id, cache_key)
-    cached_items = cached['items'] if cached else None
-    
-    # Initialize result tracking
     all_items = []
-    sources_tried = []
     sources_succeeded = []
-    sources_failed = []
     
-    # Steps 2 & 3: Fetch Google Places + local feeds in PARALLEL
-    import concurrent.futures as _cf
-
     def _fetch_google_places():
         if not GOOGLE_PLACES_API_KEY or is_circuit_open('google_places'):
-            return 'google_places', [], not GOOGLE_PLACES_API_KEY
+            return [], not GOOGLE_PLACES_API_KEY
         try:
-            items = get_google_places_recommendations(prefs, user_id, user_lat, user_lng)
-            return 'google_places', items or [], False
+            items = get_google_places_recommendations(prefs, None, cell_lat, cell_lng,
+                                                      radius_miles=max_radius_miles)
+            return items or [], False
         except Exception as e:
             print(f"[RECOMMENDATIONS] Google Places error: {e}")
-            return 'google_places', [], True
+            return [], True
 
     def _fetch_local():
         if not local_feeds or is_circuit_open('local_feeds'):
-            return 'local_feeds', [], not local_feeds
+            return [], not local_feeds
         try:
             profile = {
                 'location': home_location,
@@ -1104,223 +1357,374 @@ def _fetch_recommendations_live(user_id, prefs, cache_key):
                 'energy_level': prefs.get('energy_level'),
                 'budget': prefs.get('budget'),
                 'travel_time_ranges': travel_time_ranges,
-                'kid_friendly': kid_friendly
+                'kid_friendly': prefs.get('kid_friendly', False)
             }
-            max_travel_min = get_max_travel_time(travel_time_ranges)
-            max_radius_miles = get_max_radius_miles(travel_time_ranges)
             week_str = f"{datetime.now().year}-{datetime.now().isocalendar()[1]:02d}"
             items = local_feeds.get_local_feed_recommendations(
-                profile=profile, user_lat=user_lat, user_lng=user_lng,
+                profile=profile, user_lat=cell_lat, user_lng=cell_lng,
                 geocode_fn=geocode_to_lat_lng, max_items=20,
                 max_travel_min=max_travel_min, max_radius_miles=max_radius_miles,
-                week_str=week_str
+                week_str=week_str, deadline=deadline
             )
-            return 'local_feeds', items or [], False
+            return items or [], False
         except Exception as e:
             print(f"[RECOMMENDATIONS] Local feeds error: {e}")
-            return 'local_feeds', [], True
+            return [], True
+
+    def _late(source_name, result):
+        items, _ = result
+        _merge_late_candidates(pool_key, source_name, items)
+
+    print(f"[CANDIDATE_POOL] Fetching Google Places + local feeds in parallel for cell ({cell_lat}, {cell_lng}), "
+          f"budget {deadline.remaining():.1f}s...")
+    results, errors, pending = fan_out(
+        {'google_places': _fetch_google_places, 'local_feeds': _fetch_local},
+        deadline.remaining(), on_late=_late, executor=upstream.executor(), name='candidate-pool'
+    )
+    for source_name, (items, had_error) in results.items():
+        if items:
+            all_items.extend(items)
+            sources_succeeded.append(source_name)
+            record_success(source_name)
+            print(f"[RECOMMENDATIONS] {source_name}: {len(items)} items")
+        elif had_error:
+            record_failure(source_name)
+    for source_name, e in errors.items():
+        print(f"[RECOMMENDATIONS] Parallel fetch error in {source_name}: {e}")
+    if pending:
+        print(f"[RECOMMENDATIONS] Deadline reached - continuing with {len(all_items)} items, "
+              f"{', '.join(pending)} will fill the pool when done")
+        deadline.cut('sources')
+    
+    # Everything we saw goes into the place catalog (category / detail lookups later)
+    place_catalog.remember(all_items)
+    
+    pool = {'items': _dedupe_candidates(all_items), 'sources': sources_succeeded, 'timestamp': datetime.now()}
+    if any(stage in deadline.cuts for stage in ('sources', 'local_feeds', 'geocoding')):
+        # Trimmed by this caller's budget (a source or local feed cut short, or items without
+        # a Nominatim lookup): every user in the cell shares it, so don't keep it for the full TTL
+        pool['partial'] = True
+    return pool
+
+
+def _get_candidate_pool(prefs, user_lat, user_lng, deadline):
+    """
+    Shared candidates for the user's cell: from _candidate_pool while younger than
+    CANDIDATE_POOL_TTL_SECONDS (CANDIDATE_POOL_PARTIAL_TTL_SECONDS for partial pools),
+    else one upstream fetch shared by every concurrent caller for the same cell. Empty
+    results are not pooled so the next request retries.
+    """
+    pool_key, cell_lat, cell_lng, max_travel = _candidate_pool_key(prefs, user_lat, user_lng)
+    entry = _candidate_pool.get(pool_key)
+    ttl = CANDIDATE_POOL_PARTIAL_TTL_SECONDS if entry and entry.get('partial') else CANDIDATE_POOL_TTL_SECONDS
+    if entry and (datetime.now() - entry['timestamp']).total_seconds() < ttl:
+        print(f"[CANDIDATE_POOL] Hit {pool_key}: {len(entry['items'])} candidates")
+        return entry
+    
+    def _fetch():
+        fetched = _fetch_candidate_pool(prefs, pool_key, cell_lat, cell_lng, max_travel, deadline)
+        if fetched['items']:
+            _candidate_pool.put(pool_key, fetched)
+        return fetched
+    
+    return _pool_flight.do(pool_key, _fetch, timeout=deadline.remaining(SINGLE_FLIGHT_WAIT_SECONDS))
+
 
-    print("[RECOMMENDATIONS] Fetching Google Places + local feeds in parallel...")
-    with _cf.ThreadPoolExecutor(max_workers=2) as executor:
-        futures = [executor.submit(_fetch_google_places), executor.submit(_fetch_local)]
+def _candidate_distances(candidates, user_lat, user_lng):
+    """
+    (distance, travel minutes) from this user for each pool candidate, computed as one
+    batch over the whole pool; None for items without usable coordinates.
+    """
+    indexes, lats, lngs = [], [], []
+    for i, item in enumerate(candidates):
+        lat, lng = item.get('lat'), item.get('lng')
+        if item.get('distance_is_na') or lat is None or lng is None:
+            continue
         try:
-            for future in _cf.as_completed(futures, timeout=10):
-                try:
-                    source_name, items, had_error = future.result()
-                    sources_tried.append(source_name)
-                    if items:
-                        all_items.extend(items)
-                        sources_succeeded.append(source_name)
-                        record_success(source_name)
-                        print(f"[RECOMMENDATIONS] {source_name}: {len(items)} items")
-                    elif had_error:
-                        record_failure(source_name)
-                        sources_failed.append(source_name)
-                except Exception as e:
-                    print(f"[RECOMMENDATIONS] Parallel fetch error: {e}")
-        except Exception as e:
-            print(f"[RECOMMENDATIONS] Parallel timeout - continuing with {len(all_items)} items: {e}")
-    
-    # Step 4: Merge, deduplicate and rank results
-    if all_items:
-        print(f"[RECOMMENDATIONS] Merging {len(all_items)} items from {len(sources_succeeded)} sources")
-        
-        # Filter by user preferences
-        filtered_items = []
-        print(f"[RECOMMENDATIONS] Filtering {len(all_items)} items, max_travel={get_max_travel_time(travel_time_ranges)}, max_radius={get_max_radius_miles(travel_time_ranges)}")
-        now = datetime.now()
-        past_filtered = 0
-        seen_place_ids = set()
-        seen_title_keys = set()
-        dedup_count = 0
-        for item in all_items:
-            # Filter out past events (on or before query date)
-            event_date_str = item.get('event_date')
-            if event_date_str:
+            lat, lng = float(lat), float(lng)
+        except (TypeError, ValueError):
+            continue
+        indexes.append(i)
+        lats.append(lat)
+        lngs.append(lng)
+    measured = [None] * len(candidates)
+    if indexes:
+        dists, travels = distance.measure(user_lat, user_lng, lats, lngs)
+        for i, dist, travel in zip(indexes, dists, travels):
+            measured[i] = (dist, travel)
+    return measured
+
+
+def _project_to_user(item, measured):
+    """
+    Copy of a pool item with distance/travel time measured from this user rather than the
+    cell center; measured is its (distance, travel minutes) from _candidate_distances.
+    """
+    projected = dict(item)
+    if measured is None:
+        return projected
+    dist, travel = measured
+    projected['distance_miles'] = round(dist, 1)
+    projected['travel_time_min'] = travel
+    if 'distance_display' in item:
+        if item.get('distance_is_estimated'):
+            projected['distance_display'] = f"~{round(dist, 1)} mi (estimated)"
+            projected['travel_time_display'] = f"~{travel} min (estimated)"
+        else:
+            projected['distance_display'] = f"{round(dist, 1)} mi"
+            projected['travel_time_display'] = f"{travel} min"
+    return projected
+
+
+def _rank_candidates_for_user(user_id, prefs, candidates, user_lat, user_lng, ctx):
+    """Per-user stage over the shared pool: re-project distance, filter, dedup against history, score and pick 15."""
+    kid_friendly = prefs.get('kid_friendly', False)
+    travel_time_ranges = prefs.get('travel_time_ranges', [])
+    max_travel = get_max_travel_time(travel_time_ranges)
+    max_radius = get_max_radius_miles(travel_time_ranges)
+    
+    # Filter by user preferences
+    filtered_items = []
+    print(f"[RECOMMENDATIONS] Filtering {len(candidates)} items, max_travel={max_travel}, max_radius={max_radius}")
+    now = datetime.now()
+    past_filtered = 0
+    measured = _candidate_distances(candidates, user_lat, user_lng)
+    for candidate, candidate_measured in zip(candidates, measured):
+        # Filter out past events (on or before query date)
+        event_date_str = candidate.get('event_date')
+        if event_date_str:
+            try:
+                ed = event_date_str.replace('Z', '+00:00')
+                # Try ISO format first
                 try:
-                    ed = event_date_str.replace('Z', '+00:00')
-                    # Try ISO format first
-                    try:
-                        event_dt = datetime.fromisoformat(ed)
-                    except (ValueError, AttributeError):
-                        from dateutil import parser as dateutil_parser
-                        event_dt = dateutil_parser.parse(ed)
-                    # Strip timezone for comparison
-                    if event_dt.tzinfo:
-                        event_dt = event_dt.replace(tzinfo=None)
-                    if event_dt < now:
-                        past_filtered += 1
-                        continue
-                except Exception:
-                    pass  # Can't parse date, keep the item
-
-            # Apply travel time filter
-            travel_time = item.get('travel_time_min')
-            if travel_time and isinstance(travel_time, (int, float)):
-                max_travel = get_max_travel_time(travel_time_ranges)
-                if travel_time > max_travel:
+                    event_dt = datetime.fromisoformat(ed)
+                except (ValueError, AttributeError):
+                    from dateutil import parser as dateutil_parser
+                    event_dt = dateutil_parser.parse(ed)
+                # Strip timezone for comparison
+                if event_dt.tzinfo:
+                    event_dt = event_dt.replace(tzinfo=None)
+                if event_dt < now:
+                    past_filtered += 1
                     continue
-            
-            # Apply distance filter  
-            distance = item.get('distance_miles')
-            if distance and isinstance(distance, (int, float)):
-                max_radius = get_max_radius_miles(travel_time_ranges) 
-                if distance > max_radius:
-                    continue
-            
-            # Apply visited-place deduplication
-            place_id = item.get('place_id')
-            if place_id and should_dedup(place_id, user_id, prefs):
-                continue
-
-            # Cross-source deduplication by place_id
-            if place_id and place_id in seen_place_ids:
-                dedup_count += 1
-                continue
-            if place_id:
-                seen_place_ids.add(place_id)
+            except Exception:
+                pass  # Can't parse date, keep the item
 
-            # Filter test/draft items
-            title = item.get('title') or item.get('name') or ''
-            if re.match(r'^test\s*[-–—:]', title, re.IGNORECASE):
-                continue
+        # Apply visited-place deduplication
+        place_id = candidate.get('place_id')
+        if place_id and should_dedup(place_id, user_id, prefs, ctx=ctx):
+            continue
 
-            # Fuzzy title deduplication (normalize to lowercase, strip punctuation/whitespace)
-            title_key = re.sub(r'[^a-z0-9]', '', title.lower())
-            if title_key and title_key in seen_title_keys:
-                dedup_count += 1
+        item = _project_to_user(candidate, candidate_measured)
+        
+        # Apply travel time filter
+        travel_time = item.get('travel_time_min')
+        if travel_time and isinstance(travel_time, (int, float)):
+            if travel_time > max_travel:
                 continue
-            if title_key:
-                seen_title_keys.add(title_key)
-            
-            filtered_items.append(item)
-        
-        if past_filtered:
-            print(f"[RECOMMENDATIONS] Filtered out {past_filtered} past events")
-        if dedup_count:
-            print(f"[RECOMMENDATIONS] Deduplicated {dedup_count} duplicate items")
-        print(f"[RECOMMENDATIONS] After filtering: {len(filtered_items)} items (from {len(all_items)})")
-        
-        # Get user affinity scores for personalized re-ranking
-        user_affinity = get_user_affinity_scores(user_id)
-
-        # Score and rank all items together
-        def _item_score(item):
-            score = 0
-            # Distance is the primary ranking factor — closer is much better
-            d = item.get('distance_miles')
-            if d is not None:
-                # Continuous distance penalty: max 50 points for 0 miles, drops off
-                if d <= 3:
-                    score += 50
-                elif d <= 5:
-                    score += 40
-                elif d <= 10:
-                    score += 30
-                elif d <= 15:
-                    score += 20
-                elif d <= 25:
-                    score += 10
-                else:
-                    score += max(0, 5 - int(d / 20))
-            else:
-                # No distance data — slight penalty to rank below known-nearby items
-                score -= 5
-            # Rating bonus
-            score += (item.get('rating', 0) or 0) * 5
-            # Events with dates are more actionable
-            if item.get('event_date'):
-                score += 5
-            # Kid-friendly bonus if applicable
-            if kid_friendly and item.get('kid_friendly'):
-                score += 10
-            # Free is a plus
-            if (item.get('price_flag') or '').lower() == 'free':
-                score += 3
-            # Personalization: apply affinity multiplier
-            if user_affinity:
-                cat = item.get('category', '')
-                affinity_val = user_affinity.get(cat, 0.0)
-                # Affinity ranges [-1, 1], apply as bonus/penalty (up to ±15 points)
-                score += affinity_val * 15
-            return score
-        
-        filtered_items.sort(key=_item_score, reverse=True)
-        
-        # Take top 15 items with source diversity
-        final_items = []
-        source_counts = {}
-        max_per_source = 6
         
-        for item in filtered_items:
-            src = item.get('feed_source') or item.get('type', 'unknown')
-            if source_counts.get(src, 0) >= max_per_source:
+        # Apply distance filter  
+        distance = item.get('distance_miles')
+        if distance and isinstance(distance, (int, float)):
+            if distance > max_radius:
                 continue
-            source_counts[src] = source_counts.get(src, 0) + 1
-            final_items.append(item)
-            if len(final_items) >= 15:
-                break
         
-        # Fill remaining if needed
-        if len(final_items) < 15:
-            for item in filtered_items:
-                if item not in final_items:
-                    final_items.append(item)
-                    if len(final_items) >= 15:
-                        break
+        filtered_items.append(item)
+    
+    if past_filtered:
+        print(f"[RECOMMENDATIONS] Filtered out {past_filtered} past events")
+    print(f"[RECOMMENDATIONS] After filtering: {len(filtered_items)} items (from {len(candidates)})")
+    
+    # Get user affinity scores for personalized re-ranking
+    user_affinity = ctx.affinity
+
+    # Score and rank all items together
+    def _item_score(item):
+        score = 0
+        # Distance is the primary ranking factor — closer is much better
+        d = item.get('distance_miles')
+        if d is not None:
+            # Continuous distance penalty: max 50 points for 0 miles, drops off
+            if d <= 3:
+                score += 50
+            elif d <= 5:
+                score += 40
+            elif d <= 10:
+                score += 30
+            elif d <= 15:
+                score += 20
+            elif d <= 25:
+                score += 10
+            else:
+                score += max(0, 5 - int(d / 20))
+        else:
+            # No distance data — slight penalty to rank below known-nearby items
+            score -= 5
+        # Rating bonus
+        score += (item.get('rating', 0) or 0) * 5
+        # Events with dates are more actionable
+        if item.get('event_date'):
+            score += 5
+        # Kid-friendly bonus if applicable
+        if kid_friendly and item.get('kid_friendly'):
+            score += 10
+        # Free is a plus
+        if (item.get('price_flag') or '').lower() == 'free':
+            score += 3
+        # Personalization: apply affinity multiplier
+        if user_affinity:
+            cat = item.get('category', '')
+            affinity_val = user_affinity.get(cat, 0.0)
+            # Affinity ranges [-1, 1], apply as bonus/penalty (up to ±15 points)
+            score += affinity_val * 15
+        return score
+    
+    filtered_items.sort(key=_item_score, reverse=True)
+    
+    # Take top 15 items with source diversity
+    final_items = []
+    source_counts = {}
+    max_per_source = 6
+    
+    for item in filtered_items:
+        src = item.get('feed_source') or item.get('type', 'unknown')
+        if source_counts.get(src, 0) >= max_per_source:
+            continue
+        source_counts[src] = source_counts.get(src, 0) + 1
+        final_items.append(item)
+        if len(final_items) >= 15:
+            break
+    
+    # Fill remaining if needed
+    if len(final_items) < 15:
+        for item in filtered_items:
+            if item not in final_items:
+                final_items.append(item)
+                if len(final_items) >= 15:
+                    break
+    
+    return final_items
+
+
+def _fetch_recommendations_live(user_id, prefs, cache_key, ctx=None, deadline=None, basis=None):
+    """
+    Live fetch with fallback chain:
+    1. Shared candidate pool for the user's geo cell (Google Places + local feeds,
+       fetched once per cell and reused across users until CANDIDATE_POOL_TTL_SECONDS)
+    2. Per-user re-projection, filtering, dedup and affinity ranking on top of it
+    3. Cache successful results
+    4. If all live sources fail, return cached results
+    5. If no cache, return enriched mock data
+    Upstream fan-out and image enrichment stop at the deadline (default RECS_FETCH_BUDGET_SECONDS).
+    basis: optional dict, filled with what the ranking was based on (pooled candidates, user
+    location, interaction version) so the warm entry can be re-ranked later without a fetch.
+    """
+    from datetime import datetime, timedelta
+    deadline = deadline or Deadline(RECS_FETCH_BUDGET_SECONDS)
+    
+    # One snapshot of the user's history for every filter below
+    ctx = ctx or UserContext.load(user_id)
+    
+    # Resolve user location
+    home_location = prefs.get('home_location', {})
+    user_lat, user_lng = resolve_user_location(home_location)
+    
+    # Step 1: The db cache is only a fallback, read lazily if every live source fails
+    pool = _get_candidate_pool(prefs, user_lat, user_lng, deadline)
+    
+    if pool['items']:
+        print(f"[RECOMMENDATIONS] Ranking {len(pool['items'])} pooled candidates from {len(pool['sources'])} sources")
+        final_items = _rank_candidates_for_user(user_id, prefs, pool['items'], user_lat, user_lng, ctx)
+        if basis is not None:
+            basis.update(candidates=pool['items'], lat=user_lat, lng=user_lng, version=ctx.version)
         
-        # Step 5: Enrich items with real images (parallel, max 2s)
+        # Enrich items with real images (parallel, max 3s; photo lookups are cached in SQLite)
         print(f"[RECOMMENDATIONS] Enriching {len(final_items)} items with images...")
-        final_items = enrich_items_with_images(final_items, max_time_seconds=3)
+        final_items = enrich_items_with_images(final_items, max_time_seconds=3, deadline=deadline)
         
         # Cache successful results
         if final_items:
             cache_expiry = datetime.now() + timedelta(minutes=30)
-            db.cache_recommendations(user_id, cache_key, final_items, cache_expiry.isoformat())
+            write_queue.enqueue('store_packed_recommendations', user_id, cache_key,
+                                db.pack_recommendations(final_items), cache_expiry.isoformat())
             print(f"[RECOMMENDATIONS] Cached {len(final_items)} items")
         
-        return final_items, sources_succeeded
+        return final_items, list(pool['sources'])
+    
+    # Steps 4 & 5: all live sources failed
+    return _fallback_recommendations(user_id, prefs, cache_key, ctx=ctx, user_lat=user_lat, user_lng=user_lng)
+
+
+def _nearby_pool_entry(prefs, user_lat, user_lng):
+    """
+    Any pooled candidates usable for this user without an upstream call: the user's own
+    cell regardless of age, else one of the 8 neighbouring cells (same radius bucket and
+    prefs signature). Returns (entry, pool_key) or (None, None).
+    """
+    pool_key, _, _, _ = _candidate_pool_key(prefs, user_lat, user_lng)
+    row, col, rest = pool_key.split(':', 2)
+    row, col = int(row), int(col)
+    keys = [pool_key] + [f"{row + dr}:{col + dc}:{rest}"
+                         for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+    for key in keys:
+        entry = _candidate_pool.peek(key)
+        if entry and entry['items']:
+            return entry, key
+    return None, None
+
+
+def _fallback_recommendations(user_id, prefs, cache_key, ctx=None, user_lat=None, user_lng=None,
+                              reason='upstream_unavailable', meta=None):
+    """
+    Degraded recommendations without live sources, best option first:
+    1. stale warm cache entry (past WARM_CACHE_STALE_SECONDS)
+    2. DB cache for this key
+    3. candidate pool for this cell (any age) or a neighbouring cell, ranked for the user
+    4. enriched mock data
+    Marks meta['degraded'] / meta['degraded_reason'] when meta is given.
+    """
+    if meta is not None:
+        meta['degraded'] = True
+        meta['degraded_reason'] = reason
+    
+    stale = _warm_cache.peek(cache_key)
+    if stale and stale['items']:
+        age = (datetime.now() - stale['timestamp']).total_seconds()
+        print(f"[RECOMMENDATIONS] Degraded ({reason}): serving stale warm entry ({age:.0f}s old)")
+        return stale['items'], ['stale_cache']
     
-    # Step 5: If all live sources failed, try cached results
+    cached = db.get_cached_recommendations(user_id, cache_key)
+    cached_items = cached['items'] if cached else None
     if cached_items:
-        print(f"[RECOMMENDATIONS] All live sources failed, returning {len(cached_items)} cached items")
+        print(f"[RECOMMENDATIONS] Degraded ({reason}): returning {len(cached_items)} cached items")
         return cached_items, ['cache']
     
-    # Step 6: Last resort - return enriched mock data
-    print("[RECOMMENDATIONS] No live sources or cache, falling back to mock data")
-    mock_items = get_enriched_mock_data(prefs, user_id, user_lat, user_lng)
+    if user_lat is None or user_lng is None:
+        user_lat, user_lng = resolve_user_location(prefs.get('home_location', {}))
+    ctx = ctx or UserContext.load(user_id)
+    entry, pool_key = _nearby_pool_entry(prefs, user_lat, user_lng)
+    if entry:
+        items = _rank_candidates_for_user(user_id, prefs, entry['items'], user_lat, user_lng, ctx)
+        if items:
+            print(f"[RECOMMENDATIONS] Degraded ({reason}): {len(items)} items from pooled cell {pool_key}")
+            return items, ['nearby_pool']
+    
+    # Last resort - return enriched mock data
+    print(f"[RECOMMENDATIONS] Degraded ({reason}): no cache or pool, falling back to mock data")
+    mock_items = get_enriched_mock_data(prefs, user_id, user_lat, user_lng, ctx=ctx)
     return mock_items, ['mock']
 
 
-def get_google_places_recommendations(prefs, user_id, user_lat, user_lng):
-    """Get recommendations from Google Places API based on user preferences."""
+def get_google_places_recommendations(prefs, user_id, user_lat, user_lng, radius_miles=None):
+    """Get recommendations from Google Places API based on user preferences.
+    radius_miles overrides the search radius derived from travel_time_ranges."""
     if not GOOGLE_PLACES_API_KEY:
         return []
     
     items = []
     categories = prefs.get('categories', ['parks', 'museums', 'attractions'])
     travel_time_ranges = prefs.get('travel_time_ranges', ['15-30'])
-    max_radius_miles = get_max_radius_miles(travel_time_ranges)
+    max_radius_miles = radius_miles or get_max_radius_miles(travel_time_ranges)
     radius_meters = min(int(max_radius_miles * 1609), 50000)  # Convert to meters, max 50km
     
     location = {'lat': user_lat, 'lng': user_lng}
@@ -1330,10 +1734,11 @@ def get_google_places_recommendations(prefs, user_id, user_lat, user_lng):
         places = search_google_places(location, category, radius_meters)
         if places:
             cat_count = 0
+            dists, travels = _google_place_distances(places[:8], location)
             for i, place in enumerate(places[:8]):  # Check top 8, take up to 3
                 if _is_excluded_place(place):
                     continue
-                item = convert_google_place_to_item(place, location, len(items))
+                item = convert_google_place_to_item(place, location, len(items), (dists[i], travels[i]))
                 
                 # Apply kid_friendly filter if needed
                 if prefs.get('kid_friendly') and not item.get('kid_friendly'):
@@ -1352,8 +1757,9 @@ def get_google_places_recommendations(prefs, user_id, user_lat, user_lng):
     return items
 
 
-def get_enriched_mock_data(prefs, user_id, user_lat, user_lng):
+def get_enriched_mock_data(prefs, user_id, user_lat, user_lng, ctx=None):
     """Return mock data enriched with correct distances/travel times from user location."""
+    ctx = ctx or UserContext.load(user_id)
     mock_items = []
     categories = prefs.get('categories', ['parks', 'museums', 'attractions'])
     travel_time_ranges = prefs.get('travel_time_ranges', ['15-30'])
@@ -1362,17 +1768,20 @@ def get_enriched_mock_data(prefs, user_id, user_lat, user_lng):
     
     week = f"{datetime.now().year}-{datetime.now().isocalendar()[1]:02d}"
     
+    # Distances to every mock place in one batch
+    mock_dists, mock_travel = distance.measure(
+        user_lat, user_lng, [p['lat'] for p in MOCK_PLACES], [p['lng'] for p in MOCK_PLACES])
     for i, place in enumerate(MOCK_PLACES):
         # Apply category filter
         if categories and place['category'] not in categories:
             continue
         
         # Apply deduplication 
-        if should_dedup(place['place_id'], user_id, prefs):
+        if should_dedup(place['place_id'], user_id, prefs, ctx=ctx):
             continue
         
         # Compute actual distance and travel time from user location
-        enriched_place = _place_with_distance_from_user(place, user_lat, user_lng)
+        enriched_place = _place_with_distance_from_user(place, mock_dists[i], mock_travel[i])
         
         # Apply distance/time filters
         if enriched_place['distance_miles'] > max_radius:
@@ -1385,7 +1794,7 @@ def get_enriched_mock_data(prefs, user_id, user_lat, user_lng):
             continue
         
         # Convert to recommendation format
-        rec_id = f"mock_{user_id}_{week}_{len(mock_items)}"
+        rec_id = f"mock_{user_id}_{week}_{enriched_place['place_id']}"
         google_maps_url = enriched_place.get('google_maps_url') or f"https://www.google.com/maps/search/?api=1&query={enriched_place['lat']},{enriched_place['lng']}"
         
         item = {
@@ -1420,16 +1829,13 @@ def get_enriched_mock_data(prefs, user_id, user_lat, user_lng):
     return mock_items
 
 
-def should_dedup(place_id, user_id, prefs):
-    """Check if a place should be deduplicated"""
+def should_dedup(place_id, user_id, prefs, ctx=None):
+    """Check if a place should be deduplicated (pass ctx to avoid a query per call)"""
+    ctx = ctx or UserContext.load(user_id)
     # Check explicit "already been"
-    visited = db.get_visited_list(user_id)
-    for visit in visited:
-        if visit['place_id'] == place_id:
-            visited_at = datetime.fromisoformat(visit['visited_at'])
-            dedup_window = timedelta(days=prefs.get('dedup_window_days', 365))
-            if datetime.now() - visited_at < dedup_window:
-                return True
+    dedup_window = timedelta(days=prefs.get('dedup_window_days', 365))
+    if ctx.visited_within(place_id, dedup_window):
+        return True
     
     # Note: previously filtered recently recommended places (last 4 weeks),
     # but this was too aggressive and reduced result count. Removed — users
@@ -1438,7 +1844,7 @@ def should_dedup(place_id, user_id, prefs):
     return False
 
 # Average speed (mph) for deriving max distance from max travel time
-AVG_SPEED_MPH = 25
+AVG_SPEED_MPH = distance.AVG_SPEED_MPH
 
 def get_max_travel_time(travel_time_ranges):
     """Get max travel time in minutes from travel_time_ranges list"""
@@ -1465,16 +1871,34 @@ def get_max_radius_miles(travel_time_ranges):
     # distance = (minutes / 60) * speed_mph
     return max(3, int((max_min / 60) * AVG_SPEED_MPH))
 
-def _place_with_distance_from_user(place, user_lat, user_lng):
-    """Return a copy of place with distance_miles and travel_time_min computed from user location."""
+def _place_with_distance_from_user(place, dist, travel):
+    """Return a copy of place with distance_miles and travel_time_min (measured from the user by the caller)."""
     import copy
     p = copy.deepcopy(place)
-    dist = calculate_distance(user_lat, user_lng, place['lat'], place['lng'])
     p['distance_miles'] = round(dist, 1)
-    p['travel_time_min'] = estimate_travel_time_minutes(dist)
+    p['travel_time_min'] = travel
     return p
 
 
+def _request_deadline(body=None):
+    """
+    Deadline from the client's optional latency budget: the max_latency_ms query parameter,
+    the X-Max-Latency-Ms header or a max_latency_ms body field, clamped to
+    [MIN_LATENCY_BUDGET_MS, MAX_LATENCY_BUDGET_MS]. None (default budget) if absent or invalid.
+    """
+    raw = (request.args.get('max_latency_ms') or request.headers.get('X-Max-Latency-Ms')
+           or (body or {}).get('max_latency_ms'))
+    if raw in (None, ''):
+        return None
+    try:
+        budget_ms = int(float(raw))
+    except (TypeError, ValueError):
+        print(f"[RECOMMENDATIONS] Ignoring invalid max_latency_ms: {raw!r}")
+        return None
+    budget_ms = max(MIN_LATENCY_BUDGET_MS, min(MAX_LATENCY_BUDGET_MS, budget_ms))
+    return Deadline(budget_ms / 1000.0)
+
+
 @app.route('/v1/digest', methods=['GET'])
 @require_auth
 def get_digest():
@@ -1509,7 +1933,10 @@ def get_digest():
     
     # Get recommendations using new engine with fallback chain
     try:
-        items, sources = get_recommendations(user_id, prefs)
+        meta = {}
+        deadline = _request_deadline()
+        items, sources = get_recommendations(user_id, prefs, deadline=deadline, meta=meta)
+        register_served_items(user_id, items)
         
         elapsed_ms = int((_time.time() - _request_start) * 1000)
         response_data = {
@@ -1517,7 +1944,11 @@ def get_digest():
             "generated_at": datetime.now().isoformat(),
             "items": items,
             "sources": sources,  # Show which sources were used
-            "from_cache": 'cache' in sources,
+            "from_cache": 'cache' in sources or 'stale_cache' in sources,
+            "degraded": meta['degraded'],
+            "degraded_reason": meta.get('degraded_reason'),
+            "latency_budget_ms": int(deadline.budget * 1000) if deadline else None,
+            "stages_cut": list(meta['stages_cut']),
             "response_time_ms": elapsed_ms
         }
         
@@ -1660,164 +2091,20 @@ def get_place_details(place_id):
 
 
 def calculate_distance(lat1, lng1, lat2, lng2):
-    """Calculate distance between two points in miles (using Haversine formula)"""
-    import math
-    
-    R = 3959  # Earth's radius in miles
-    
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lng = math.radians(lng2 - lng1)
-    
-    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lng/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    
-    return R * c
-
+    """Calculate distance between two points in miles (Haversine, see distance.py)"""
+    return distance.haversine_miles(lat1, lng1, lat2, lng2)
 
-_nominatim_rate_limited = False  # Skip Nominatim when rate-limited
 
-def geocode_to_lat_lng(query):
-    """Resolve ZIP code or address to lat/lng using OpenStreetMap Nominatim (no API key)."""
-    global _nominatim_rate_limited
-    import re
-    query = (query or "").strip()
-    if not query:
-        return None
-    # Detect raw lat/lng coordinates (e.g. "37.7922, -122.4583")
-    coord_match = re.match(r'^(-?\d+\.\d+)\s*,\s*(-?\d+\.\d+)$', query)
-    if coord_match:
-        lat, lng = float(coord_match.group(1)), float(coord_match.group(2))
-        if -90 <= lat <= 90 and -180 <= lng <= 180:
-            print(f"[GEOCODE] Detected coordinates: ({lat}, {lng})")
-            geocode_cache[query.lower()] = (lat, lng)
-            return (lat, lng)
-
-    cache_key = query.lower()
-    if cache_key in geocode_cache:
-        cached = geocode_cache[cache_key]
-        print(f"[GEOCODE] Cache hit for '{query}' -> {cached}")
-        return cached
-    try:
-        # Determine the search query
-        if query.isdigit() and len(query) == 5:
-            # US ZIP code
-            q = f"{query}, USA"
-        elif re.search(r',\s*[A-Z]{2}\s*(\d{5})?$', query.upper()):
-            # Has US state abbreviation (e.g., "Palo Alto, CA" or "123 Main St, City, CA 94301")
-            # Append USA for better results
-            q = f"{query}, USA"
-        else:
-            q = query
-        
-        # Fast path: common Bay Area cities (avoids Nominatim entirely)
-        _KNOWN_LOCATIONS = {
-            "san francisco": (37.7749, -122.4194),
-            "san francisco, california": (37.7749, -122.4194),
-            "san francisco, ca": (37.7749, -122.4194),
-            "sf": (37.7749, -122.4194),
-            "sf, ca": (37.7749, -122.4194),
-            "oakland": (37.8044, -122.2712),
-            "oakland, ca": (37.8044, -122.2712),
-            "berkeley": (37.8716, -122.2727),
-            "berkeley, ca": (37.8716, -122.2727),
-            "fremont": (37.5485, -121.9886),
-            "fremont, ca": (37.5485, -121.9886),
-            "newark": (37.5316, -122.0392),
-            "newark, ca": (37.5316, -122.0392),
-            "san jose": (37.3382, -121.8863),
-            "san jose, ca": (37.3382, -121.8863),
-            "palo alto": (37.4419, -122.1430),
-            "palo alto, ca": (37.4419, -122.1430),
-            "mountain view": (37.3861, -122.0839),
-            "mountain view, ca": (37.3861, -122.0839),
-            "sunnyvale": (37.3688, -122.0363),
-            "sunnyvale, ca": (37.3688, -122.0363),
-            "hayward": (37.6688, -122.0808),
-            "hayward, ca": (37.6688, -122.0808),
-            "union city": (37.5934, -122.0438),
-            "union city, ca": (37.5934, -122.0438),
-            "castro valley": (37.6941, -122.0864),
-            "castro valley, ca": (37.6941, -122.0864),
-            "pleasanton": (37.6624, -121.8747),
-            "pleasanton, ca": (37.6624, -121.8747),
-            "livermore": (37.6819, -121.7680),
-            "livermore, ca": (37.6819, -121.7680),
-            "dublin": (37.7022, -121.9358),
-            "dublin, ca": (37.7022, -121.9358),
-            "san mateo": (37.5630, -122.3255),
-            "san mateo, ca": (37.5630, -122.3255),
-            "redwood city": (37.4852, -122.2364),
-            "redwood city, ca": (37.4852, -122.2364),
-            "santa clara": (37.3541, -121.9552),
-            "santa clara, ca": (37.3541, -121.9552),
-            "cupertino": (37.3230, -122.0322),
-            "cupertino, ca": (37.3230, -122.0322),
-            "milpitas": (37.4323, -121.8996),
-            "milpitas, ca": (37.4323, -121.8996),
-            "san leandro": (37.7249, -122.1561),
-            "san leandro, ca": (37.7249, -122.1561),
-            "walnut creek": (37.9101, -122.0652),
-            "walnut creek, ca": (37.9101, -122.0652),
-            "concord": (37.9780, -122.0311),
-            "concord, ca": (37.9780, -122.0311),
-            "richmond": (37.9358, -122.3478),
-            "richmond, ca": (37.9358, -122.3478),
-            "daly city": (37.6879, -122.4702),
-            "daly city, ca": (37.6879, -122.4702),
-            "south san francisco": (37.6547, -122.4077),
-            "south san francisco, ca": (37.6547, -122.4077),
-            "alameda": (37.7652, -122.2416),
-            "alameda, ca": (37.7652, -122.2416),
-            "kensington": (37.9107, -122.2802),
-            "kensington, ca": (37.9107, -122.2802),
-            "emeryville": (37.8313, -122.2852),
-            "emeryville, ca": (37.8313, -122.2852),
-            "east bay": (37.7749, -122.2000),
-            "east bay, ca": (37.7749, -122.2000),
-            "bay area": (37.6000, -122.1000),
-        }
-        known_key = cache_key.replace(", usa", "").replace(",usa", "").strip()
-        if known_key in _KNOWN_LOCATIONS:
-            result = _KNOWN_LOCATIONS[known_key]
-            geocode_cache[cache_key] = result
-            print(f"[GEOCODE] Known location: '{query}' -> {result}")
-            return result
-
-        if _nominatim_rate_limited:
-            print(f"[GEOCODE] Skipping Nominatim (rate-limited) for '{q}'")
-            geocode_cache[cache_key] = None
-            return None
-
-        print(f"[GEOCODE] Searching for: '{q}'")
-        url = "https://nominatim.openstreetmap.org/search"
-        r = requests.get(url, params={"q": q, "format": "json", "limit": 1}, headers={"User-Agent": "ActivityPlanner/1.0"}, timeout=4)
-        
-        if r.status_code == 429:
-            print(f"[GEOCODE] Rate limited for '{q}' - skipping Nominatim for remaining items")
-            _nominatim_rate_limited = True
-            geocode_cache[cache_key] = None
-            return None
-        if r.status_code != 200:
-            print(f"[GEOCODE] HTTP {r.status_code} for '{q}'")
-            geocode_cache[cache_key] = None
-            return None
-        
-        data = r.json()
-        if not data:
-            print(f"[GEOCODE] No results for '{q}'")
-            geocode_cache[cache_key] = None
-            return None
-        
-        lat = float(data[0]["lat"])
-        lng = float(data[0]["lon"])
-        geocode_cache[cache_key] = (lat, lng)
-        print(f"[GEOCODE] Found: '{q}' -> ({lat}, {lng})")
-        return (lat, lng)
-    except Exception as e:
-        print(f"[GEOCODE] Error for '{query}': {e}")
-        return None
+def geocode_to_lat_lng(query, network=True):
+    """
+    Resolve ZIP code or address to lat/lng: the offline gazetteer for ZIPs and place names,
+    OpenStreetMap Nominatim (no API key, via the shared scheduler in nominatim.py) for
+    street addresses and strings it doesn't know. Nominatim answers go to the shared
+    geocode cache (geocoding.py); "no results" is cached for GEOCODE_NEGATIVE_TTL_SECONDS,
+    throttling and HTTP errors are not cached at all.
+    network=False answers from the gazetteer and cache only (None otherwise, not cached).
+    """
+    return geocoding.geocode(query, network=network)
 
 
 def resolve_user_location(location):
@@ -1843,11 +2130,9 @@ def resolve_user_location(location):
     return (37.7749, -122.4194)
 
 
-def estimate_travel_time_minutes(distance_miles, avg_mph=25):
+def estimate_travel_time_minutes(distance_miles, avg_mph=AVG_SPEED_MPH):
     """Estimate travel time in minutes from distance (miles)."""
-    if distance_miles <= 0:
-        return 5
-    return max(5, int(round((distance_miles / avg_mph) * 60)))
+    return distance.travel_minutes(distance_miles, avg_mph)
 
 
 _EXCLUDED_PLACE_TYPES = {
@@ -1867,8 +2152,18 @@ def _is_excluded_place(place):
     return bool(types & _EXCLUDED_PLACE_TYPES)
 
 
-def convert_google_place_to_item(place, user_location, index):
-    """Convert Google Places API result to our recommendation format"""
+def _google_place_distances(places, user_location):
+    """(distances, travel minutes) from the user to each Google Places result, as one batch."""
+    locations = [(p.get('geometry', {}).get('location', {})) for p in places]
+    return distance.measure(user_location.get('lat', 37.7749), user_location.get('lng', -122.4194),
+                            [loc.get('lat', 0) for loc in locations], [loc.get('lng', 0) for loc in locations])
+
+
+def convert_google_place_to_item(place, user_location, index, measured=None):
+    """
+    Convert Google Places API result to our recommendation format. measured: optional
+    (distance, travel minutes) from _google_place_distances, computed here otherwise.
+    """
     
     # Extract location
     geometry = place.get('geometry', {})
@@ -1877,10 +2172,12 @@ def convert_google_place_to_item(place, user_location, index):
     place_lng = location.get('lng', 0)
     
     # Calculate distance and travel time from user location (must have lat/lng)
-    user_lat = user_location.get('lat', 37.7749)
-    user_lng = user_location.get('lng', -122.4194)
-    distance = calculate_distance(user_lat, user_lng, place_lat, place_lng)
-    travel_time = estimate_travel_time_minutes(distance)
+    if measured is None:
+        user_lat = user_location.get('lat', 37.7749)
+        user_lng = user_location.get('lng', -122.4194)
+        dist = calculate_distance(user_lat, user_lng, place_lat, place_lng)
+        measured = (dist, estimate_travel_time_minutes(dist))
+    distance_miles, travel_time = measured
     
     # Get price level
     price_level = place.get('price_level', 1)
@@ -1918,18 +2215,20 @@ def convert_google_place_to_item(place, user_location, index):
     week = f"{now.year}-{now.isocalendar()[1]:02d}"
     
     return {
-        "rec_id": f"gp_{week}_{index}",
+        "rec_id": f"gp_{week}_{place.get('place_id') or index}",
         "type": "place",
         "place_id": place.get('place_id', ''),
         "title": place.get('name', 'Unknown Place'),
         "category": category,
-        "distance_miles": round(distance, 1),
+        "distance_miles": round(distance_miles, 1),
         "travel_time_min": travel_time,
         "price_flag": price_flag,
         "kid_friendly": kid_friendly,
         "indoor_outdoor": indoor_outdoor,
         "explanation": f"Highly rated {category} spot nearby",
         "source_url": f"https://maps.google.com/?q={place_lat},{place_lng}",
+        "lat": place_lat,
+        "lng": place_lng,
         "address": place.get('vicinity', place.get('formatted_address', '')),
         "rating": place.get('rating', 4.0),
         "total_ratings": place.get('user_ratings_total', 0),
@@ -1957,10 +2256,11 @@ def search_places():
     for category in categories:
         places = search_google_places(location, category, radius)
         if places:
+            dists, travels = _google_place_distances(places[:8], location)
             for i, place in enumerate(places[:8]):  # Limit to 5 per category after filtering
                 if _is_excluded_place(place):
                     continue
-                item = convert_google_place_to_item(place, location, len(all_places))
+                item = convert_google_place_to_item(place, location, len(all_places), (dists[i], travels[i]))
                 all_places.append(item)
                 if sum(1 for p in all_places if p.get('category') == item.get('category')) >= 5:
                     break
@@ -2046,7 +2346,10 @@ def get_ai_recommendations():
     
     try:
         # Use the same recommendation engine with fallback chain
-        items, sources = get_recommendations(user_id, prefs)
+        meta = {}
+        deadline = _request_deadline(data)
+        items, sources = get_recommendations(user_id, prefs, deadline=deadline, meta=meta)
+        register_served_items(user_id, items)
         
         elapsed_ms = int((_time.time() - _request_start) * 1000)
         response_data = {
@@ -2055,7 +2358,11 @@ def get_ai_recommendations():
             "ai_powered": True,
             "sources": sources,
             "items": items,
-            "from_cache": 'cache' in sources,
+            "from_cache": 'cache' in sources or 'stale_cache' in sources,
+            "degraded": meta['degraded'],
+            "degraded_reason": meta.get('degraded_reason'),
+            "latency_budget_ms": int(deadline.budget * 1000) if deadline else None,
+            "stages_cut": list(meta['stages_cut']),
             "response_time_ms": elapsed_ms
         }
         
@@ -2090,53 +2397,45 @@ def submit_feedback():
     if not rec_id or not action:
         return jsonify({"error": "Missing rec_id or action"}), 400
     
-    # Find place_id from recommendation if not provided
-    if not place_id:
-        for rec in db.get_recent_recommendations_list(user_id):
-            if rec['rec_id'] == rec_id:
-                place_id = rec['place_id']
-                break
+    # Find place_id/category from the served recommendation if not provided
+    served = None if place_id and data.get('category') else get_served_item(user_id, rec_id)
+    if not place_id and served:
+        place_id = served.get('place_id')
     
     # Handle thumbs up/down feedback
     if action in ("thumbs_up", "thumbs_down") and place_id:
         # Get category from the recommendation item
-        category = data.get('category')
-        if not category:
-            # Try to find from current digest
-            for rec in db.get_recent_recommendations_list(user_id):
-                if rec['rec_id'] == rec_id:
-                    category = _get_category_for_place(user_id, rec['place_id'])
-                    break
-        db.add_feedback(user_id, place_id, action, rec_id=rec_id, category=category)
+        category = data.get('category') or _category_for_interaction(user_id, place_id, served)
+        write_queue.enqueue('add_feedback', user_id, place_id, action, rec_id=rec_id, category=category)
         print(f"[FEEDBACK] User {user_id} gave {action} to {place_id} (category: {category})")
         return jsonify({"status": "recorded", "action": action})
 
     # Handle remove thumbs feedback
     if action == "remove_feedback" and place_id:
-        db.remove_feedback(user_id, place_id)
+        write_queue.enqueue('remove_feedback', user_id, place_id)
         print(f"[FEEDBACK] User {user_id} removed feedback for {place_id}")
         return jsonify({"status": "recorded", "action": action})
 
     # Handle "already_been" action - add to visited list
     if action == "already_been" and place_id:
-        if not db.visited_contains(user_id, place_id):
-            db.add_visited(user_id, place_id, signal_type="manual", confidence=1.0)
-            print(f"[FEEDBACK] User {user_id} marked {place_id} as been")
+        category = data.get('category') or _category_for_interaction(user_id, place_id, served)
+        write_queue.enqueue('ensure_visited', user_id, place_id, signal_type="manual", confidence=1.0, category=category)
+        print(f"[FEEDBACK] User {user_id} marked {place_id} as been")
     
     # Handle "unbeen" action - remove from visited list
     elif action == "unbeen" and place_id:
-        db.remove_visited(user_id, place_id)
+        write_queue.enqueue('remove_visited', user_id, place_id)
         print(f"[FEEDBACK] User {user_id} unmarked {place_id} as been")
     
     # Handle "favorite" action - add to saved list
     elif action == "favorite" and place_id:
-        if not db.saved_contains(user_id, place_id):
-            db.add_saved(user_id, place_id)
-            print(f"[FEEDBACK] User {user_id} saved {place_id}")
+        category = data.get('category') or _category_for_interaction(user_id, place_id, served)
+        write_queue.enqueue('ensure_saved', user_id, place_id, category=category)
+        print(f"[FEEDBACK] User {user_id} saved {place_id}")
     
     # Handle "unsave" action - remove from saved list
     elif action == "unsave" and place_id:
-        db.remove_saved(user_id, place_id)
+        write_queue.enqueue('remove_saved', user_id, place_id)
         print(f"[FEEDBACK] User {user_id} unsaved {place_id}")
     
     return jsonify({"status": "recorded", "action": action})
@@ -2154,10 +2453,10 @@ def track_click():
     if not place_id:
         return jsonify({"error": "Missing place_id"}), 400
     
-    category = _get_category_for_place(user_id, place_id)
+    category = data.get('category') or _category_for_interaction(user_id, place_id, get_served_item(user_id, rec_id))
     
-    # Store click in database using the existing db function
-    db.add_click(user_id, place_id, rec_id=rec_id, category=category)
+    # Buffered: committed with other clicks by the write-behind flusher
+    write_queue.enqueue('add_click', user_id, place_id, rec_id=rec_id, category=category)
     
     print(f"[CLICK_TRACKING] User {user_id} clicked on {place_id} (category: {category})")
     
@@ -2169,6 +2468,7 @@ def track_click():
 def get_user_affinity():
     """Get user's learned category preferences/affinities"""
     user_id = get_user_id()
+    write_queue.flush_user(user_id)
     
     # Get affinity scores
     affinity_scores = get_user_affinity_scores(user_id)
@@ -2209,8 +2509,10 @@ def reset_user_affinity():
     """Reset user's learned preferences (clear interaction history)"""
     user_id = get_user_id()
     
-    # Clear the affinity cache
-    db.invalidate_affinity_cache(user_id)
+    # Recompute the counters from the interaction tables
+    write_queue.flush_user(user_id)
+    db.rebuild_category_affinity(user_id)
+    write_queue.note_interaction(user_id)
     
     print(f"[AFFINITY] Reset affinity scores for user {user_id}")
     
@@ -2219,41 +2521,51 @@ def reset_user_affinity():
 
 # ========== VISITED HISTORY ==========
 
-def get_place_details_by_id(place_id):
-    """Helper to get place details from mock data by place_id"""
-    for place in MOCK_PLACES:
-        if place.get('place_id') == place_id:
-            return {
-                "place_id": place_id,
-                "title": place.get('name', 'Unknown Place'),
-                "category": place.get('category', 'general'),
-                "address": place.get('address', ''),
-                "photo_url": place.get('photo_url', ''),
-                "google_maps_url": place.get('google_maps_url', ''),
-                "rating": place.get('rating', 0),
-                "total_ratings": place.get('total_ratings', 0),
-                "price_level": place.get('price_level', 1)
-            }
-    # Return basic info if not found in mock data
+def _place_details(place_id, place):
+    """Detail view for a mock place or place catalog row; title-cased id if unknown."""
+    if place is None:
+        return {
+            "place_id": place_id,
+            "title": place_id.replace('_', ' ').title(),
+            "category": "general"
+        }
     return {
         "place_id": place_id,
-        "title": place_id.replace('_', ' ').title(),
-        "category": "general"
+        "title": place.get('name') or place.get('title') or 'Unknown Place',
+        "category": place.get('category') or 'general',
+        "address": place.get('address') or '',
+        "photo_url": place.get('photo_url') or '',
+        "google_maps_url": place.get('google_maps_url') or place.get('source_url') or '',
+        "rating": place.get('rating') or 0,
+        "total_ratings": place.get('total_ratings') or 0,
+        "price_level": place.get('price_level', 1)
     }
 
+
+def get_places_details_by_id(place_ids):
+    """Batch version of get_place_details_by_id: {place_id: details}, one catalog lookup."""
+    catalog = place_catalog.get_many([pid for pid in place_ids if pid not in MOCK_PLACES_BY_ID])
+    return {pid: _place_details(pid, MOCK_PLACES_BY_ID.get(pid) or catalog.get(pid)) for pid in place_ids}
+
+
+def get_place_details_by_id(place_id):
+    """Helper to get place details from mock data or the place catalog by place_id"""
+    return get_places_details_by_id([place_id])[place_id]
+
 @app.route('/v1/visited', methods=['GET'])
 @require_auth
 def get_visited():
     """Get visited places with full details"""
     user_id = get_user_id()
+    write_queue.flush_user(user_id)
     visited = db.get_visited_list(user_id)
     
     # Enrich with place details
+    details = get_places_details_by_id([v['place_id'] for v in visited])
     enriched = []
     for v in visited:
-        place_details = get_place_details_by_id(v['place_id'])
         enriched.append({
-            **place_details,
+            **details[v['place_id']],
             "visited_at": v.get('visited_at'),
             "signal_type": v.get('signal_type', 'manual')
         })
@@ -2271,11 +2583,12 @@ def add_visited():
     if not place_id:
         return jsonify({"error": "Missing place_id"}), 400
     
-    db.add_visited(
-        user_id, place_id,
+    write_queue.enqueue(
+        'add_visited', user_id, place_id,
         visited_at=data.get('visited_at', datetime.now().isoformat()),
         signal_type=data.get('signal_type', 'manual'),
-        confidence=data.get('confidence', 1.0)
+        confidence=data.get('confidence', 1.0),
+        category=data.get('category') or _get_category_for_place(user_id, place_id)
     )
     return jsonify({"status": "added"})
 
@@ -2284,7 +2597,7 @@ def add_visited():
 def remove_visited(place_id):
     """Remove a visited place"""
     user_id = get_user_id()
-    db.remove_visited(user_id, place_id)
+    write_queue.enqueue('remove_visited', user_id, place_id)
     return jsonify({"status": "removed"})
 
 # ========== SAVED PLACES ==========
@@ -2294,14 +2607,15 @@ def remove_visited(place_id):
 def get_saved():
     """Get saved/favorited places with full details"""
     user_id = get_user_id()
+    write_queue.flush_user(user_id)
     saved = db.get_saved_list(user_id)
     
     # Enrich with place details
+    details = get_places_details_by_id([s['place_id'] for s in saved])
     enriched = []
     for s in saved:
-        place_details = get_place_details_by_id(s['place_id'])
         enriched.append({
-            **place_details,
+            **details[s['place_id']],
             "saved_at": s.get('saved_at')
         })
     
@@ -2312,7 +2626,7 @@ def get_saved():
 def remove_saved(place_id):
     """Remove a saved place"""
     user_id = get_user_id()
-    db.remove_saved(user_id, place_id)
+    write_queue.enqueue('remove_saved', user_id, place_id)
     return jsonify({"status": "removed"})
 
 # ========== CALENDAR HELPERS ==========
@@ -2327,16 +2641,13 @@ def get_event_template():
     slot = data.get('slot', 'SAT_AM')
     timezone = data.get('timezone', 'America/Los_Angeles')
     
-    # Find the recommendation
-    place = None
-    for p in MOCK_PLACES:
-        # In real implementation, look up by rec_id
-        if rec_id:
-            place = p  # Simplified: use first match
-            break
-    
+    # Find the recommendation that was served under this rec_id
+    place = get_served_item(user_id, rec_id)
     if not place:
         return jsonify({"error": "Recommendation not found"}), 404
+    if not place.get('title') and place.get('place_id'):
+        # recent_recommendations fallback only knows the place_id
+        place = {**get_place_details_by_id(place['place_id']), **place}
     
     # Calculate time based on slot
     now = datetime.now()
@@ -2366,8 +2677,13 @@ def get_event_template():
         start_time = saturday.replace(hour=10, minute=0)
         end_time = saturday.replace(hour=12, minute=0)
     
+    title = place.get('title') or place.get('name') or 'Activity'
+    if place.get('distance_miles') is not None:
+        distance = f"{place['distance_miles']} miles ({place.get('travel_time_min')} min)"
+    else:
+        distance = place.get('distance_display') or 'n/a'
     event = {
-        "summary": f"{place['name']} — Activity Plan",
+        "summary": f"{title} — Activity Plan",
         "start": {
             "dateTime": start_time.isoformat(),
             "timeZone": timezone
@@ -2376,13 +2692,13 @@ def get_event_template():
             "dateTime": end_time.isoformat(),
             "timeZone": timezone
         },
-        "location": place['address'],
-        "description": f"{place['name']} - {place.get('category', 'activity')}\n\n"
+        "location": place.get('address', ''),
+        "description": f"{title} - {place.get('category', 'activity')}\n\n"
                       f"Recommended because: {place.get('explanation', 'Recommended activity')}\n"
-                      f"Distance: {place['distance_miles']} miles ({place['travel_time_min']} min)\n"
-                      f"Price: {place['price_flag']}\n"
+                      f"Distance: {distance}\n"
+                      f"Price: {place.get('price_flag', 'n/a')}\n"
                       f"Kid-friendly: {'Yes' if place.get('kid_friendly') else 'No'}\n\n"
-                      f"View on map: {place.get('source_url', '')}"
+                      f"View on map: {place.get('source_url') or place.get('google_maps_url', '')}"
     }
     
     return jsonify(event)
@@ -2501,20 +2817,30 @@ def _is_free(item):
     return price in ('free', '$0', '')
 
 
-def get_weekend_digest_items(user_lat, user_lng, preferences, max_items=5):
-    """Smart selection of digest items with diversity constraints."""
-    from local_feeds import get_local_feed_recommendations
+# Local-feed events the weekend digest selects from
+DIGEST_FEED_ITEMS = 10
 
-    # Fetch more than needed for selection
-    all_items = get_local_feed_recommendations(
-        profile=preferences,
-        user_lat=user_lat,
-        user_lng=user_lng,
-        geocode_fn=geocode_to_lat_lng,
-        max_items=10
-    )
-    if not all_items:
-        return []
+
+def get_weekend_digest_items(user_lat, user_lng, preferences, max_items=5, candidates=None):
+    """Smart selection of digest items with diversity constraints.
+    candidates: local-feed items to select from (e.g. taken from a pre-warmed candidate pool)
+    instead of fetching local feeds."""
+    if candidates:
+        all_items = list(candidates)
+    else:
+        from local_feeds import get_local_feed_recommendations
+
+        # Fetch more than needed for selection
+        all_items = get_local_feed_recommendations(
+            profile=preferences,
+            user_lat=user_lat,
+            user_lng=user_lng,
+            geocode_fn=geocode_to_lat_lng,
+            max_items=DIGEST_FEED_ITEMS
+        )
+        if not all_items:
+            return []
+        place_catalog.remember(all_items)
 
     sat, sun, _ = _weekend_date_range()
     today = datetime.now().date()
@@ -2851,43 +3177,72 @@ You're receiving this because you signed up for Activity Planner digests.
         return False
 
 
+def _send_friday_digest_to_user(user):
+    """Build and send one user's Friday digest. Returns (sent, used_warm_entry)."""
+    user_id = user.get('id')
+    email = user.get('email')
+    name = user.get('name', '')
+    preferences = user.get('preferences', {})
+    
+    if not email or not preferences:
+        return False, False
+    
+    # Get personalized recommendations - use default location if not set
+    user_location = preferences.get('location') or {}
+    user_lat = user_location.get('lat') or 37.5485  # Default: Fremont, CA
+    user_lng = user_location.get('lng') or -121.9886
+    
+    # The digest is built from local-feed events only; a pre-warmed entry's candidate pool
+    # already holds them (lf_ rec_ids, in local_feeds' ranking order), so no refetch is needed
+    cached = _warm_cache.peek(_get_warm_cache_key(user_id, preferences))
+    candidates = None
+    if cached and (datetime.now() - cached['timestamp']).total_seconds() < WARM_CACHE_STALE_SECONDS:
+        candidates = [item for item in cached.get('candidates') or []
+                      if str(item.get('rec_id', '')).startswith('lf_')][:DIGEST_FEED_ITEMS] or None
+    
+    recommendations = get_weekend_digest_items(
+        user_lat=user_lat,
+        user_lng=user_lng,
+        preferences=preferences,
+        max_items=5,
+        candidates=candidates
+    )
+    
+    sent = False
+    if recommendations:
+        register_served_items(user_id, recommendations)
+        sent = bool(send_friday_digest_email(email, name, recommendations, FRONTEND_URL))
+    return sent, candidates is not None
+
+
 def send_all_friday_digests():
-    """Send Friday digest emails to all users with preferences. Returns count of emails sent."""
+    """Send Friday digest emails to all users with preferences. Returns count of emails sent.
+    Users are processed in parallel on the digest lane of the shared job executor."""
     users = db.get_all_users_with_preferences()
     sent_count = 0
+    warm_used = 0
+    # The warming scheduler pre-warms digest users shortly before the cron run; in a
+    # separate cron process those entries arrive via the cache snapshot
+    cache_snapshot.wait_restored(timeout=10)
     
     print(f"[DIGEST] Starting Friday digest for {len(users)} users")
     
+    pending = []
     for user in users:
         try:
-            user_id = user.get('id')
-            email = user.get('email')
-            name = user.get('name', '')
-            preferences = user.get('preferences', {})
-            
-            if not email or not preferences:
-                continue
-            
-            # Get personalized recommendations - use default location if not set
-            user_location = preferences.get('location') or {}
-            user_lat = user_location.get('lat') or 37.5485  # Default: Fremont, CA
-            user_lng = user_location.get('lng') or -121.9886
-            
-            recommendations = get_weekend_digest_items(
-                user_lat=user_lat,
-                user_lng=user_lng,
-                preferences=preferences,
-                max_items=5
-            )
-            
-            if recommendations:
-                if send_friday_digest_email(email, name, recommendations, FRONTEND_URL):
-                    sent_count += 1
-                    
+            pending.append((user, jobs.submit('digest', _send_friday_digest_to_user, user)))
+        except LaneFull:
+            pending.append((user, None))  # lane saturated: do this one inline
+    
+    for user, fut in pending:
+        try:
+            sent, warm = fut.result() if fut is not None else _send_friday_digest_to_user(user)
+            sent_count += int(sent)
+            warm_used += int(warm)
         except Exception as e:
             print(f"[DIGEST] Error processing user {user.get('email', 'unknown')}: {e}")
     
-    print(f"[DIGEST] Completed. Sent {sent_count} digest emails.")
+    print(f"[DIGEST] Completed. Sent {sent_count} digest emails ({warm_used} from pre-warmed recommendations).")
     return sent_count
 
 
@@ -3000,6 +3355,7 @@ def digest_preview():
         user_lat, user_lng = 37.5485, -121.9886
 
     items = get_weekend_digest_items(user_lat, user_lng, prefs, max_items=5)
+    register_served_items(user_id, items)
 
     if fmt == 'telegram':
         text = format_digest_telegram(items, user_lat, user_lng)
@@ -3046,6 +3402,7 @@ def digest_send():
     items = get_weekend_digest_items(user_lat, user_lng, prefs, max_items=5)
     if not items:
         return jsonify({'error': 'No recommendations available'}), 404
+    register_served_items(user_id, items)
 
     results = {}
     user_info = db.get_user(user_id) if hasattr(db, 'get_user') else {}
@@ -3782,6 +4139,7 @@ def send_test_digest():
         geocode_fn=geocode_to_lat_lng,
         max_items=5
     )
+    place_catalog.remember(recommendations)
     
     if not recommendations:
         return jsonify({"error": "No recommendations available"}), 400
@@ -3863,6 +4221,25 @@ def api_status():
             "circuit_open": is_circuit_open(source)
         }
     
+    status["write_behind"] = write_queue.get_metrics()
+    status["place_catalog"] = place_catalog.get_metrics()
+    status["warm_cache"] = _warm_cache.stats()
+    status["single_flight"] = _recs_flight.stats()
+    status["cache_snapshot"] = cache_snapshot.get_metrics()
+    status["warming"] = _warming.stats()
+    status["executors"] = concurrency.get_metrics()
+    status["live_fetch_limiter"] = _live_limiter.stats()
+    status["gazetteer"] = gazetteer.get_metrics()
+    status["geocode_cache"] = geocoding.get_metrics()
+    status["nominatim"] = nominatim.get_metrics()
+    status["candidate_pool"] = {
+        **_candidate_pool.stats(),
+        'ttl_seconds': CANDIDATE_POOL_TTL_SECONDS,
+        'cell_deg': CANDIDATE_POOL_CELL_DEG,
+        'upstream': _pool_flight.stats(),
+    }
+    status["cache_janitor"] = dict(_janitor_stats, interval_seconds=CACHE_JANITOR_INTERVAL_SECONDS)
+    
     return jsonify(status)
 
 
@@ -3871,6 +4248,7 @@ def api_status():
 def get_interest_profile():
     """Get learned user interest profile (affinity scores)."""
     user_id = get_user_id()
+    write_queue.flush_user(user_id)
     affinity = get_user_affinity_scores(user_id)
 
     # Get raw signal counts for transparency
@@ -3900,13 +4278,13 @@ def get_interest_profile():
 def reset_interest_profile():
     """Reset user's learned preferences."""
     user_id = get_user_id()
-    db.invalidate_affinity_cache(user_id)
+    write_queue.flush_user(user_id)  # queued clicks/feedback must not land after the reset
     # Optionally clear all feedback
     clear_feedback = (request.json or {}).get('clear_feedback', False)
     if clear_feedback:
-        with db.get_conn() as c:
-            c.execute("DELETE FROM feedback WHERE user_id = ?", (user_id,))
-            c.execute("DELETE FROM click_tracking WHERE user_id = ?", (user_id,))
+        db.clear_feedback_and_clicks(user_id)
+    else:
+        db.rebuild_category_affinity(user_id)
     return jsonify({"status": "reset"})
 
 
@@ -3915,6 +4293,7 @@ def reset_interest_profile():
 def get_feedback_status():
     """Get feedback status for all items in current digest (for UI state)."""
     user_id = get_user_id()
+    write_queue.flush_user(user_id)
     feedback = db.get_all_feedback(user_id)
     result = {f['place_id']: f['feedback_type'] for f in feedback}
     return jsonify({"feedback": result})
@@ -3925,56 +4304,180 @@ def health_check():
     """Health check endpoint"""
     return jsonify({"status": "ok", "service": "activity-planner-api"})
 
+def _warming_users():
+    """Users for the warming scheduler, plus demo_user (default prefs, served to guests)."""
+    users = db.get_users_for_warming()
+    demo_prefs = {
+        'home_location': {'type': 'city', 'value': 'San Francisco, CA'},
+        'categories': ['parks', 'museums', 'attractions'],
+        'kid_friendly': True,
+        'travel_time_ranges': ['15-30'],
+    }
+    users.append({'id': 'demo_user', 'preferences': demo_prefs,
+                  'last_active': datetime.now().isoformat(), 'email_digest': False})
+    return users
+
+
+def _warm_entry_age(user_id, prefs):
+    cached = _warm_cache.peek(_get_warm_cache_key(user_id, prefs))
+    if not cached:
+        return None
+    return (datetime.now() - cached['timestamp']).total_seconds()
+
+
+def _warm_user(user_id, prefs):
+    cache_key = _get_warm_cache_key(user_id, prefs)
+    items, _ = _recs_flight.do(cache_key, lambda: _fetch_and_cache(user_id, prefs, cache_key))
+    return items
+
+
+_warming = WarmingScheduler(
+    _warming_users, _warm_entry_age, _warm_user,
+    fresh_seconds=WARM_CACHE_FRESH_SECONDS, stale_seconds=WARM_CACHE_STALE_SECONDS,
+    executor=jobs.executor('warming'),
+)
+
+
 def _warm_cache_on_startup():
-    """Pre-fetch recommendations for known users on startup (background thread)."""
-    import threading
-    import time
+    """Start the cache warming scheduler (via the warming lane, see warming.py)."""
+    def _start():
+        # Entries restored from the last snapshot don't need a live fetch
+        cache_snapshot.wait_restored(timeout=10)
+        _warming.start(initial_delay=2)  # Let the server start first
     
-    def _do_warm():
-        time.sleep(2)  # Let the server start first
-        try:
-            users_with_prefs = db.get_all_users_with_preferences()
-            # Always include demo user with default prefs for guests
-            demo_prefs = {
-                'home_location': {'type': 'city', 'value': 'San Francisco, CA'},
-                'categories': ['parks', 'museums', 'attractions'],
-                'kid_friendly': True,
-                'travel_time_ranges': ['15-30'],
-            }
-            users_with_prefs.append({'id': 'demo_user', 'preferences': demo_prefs})
-            
-            for user in users_with_prefs[:3]:  # Warm top 3 users max
-                user_id = user.get('id', 'demo_user')
-                prefs = user.get('preferences', {})
-                if not prefs:
-                    continue
-                cache_key = _get_warm_cache_key(user_id, prefs)
-                if cache_key in _warm_cache:
-                    continue
-                print(f"[WARM_CACHE] Pre-warming for user {user_id}...")
-                try:
-                    items, sources = _fetch_recommendations_live(user_id, prefs, cache_key)
-                    if items:
-                        _warm_cache[cache_key] = {
-                            'items': items,
-                            'sources': sources,
-                            'timestamp': datetime.now()
-                        }
-                        print(f"[WARM_CACHE] Warmed {len(items)} items for {user_id}")
-                except Exception as e:
-                    print(f"[WARM_CACHE] Error warming for {user_id}: {e}")
-        except Exception as e:
-            print(f"[WARM_CACHE] Startup warming error: {e}")
-    
-    t = threading.Thread(target=_do_warm, daemon=True)
-    t.start()
+    jobs.submit('warming', _start)
     print("[WARM_CACHE] Background cache warming started")
 
 
+# ========== CACHE SNAPSHOTS ==========
+# In-memory caches survive restarts via cache_snapshot (periodic + at-exit save,
+# background restore that drops anything past its TTL). Dict caches without their own
+# timestamps are stamped the first time a snapshot sees them.
+import cache_snapshot
+
+NEGATIVE_SNAPSHOT_TTL_SECONDS = int(os.environ.get('NEGATIVE_SNAPSHOT_TTL_SECONDS', '21600'))
+IMAGE_SNAPSHOT_TTL_SECONDS = int(os.environ.get('IMAGE_SNAPSHOT_TTL_SECONDS', '86400'))
+_snapshot_stamps = {'images': {}}
+
+
+def _dump_stamped(cache, stamps):
+    import time
+    now = time.time()
+    for key, value in list(cache.items()):
+        yield key, value, stamps.setdefault(key, now)
+
+
+def _load_stamped(cache, stamps):
+    def _load(key, value, ts):
+        if key in cache:
+            return False
+        cache[key] = value
+        stamps[key] = ts
+        return True
+    return _load
+
+
+def _dump_timestamped(cache):
+    for key, value in list(cache.items()):
+        ts = value.get('timestamp') if isinstance(value, dict) else None
+        yield key, value, ts.timestamp() if ts else None
+
+
+def _load_missing(cache):
+    def _load(key, value, ts):
+        if key in cache:
+            return False
+        cache[key] = value
+        return True
+    return _load
+
+
+def _dump_warm(cache):
+    for key in cache.keys():
+        value = cache.peek(key)
+        if value is not None:
+            yield key, value, value['timestamp'].timestamp()
+
+
+def _load_warm(cache):
+    def _load(key, value, ts):
+        if key in cache:
+            return False
+        return cache.put(key, value)
+    return _load
+
+
+def _register_cache_snapshots():
+    cache_snapshot.register(
+        'places', lambda: _dump_timestamped(places_cache), _load_missing(places_cache),
+        lambda key, value: 86400 if key.startswith('detail_') else 3600)
+    cache_snapshot.register(
+        'images', lambda: _dump_stamped(image_search_cache, _snapshot_stamps['images']),
+        _load_stamped(image_search_cache, _snapshot_stamps['images']),
+        lambda key, value: IMAGE_SNAPSHOT_TTL_SECONDS if value.get('url') else NEGATIVE_SNAPSHOT_TTL_SECONDS)
+    cache_snapshot.register(
+        'recommendations', lambda: _dump_warm(_warm_cache), _load_warm(_warm_cache), WARM_CACHE_STALE_SECONDS)
+    cache_snapshot.register(
+        'candidate_pool', lambda: _dump_warm(_candidate_pool), _load_warm(_candidate_pool),
+        CANDIDATE_POOL_TTL_SECONDS)
+    if local_feeds:
+        cache_snapshot.register(
+            'descriptions', lambda: _dump_timestamped(local_feeds._description_cache),
+            _load_missing(local_feeds._description_cache), local_feeds.DESCRIPTION_CACHE_TTL_SECONDS)
+
+
+_register_cache_snapshots()
+cache_snapshot.start()
+
 # Warm cache on startup (non-blocking)
 _warm_cache_on_startup()
 
 
+def _start_cache_janitor():
+    """
+    Every CACHE_JANITOR_INTERVAL_SECONDS: purge expired cache rows and tokens, roll up
+    old clicks / prune old recent recommendations, reclaim space and refresh planner
+    statistics for tables that grew or shrank (background thread).
+    """
+    import threading
+    import time
+    
+    def _run():
+        time.sleep(5)  # first sweep shortly after startup, off the import path
+        while True:
+            try:
+                deleted = db.purge_expired()
+                compacted = db.compact_history()
+                # Entries past their serving TTL stay a while as degraded-mode fallbacks
+                compacted['warm_cache_expired'] = _warm_cache.prune_older_than(DEGRADED_MAX_AGE_SECONDS)
+                compacted['candidate_pool_expired'] = _candidate_pool.prune_older_than(DEGRADED_MAX_AGE_SECONDS)
+                freed = db.reclaim_space()
+                analyzed = db.refresh_planner_stats()
+                total = sum(deleted.values())
+                _janitor_stats['runs'] += 1
+                _janitor_stats['last_run'] = datetime.now().isoformat()
+                _janitor_stats['last_deleted'] = deleted
+                _janitor_stats['total_deleted'] += total
+                _janitor_stats['last_compacted'] = compacted
+                _janitor_stats['total_compacted'] += sum(compacted.values())
+                _janitor_stats['pages_freed'] += freed
+                _janitor_stats['last_analyzed'] = analyzed
+                _janitor_stats['last_error'] = None
+                if total or freed or any(compacted.values()) or analyzed:
+                    print(f"[CACHE] Janitor removed {total} expired rows {deleted}, compacted {compacted}, freed {freed} pages, analyzed {analyzed}")
+            except Exception as e:
+                _janitor_stats['last_error'] = str(e)
+                print(f"[CACHE] Janitor error: {e}")
+            time.sleep(CACHE_JANITOR_INTERVAL_SECONDS)
+    
+    t = threading.Thread(target=db.closes_conn(_run), name='cache-janitor', daemon=True)
+    t.start()
+    print(f"[CACHE] Janitor started (every {CACHE_JANITOR_INTERVAL_SECONDS}s)")
+
+
+_start_cache_janitor()
+
+
 if __name__ == '__main__':
     print("=" * 50)
     print("Activity Planner Backend API")
@@ -0,0 +1,185 @@
+"""
+Snapshot in-memory caches to a local file and restore them after a restart.
+
+Each cache registers a dump function yielding (key, value, timestamp) and a load
+function that puts one entry (with its original timestamp) back. The snapshot file
+is a stream of pickled records: a header, then one (cache_name, [(key, value,
+timestamp), ...]) chunk at a time, written to a temp file and renamed into place so a crash mid-write never
+leaves a truncated snapshot. Restore streams the file chunk by chunk on a
+background thread, skips entries past their TTL and never overwrites an entry the
+live process has already filled.
+
+Restoring unpickles the file, and unpickling can run arbitrary code, so the snapshot
+must be trusted: it is read by whichever process next starts with the same
+CACHE_SNAPSHOT_PATH (a restarted server, another worker, the Friday digest cron),
+not only the one that wrote it. It is created with owner-only permissions; keep
+CACHE_SNAPSHOT_PATH on a local path only the service user can write.
+
+Processes that only borrow the server's warm caches (send_friday_digest.py) set
+CACHE_SNAPSHOT_READ_ONLY=1: they restore but never save, so they cannot overwrite
+the server's snapshot with their own state on exit.
+"""
+
+import atexit
+import os
+import pickle
+import threading
+import time
+
+SNAPSHOT_ENABLED = os.environ.get('CACHE_SNAPSHOT_ENABLED', '1') != '0'
+SNAPSHOT_READ_ONLY = os.environ.get('CACHE_SNAPSHOT_READ_ONLY', '0') == '1'
+SNAPSHOT_PATH = os.environ.get(
+    'CACHE_SNAPSHOT_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache_snapshot.bin'))
+SNAPSHOT_INTERVAL_SECONDS = int(os.environ.get('CACHE_SNAPSHOT_INTERVAL_SECONDS', '300'))
+SNAPSHOT_CHUNK_SIZE = int(os.environ.get('CACHE_SNAPSHOT_CHUNK_SIZE', '500'))
+
+_FORMAT_VERSION = 1
+
+_caches = {}  # name -> (dump_fn, load_fn, ttl_seconds or callable(key, value) -> seconds)
+_lock = threading.Lock()   # serializes saves
+_restored = threading.Event()
+_saver = None
+_stats = {
+    'saves': 0, 'last_save': None, 'last_save_ms': 0.0, 'last_save_entries': 0, 'last_save_bytes': 0,
+    'restored': 0, 'skipped_expired': 0, 'skipped_present': 0, 'restore_ms': 0.0, 'errors': 0,
+}
+
+
+def register(name, dump_fn, load_fn, ttl_seconds):
+    """
+    Add a cache to the snapshot. dump_fn() yields (key, value, unix_ts); load_fn(key, value, unix_ts)
+    restores one entry and returns False if the key was already present. ttl_seconds is a
+    number or a callable(key, value) for caches with per-entry lifetimes.
+    """
+    _caches[name] = (dump_fn, load_fn, ttl_seconds)
+
+
+def save():
+    """Write every registered cache to SNAPSHOT_PATH atomically. Returns the number of entries written."""
+    if not SNAPSHOT_ENABLED or SNAPSHOT_READ_ONLY or not _caches:
+        return 0
+    with _lock:
+        start = time.time()
+        tmp_path = f"{SNAPSHOT_PATH}.{os.getpid()}.tmp"
+        written = 0
+        try:
+            with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                pickle.dump({'version': _FORMAT_VERSION, 'saved_at': start}, f, protocol=pickle.HIGHEST_PROTOCOL)
+                for name, (dump_fn, _, _) in list(_caches.items()):
+                    chunk = []
+                    for record in dump_fn():
+                        chunk.append(record)
+                        if len(chunk) >= SNAPSHOT_CHUNK_SIZE:
+                            pickle.dump((name, chunk), f, protocol=pickle.HIGHEST_PROTOCOL)
+                            written += len(chunk)
+                            chunk = []
+                    if chunk:
+                        pickle.dump((name, chunk), f, protocol=pickle.HIGHEST_PROTOCOL)
+                        written += len(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, SNAPSHOT_PATH)
+        except Exception as e:
+            _stats['errors'] += 1
+            print(f"[CACHE_SNAPSHOT] Save failed: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return 0
+        _stats['saves'] += 1
+        _stats['last_save'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        _stats['last_save_ms'] = round((time.time() - start) * 1000, 2)
+        _stats['last_save_entries'] = written
+        _stats['last_save_bytes'] = os.path.getsize(SNAPSHOT_PATH)
+        return written
+
+
+def restore():
+    """Stream SNAPSHOT_PATH back into the registered caches. Returns the number of entries restored."""
+    start = time.time()
+    restored = 0
+    try:
+        if not SNAPSHOT_ENABLED or not os.path.exists(SNAPSHOT_PATH):
+            return 0
+        now = time.time()
+        with open(SNAPSHOT_PATH, 'rb') as f:
+            header = pickle.load(f)
+            if not isinstance(header, dict) or header.get('version') != _FORMAT_VERSION:
+                print(f"[CACHE_SNAPSHOT] Ignoring snapshot with unknown format: {header!r:.80}")
+                return 0
+            while True:
+                try:
+                    name, chunk = pickle.load(f)
+                except EOFError:
+                    break
+                registered = _caches.get(name)
+                if not registered:
+                    continue
+                _, load_fn, ttl = registered
+                for key, value, ts in chunk:
+                    lifetime = ttl(key, value) if callable(ttl) else ttl
+                    if ts is None or now - ts >= lifetime:
+                        _stats['skipped_expired'] += 1
+                        continue
+                    if load_fn(key, value, ts) is False:
+                        _stats['skipped_present'] += 1
+                        continue
+                    restored += 1
+        age = int(now - header.get('saved_at', now))
+        print(f"[CACHE_SNAPSHOT] Restored {restored} entries from snapshot ({age}s old) "
+              f"in {(time.time() - start) * 1000:.0f}ms")
+    except Exception as e:
+        _stats['errors'] += 1
+        print(f"[CACHE_SNAPSHOT] Restore failed: {e}")
+    finally:
+        _stats['restored'] += restored
+        _stats['restore_ms'] = round((time.time() - start) * 1000, 2)
+        _restored.set()
+    return restored
+
+
+def wait_restored(timeout=None):
+    """Block until the background restore has finished (or timeout). Returns True if it has."""
+    return _restored.wait(timeout)
+
+
+def start():
+    """
+    Restore on a background thread, then save every SNAPSHOT_INTERVAL_SECONDS and at exit
+    (restore only when SNAPSHOT_READ_ONLY).
+    """
+    global _saver
+    if not SNAPSHOT_ENABLED:
+        _restored.set()
+        print("[CACHE_SNAPSHOT] Disabled")
+        return
+    if _saver is not None and _saver.is_alive():
+        return
+
+    def _run():
+        restore()
+        while not SNAPSHOT_READ_ONLY:
+            time.sleep(SNAPSHOT_INTERVAL_SECONDS)
+            save()
+
+    _saver = threading.Thread(target=_run, name='cache-snapshot', daemon=True)
+    _saver.start()
+    if SNAPSHOT_READ_ONLY:
+        print(f"[CACHE_SNAPSHOT] Restoring from {SNAPSHOT_PATH} in background (read-only, never saved)")
+        return
+    atexit.register(save)
+    print(f"[CACHE_SNAPSHOT] Restoring from {SNAPSHOT_PATH} in background (saving every {SNAPSHOT_INTERVAL_SECONDS}s)")
+
+
+def get_metrics():
+    return {
+        'enabled': SNAPSHOT_ENABLED,
+        'read_only': SNAPSHOT_READ_ONLY,
+        'path': SNAPSHOT_PATH,
+        'interval_seconds': SNAPSHOT_INTERVAL_SECONDS,
+        'caches': sorted(_caches),
+        'restore_done': _restored.is_set(),
+        **_stats,
+    }
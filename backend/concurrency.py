@@ -0,0 +1,450 @@
+"""
+Concurrency helpers shared by the recommendation pipeline.
+
+SingleFlight coalesces concurrent calls for the same key: the first caller runs
+the function, later callers wait on the same future (up to a deadline) instead
+of repeating the upstream work. Background refreshes go through the same
+registry, so a foreground miss joins an in-progress refresh and vice versa.
+
+Deadline carries a request's total latency budget down through the pipeline (and
+collects the stages that had to cut their work short), and
+fan_out runs independent fetches against it: it returns whatever finished by the
+deadline and leaves stragglers running, handing their late results to a callback
+(typically to fill a cache for the next request) instead of blocking on them.
+
+PriorityExecutor is a fixed pool of long-lived workers fed from one priority queue
+split into lanes (interactive, digest, background, warming). Each lane has a bounded
+queue (submit raises LaneFull when it is full) and queue-time metrics, and a worker
+always takes the highest-priority waiting task, so a burst of background refreshes
+can't delay user-facing fetches. Three process-wide instances are defined at the
+bottom: `upstream` for fan-out subtasks (candidate-pool sources, image lookups),
+`sources` for the leaf fetches a subtask fans out to in turn (individual local-feed
+sources), and `jobs` for whole background jobs (stale refreshes, warming, digest
+sends). A task only ever waits on a pool below its own, so waiting outer tasks can't
+occupy the workers their inner tasks need. Work inherits the lane of the thread that
+submits it, so a background job's fetches stay in the background lane.
+
+AdaptiveLimiter caps how many slow upstream calls run at once and adapts that cap to
+observed latency (AIMD); callers that find it saturated serve a degraded result
+instead of queueing behind the upstream.
+
+Functions registered with on_thread_exit() (e.g. db.close_conn) run on the long-lived
+threads this module starts (PriorityExecutor workers, SingleFlight background threads)
+just before they end.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+
+_thread_exit_hooks = []
+
+
+def on_thread_exit(fn):
+    """Run fn() on each thread started here as it ends (see module docstring)."""
+    if fn not in _thread_exit_hooks:
+        _thread_exit_hooks.append(fn)
+
+
+def _with_exit_hooks(target):
+    def run():
+        try:
+            target()
+        finally:
+            for fn in list(_thread_exit_hooks):
+                try:
+                    fn()
+                except Exception as e:
+                    print(f"[CONCURRENCY] Thread exit hook {getattr(fn, '__name__', fn)} failed: {e}")
+    return run
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> Future of the in-flight call
+        self._stats = {'leaders': 0, 'shared': 0, 'timeouts': 0, 'background_started': 0,
+                       'background_skipped': 0, 'background_rejected': 0, 'errors': 0}
+
+    def _join_or_lead(self, key):
+        with self._lock:
+            fut = self._calls.get(key)
+            if fut is not None:
+                self._stats['shared'] += 1
+                return fut, False
+            fut = Future()
+            self._calls[key] = fut
+            self._stats['leaders'] += 1
+            return fut, True
+
+    def _run(self, key, fut, fn):
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                if self._calls.get(key) is fut:
+                    del self._calls[key]
+
+    def do(self, key, fn, timeout=None):
+        """
+        Return fn() for this key, sharing one execution among concurrent callers.
+        Waiters give up after `timeout` seconds with concurrent.futures.TimeoutError
+        (the leader keeps running); errors raised by the leader are re-raised to all.
+        """
+        fut, leader = self._join_or_lead(key)
+        if leader:
+            return self._run(key, fut, fn)
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise
+
+    def start_background(self, key, fn, executor=None):
+        """
+        Run fn() in the background unless a call for key is already in flight. Returns True if started.
+        executor: object with submit(fn) (e.g. jobs.executor('background')); if its queue is full
+        (LaneFull) the call is not started. Without one, fn runs on a daemon thread.
+        """
+        with self._lock:
+            if key in self._calls:
+                self._stats['background_skipped'] += 1
+                return False
+            fut = Future()
+            self._calls[key] = fut
+            self._stats['leaders'] += 1
+            self._stats['background_started'] += 1
+
+        def _target():
+            try:
+                self._run(key, fut, fn)
+            except Exception as e:
+                print(f"[SINGLE_FLIGHT] {self.name} background call for {key} failed: {e}")
+
+        if executor is None:
+            threading.Thread(target=_with_exit_hooks(_target), name=f"{self.name}-refresh", daemon=True).start()
+            return True
+        try:
+            executor.submit(_target)
+        except LaneFull:
+            with self._lock:
+                if self._calls.get(key) is fut:
+                    del self._calls[key]
+                self._stats['background_started'] -= 1
+                self._stats['background_rejected'] += 1
+            fut.cancel()
+            return False
+        return True
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._calls), **self._stats}
+
+
+class Deadline:
+    """
+    A point in time work must finish by, created from a latency budget in seconds.
+    Stages that trim their work to fit (skip lookups, stop waiting on a source) record
+    it with cut(stage); child deadlines share the parent's list of cuts.
+    """
+
+    _cuts_lock = threading.Lock()
+
+    def __init__(self, seconds, cuts=None):
+        self.budget = seconds
+        self.started = time.monotonic()
+        self.at = self.started + seconds
+        self.cuts = cuts if cuts is not None else []
+
+    def remaining(self, cap=None):
+        """Seconds left (never negative), optionally capped for a single stage."""
+        left = max(0.0, self.at - time.monotonic())
+        return min(left, cap) if cap is not None else left
+
+    def expired(self):
+        return time.monotonic() >= self.at
+
+    def elapsed_ms(self):
+        return round((time.monotonic() - self.started) * 1000, 1)
+
+    def child(self, cap):
+        """A deadline no later than this one and at most cap seconds from now."""
+        return Deadline(self.remaining(cap), cuts=self.cuts)
+
+    def cut(self, stage):
+        """Record that `stage` did less than usual to stay within the budget."""
+        with self._cuts_lock:
+            if stage not in self.cuts:
+                self.cuts.append(stage)
+
+
+def fan_out(tasks, timeout, on_late=None, executor=None, name='fan_out'):
+    """
+    Run {name: fn} concurrently and wait at most `timeout` seconds.
+    Returns (results, errors, pending): results/errors for tasks done in time, names
+    of tasks still running. Pending tasks keep running; when one finishes without
+    error, on_late(name, result) is called from its worker thread.
+    Without an executor a throwaway pool with one worker per task is used and shut
+    down without waiting, so the caller never blocks past the timeout. Tasks an
+    executor refuses (LaneFull) are reported in errors.
+    """
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max(1, len(tasks)), thread_name_prefix=name)
+    futures, errors = {}, {}
+    for task_name, fn in tasks.items():
+        try:
+            futures[executor.submit(fn)] = task_name
+        except LaneFull as e:
+            errors[task_name] = e
+    try:
+        done, not_done = wait(futures, timeout=max(0.0, timeout))
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
+
+    results = {}
+    for fut in done:
+        try:
+            results[futures[fut]] = fut.result()
+        except Exception as e:
+            errors[futures[fut]] = e
+
+    pending = [futures[fut] for fut in not_done]
+    if on_late is not None:
+        for fut in not_done:
+            fut.add_done_callback(lambda f, task_name=futures[fut]: _deliver_late(on_late, task_name, f, name))
+    return results, errors, pending
+
+
+def _deliver_late(on_late, task_name, fut, name):
+    if fut.cancelled() or fut.exception() is not None:
+        return
+    try:
+        on_late(task_name, fut.result())
+    except Exception as e:
+        print(f"[FAN_OUT] {name}: late result handler for {task_name} failed: {e}")
+
+
+class Overloaded(RuntimeError):
+    """Raised when an AdaptiveLimiter has no capacity for another call."""
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for calls to slow upstreams. Each call that finishes within
+    target_latency without failing raises the limit by ~1 per limit's worth of calls; a
+    slow or failed call multiplies it by `backoff` (at most once per target_latency, so
+    one burst of slow completions counts as a single congestion signal).
+    """
+
+    def __init__(self, name, initial, min_limit, max_limit, target_latency, backoff=0.7):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self._limit = float(initial)
+        self._in_use = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'acquired': 0, 'rejected': 0, 'succeeded': 0, 'slow_or_failed': 0, 'decreases': 0}
+
+    def try_acquire(self, share=1.0):
+        """Take a slot if fewer than share * limit calls are running (share < 1 sheds low-priority work first)."""
+        with self._lock:
+            if self._in_use >= max(1, int(self._limit * share)):
+                self._stats['rejected'] += 1
+                return False
+            self._in_use += 1
+            self._stats['acquired'] += 1
+            return True
+
+    def release(self, latency, ok=True):
+        with self._lock:
+            self._in_use -= 1
+            if ok and latency <= self.target_latency:
+                self._stats['succeeded'] += 1
+                self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+                return
+            self._stats['slow_or_failed'] += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= self.target_latency:
+                self._last_decrease = now
+                self._limit = max(self.min_limit, self._limit * self.backoff)
+                self._stats['decreases'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {'limit': round(self._limit, 2), 'in_use': self._in_use,
+                    'target_latency_s': self.target_latency, **self._stats}
+
+
+class LaneFull(RuntimeError):
+    """Raised by PriorityExecutor.submit when the lane's queue is at its limit."""
+
+
+_local = threading.local()
+DEFAULT_LANE = 'interactive'
+
+
+def current_lane():
+    """Lane of the work running on this thread (request threads are interactive)."""
+    return getattr(_local, 'lane', DEFAULT_LANE)
+
+
+class _LaneHandle:
+    """Executor-like view of one lane (for fan_out and SingleFlight.start_background)."""
+
+    def __init__(self, pool, lane):
+        self.pool = pool
+        self.lane = lane
+
+    def submit(self, fn, *args, **kwargs):
+        return self.pool.submit(self.lane, fn, *args, **kwargs)
+
+
+class PriorityExecutor:
+    def __init__(self, name, workers, lanes):
+        """lanes: {lane: (priority, max_queue)}; lower priority numbers run first."""
+        self.name = name
+        self.workers = max(1, workers)
+        self._lanes = dict(lanes)
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._threads = []
+        self._pid = None
+        self._stats = {
+            lane: {'priority': prio, 'max_queue': max_queue, 'queued': 0, 'running': 0,
+                   'submitted': 0, 'completed': 0, 'rejected': 0, 'errors': 0,
+                   'queue_ms_total': 0.0, 'queue_ms_max': 0.0}
+            for lane, (prio, max_queue) in self._lanes.items()
+        }
+
+    def submit(self, lane, fn, *args, **kwargs):
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown lane for {self.name}: {lane}")
+        priority, max_queue = self._lanes[lane]
+        fut = Future()
+        with self._cond:
+            st = self._stats[lane]
+            if st['queued'] >= max_queue:
+                st['rejected'] += 1
+                raise LaneFull(f"{self.name}/{lane} queue full ({max_queue})")
+            heapq.heappush(self._heap, (priority, next(self._seq), lane, time.monotonic(), fut, fn, args, kwargs))
+            st['queued'] += 1
+            st['submitted'] += 1
+            self._cond.notify()
+        self._ensure_workers()
+        return fut
+
+    def executor(self, lane=None):
+        """Executor-like handle for a lane (default: the calling thread's lane)."""
+        return _LaneHandle(self, lane or current_lane())
+
+    def _ensure_workers(self):
+        # Started lazily, and again in forked gunicorn workers
+        if self._pid == os.getpid() and len(self._threads) == self.workers:
+            return
+        with self._cond:
+            if self._pid != os.getpid():
+                self._threads = []
+                self._pid = os.getpid()
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=_with_exit_hooks(self._run), name=f"{self.name}-{len(self._threads)}",
+                                     daemon=True)
+                self._threads.append(t)
+                t.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, lane, queued_at, fut, fn, args, kwargs = heapq.heappop(self._heap)
+                st = self._stats[lane]
+                st['queued'] -= 1
+                waited_ms = (time.monotonic() - queued_at) * 1000
+                st['queue_ms_total'] += waited_ms
+                st['queue_ms_max'] = max(st['queue_ms_max'], waited_ms)
+                if not fut.set_running_or_notify_cancel():
+                    st['completed'] += 1
+                    continue
+                st['running'] += 1
+            prev_lane = current_lane()
+            _local.lane = lane
+            failed = False
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                failed = True
+                fut.set_exception(e)
+            finally:
+                _local.lane = prev_lane
+                with self._cond:
+                    st['running'] -= 1
+                    st['completed'] += 1
+                    if failed:
+                        st['errors'] += 1
+
+    def stats(self):
+        with self._cond:
+            lanes = {}
+            for lane, st in self._stats.items():
+                done = st['completed'] or 0
+                lanes[lane] = {
+                    **{k: v for k, v in st.items() if k != 'queue_ms_total'},
+                    'queue_ms_max': round(st['queue_ms_max'], 1),
+                    'queue_ms_avg': round(st['queue_ms_total'] / done, 1) if done else None,
+                }
+            return {'workers': self.workers, 'queued': len(self._heap), 'lanes': lanes}
+
+
+def _lane_config(prefix, defaults):
+    return {
+        lane: (prio, int(os.environ.get(f"{prefix}_{lane.upper()}_MAX_QUEUE", str(max_queue))))
+        for lane, (prio, max_queue) in defaults.items()
+    }
+
+
+# Process-wide executors. Total thread count is UPSTREAM_WORKERS + SOURCE_WORKERS + JOB_WORKERS.
+upstream = PriorityExecutor('upstream', int(os.environ.get('UPSTREAM_WORKERS', '24')), _lane_config('UPSTREAM', {
+    'interactive': (0, 400),
+    'digest': (1, 200),
+    'background': (2, 100),
+    'warming': (3, 100),
+}))
+# Leaf fetches submitted from `upstream` tasks; these never wait on another pool
+sources = PriorityExecutor('sources', int(os.environ.get('SOURCE_WORKERS', '32')), _lane_config('SOURCES', {
+    'interactive': (0, 800),
+    'digest': (1, 400),
+    'background': (2, 200),
+    'warming': (3, 200),
+}))
+jobs = PriorityExecutor('jobs', int(os.environ.get('JOB_WORKERS', '4')), _lane_config('JOBS', {
+    'digest': (1, 500),
+    'background': (2, 50),
+    'warming': (3, 50),
+}))
+
+
+def get_metrics():
+    return {'upstream': upstream.stats(), 'sources': sources.stats(), 'jobs': jobs.stats()}
@@ -4,25 +4,129 @@ Replaces in-memory dicts with a single activity_planner.db file.
 """
 
 import os
+import functools
 import json
 import sqlite3
+import threading
+import time
+import zlib
 from datetime import datetime, timedelta
 from contextlib import contextmanager
 
 # Database file path (default: same directory as this file)
 DB_PATH = os.environ.get('DATABASE_URL', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'activity_planner.db'))
 
-# Thread-local connection would be better for Flask; for single-threaded dev we use one connection per request
-def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+# Connection tuning (override via env for large deployments)
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', '5000'))
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', '8192'))       # page cache per connection
+DB_MMAP_SIZE_BYTES = int(os.environ.get('DB_MMAP_SIZE_BYTES', str(64 * 1024 * 1024)))
+
+# Planner statistics (see refresh_planner_stats): tables below STATS_MIN_ROWS plan fine on
+# SQLite's defaults; others are re-analyzed (sampling ANALYSIS_LIMIT rows per index) once
+# their row count drifts STATS_DRIFT_FACTOR x from what sqlite_stat1 recorded.
+STATS_MIN_ROWS = int(os.environ.get('DB_STATS_MIN_ROWS', '1000'))
+STATS_DRIFT_FACTOR = 10
+ANALYSIS_LIMIT = int(os.environ.get('DB_ANALYSIS_LIMIT', '1000'))
+
+# Cache retention and janitor pacing (see purge_expired)
+PHOTO_CACHE_TTL_DAYS = 30
+JANITOR_BATCH_SIZE = int(os.environ.get('DB_JANITOR_BATCH_SIZE', '500'))
+JANITOR_MAX_BATCHES = int(os.environ.get('DB_JANITOR_MAX_BATCHES', '20'))    # per table per sweep
+JANITOR_PAUSE_SECONDS = float(os.environ.get('DB_JANITOR_PAUSE_SECONDS', '0.05'))
+
+# History retention: raw clicks older than this are folded into click_daily_rollup;
+# recent_recommendations rows older than this are deleted (and never looked up).
+CLICK_RAW_RETENTION_DAYS = int(os.environ.get('CLICK_RAW_RETENTION_DAYS', '30'))
+RECENT_RECS_RETENTION_DAYS = int(os.environ.get('RECENT_RECS_RETENTION_DAYS', '28'))
+SERVED_RECS_TTL_DAYS = int(os.environ.get('SERVED_RECS_TTL_DAYS', '14'))
+
+# One long-lived connection per thread (per process), reused by every helper below.
+# sqlite3 connections must not cross threads, and gunicorn forks workers, so the
+# connection is keyed by thread-local storage and re-opened if the pid changes.
+_local = threading.local()
+
+
+def _open_conn():
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000.0)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous=NORMAL")  # safe with WAL, avoids fsync per commit
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE_BYTES}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
     return conn
 
 
-def init_db():
-    """Create tables if they don't exist."""
-    with get_conn() as c:
-        c.executescript("""
+def _thread_conn():
+    """Return this thread's connection, opening it on first use (or after a fork / DB_PATH change)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.path != DB_PATH:
+        conn = _open_conn()
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = DB_PATH
+        _local.depth = 0
+    return conn
+
+
+@contextmanager
+def get_conn():
+    """
+    Yield the thread's pooled connection inside a transaction.
+    Nested `with get_conn()` blocks join the outermost transaction, which commits
+    on exit (or rolls back on error). The connection itself stays open for reuse.
+    """
+    conn = _thread_conn()
+    _local.depth += 1
+    try:
+        yield conn
+        if _local.depth == 1:
+            conn.commit()
+    except BaseException:
+        if _local.depth == 1:
+            conn.rollback()
+        raise
+    finally:
+        _local.depth -= 1
+
+
+def close_conn():
+    """Close this thread's connection (e.g. at worker shutdown). Safe to call repeatedly."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    _local.conn = None
+
+
+def closes_conn(fn):
+    """Wrap a thread target so the thread's pooled connection is closed when it returns."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_conn()
+    return wrapper
+
+
+# ---------- Schema migrations ----------
+# Each step runs once, in order, under BEGIN IMMEDIATE: the database write lock is taken
+# before the step looks at the schema, so when several workers start at once the others
+# wait, see the recorded version and skip it. (sqlite3 does not open a transaction for
+# DDL on its own, so without the explicit BEGIN an ALTER TABLE would commit immediately
+# and two workers could both pass a _column_exists check.) The applied version is recorded
+# in schema_version in the same transaction. Steps in _MIGRATIONS_OUTSIDE_TRANSACTION
+# (VACUUM cannot run inside one) are not serialized and must be idempotent.
+# Append new steps to MIGRATIONS, never edit shipped ones.
+
+def _migrate_base_schema(c):
+    """v1: original tables (IF NOT EXISTS, so pre-migration databases pass through unchanged)."""
+    for stmt in """
             CREATE TABLE IF NOT EXISTS users (
                 user_id TEXT PRIMARY KEY,
                 identifier TEXT NOT NULL,
@@ -144,14 +248,272 @@ def init_db():
                 fetched_at TEXT NOT NULL
             );
             CREATE INDEX IF NOT EXISTS idx_place_photo_cache_fetched ON place_photo_cache(fetched_at);
+    """.split(";"):
+        if stmt.strip():
+            c.execute(stmt)
+
+
+def _column_exists(c, table, column):
+    return any(row["name"] == column for row in c.execute(f"PRAGMA table_info({table})"))
+
+
+def _migrate_email_verified(c):
+    """v2: users.email_verified for databases created before email verification existed."""
+    if not _column_exists(c, "users", "email_verified"):
+        c.execute("ALTER TABLE users ADD COLUMN email_verified INTEGER NOT NULL DEFAULT 0")
+
+
+def _migrate_composite_indexes(c):
+    """
+    v3: composite indexes for the (user_id, place_id) lookups, toggles and deletes,
+    covering indexes for the per-user reads, and auth_tokens(user_id).
+    The single-column user_id indexes are prefixes of these and are dropped.
+    No ANALYZE here: statistics taken at upgrade time describe nearly empty tables and
+    would steer the planner away from these indexes (refresh_planner_stats handles it).
+    """
+    c.execute("CREATE INDEX IF NOT EXISTS idx_visited_user_place ON visited_history(user_id, place_id, visited_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_saved_user_place ON saved_places(user_id, place_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_feedback_user_place ON feedback(user_id, place_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_click_tracking_user_category ON click_tracking(user_id, category)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_recent_user_time ON recent_recommendations(user_id, recommended_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_auth_tokens_user ON auth_tokens(user_id)")
+    for name in ("idx_visited_user", "idx_saved_user", "idx_feedback_user",
+                 "idx_click_tracking_user", "idx_recent_user", "idx_cached_recs_user"):
+        c.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def _migrate_cached_recs_blob(c):
+    """v4: compressed payload plus item_count/item_ids so metadata reads skip decoding."""
+    for column, decl in (("items_blob", "BLOB"), ("item_count", "INTEGER"), ("item_ids", "TEXT")):
+        if not _column_exists(c, "cached_recommendations", column):
+            c.execute(f"ALTER TABLE cached_recommendations ADD COLUMN {column} {decl}")
+
+
+def _migrate_incremental_vacuum(c):
+    """v5: auto_vacuum=INCREMENTAL so the janitor can hand freed pages back to the OS."""
+    if c.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    c.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    try:
+        c.execute("VACUUM")  # required for the mode change to take effect on an existing file
+    except sqlite3.OperationalError as e:
+        # Busy (another worker holds the db): harmless, reclaim_space() just skips the vacuum
+        print(f"[DB] VACUUM for auto_vacuum change skipped: {e}")
+
+
+def _migrate_category_affinity(c):
+    """
+    v6: per-(user, category) running affinity counters, maintained by the interaction
+    writers below. visited/saved rows get a category column so removals can be undone;
+    existing rows borrow the category recorded on the same place's feedback or clicks.
+    Replaces the hourly user_affinity_cache.
+    """
+    for table in ("visited_history", "saved_places"):
+        if not _column_exists(c, table, "category"):
+            c.execute(f"ALTER TABLE {table} ADD COLUMN category TEXT")
+        c.execute(f"""
+            UPDATE {table} SET category = COALESCE(
+                (SELECT f.category FROM feedback f WHERE f.user_id = {table}.user_id AND f.place_id = {table}.place_id AND f.category IS NOT NULL LIMIT 1),
+                (SELECT k.category FROM click_tracking k WHERE k.user_id = {table}.user_id AND k.place_id = {table}.place_id AND k.category IS NOT NULL LIMIT 1)
+            ) WHERE category IS NULL
         """)
-    # Add email_verified column if missing (migration for existing DBs)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS user_category_affinity (
+            user_id TEXT NOT NULL,
+            category TEXT NOT NULL,
+            weight REAL NOT NULL DEFAULT 0,
+            clicks INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, category)
+        ) WITHOUT ROWID
+    """)
+    _rebuild_affinity(c)
+    c.execute("DROP TABLE IF EXISTS user_affinity_cache")
+
+
+def _migrate_places_catalog(c):
+    """v7: places catalog (place_id -> title, category, location, display fields)."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS places (
+            place_id TEXT PRIMARY KEY,
+            title TEXT,
+            category TEXT,
+            lat REAL,
+            lng REAL,
+            address TEXT,
+            photo_url TEXT,
+            source_url TEXT,
+            rating REAL,
+            total_ratings INTEGER,
+            price_flag TEXT,
+            source TEXT,
+            last_seen TEXT NOT NULL
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_places_last_seen ON places(last_seen)")
+
+
+def _migrate_history_rollups(c):
+    """v8: daily per-user/per-category click rollup and an indexed rec_id lookup."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS click_daily_rollup (
+            user_id TEXT NOT NULL,
+            category TEXT NOT NULL,
+            day TEXT NOT NULL,
+            clicks INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, category, day)
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_recent_user_rec ON recent_recommendations(user_id, rec_id, recommended_at)")
+
+
+def _migrate_served_recommendations(c):
+    """v9: every item served to a user, keyed by (user_id, rec_id), with a compressed snapshot."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS served_recommendations (
+            user_id TEXT NOT NULL,
+            rec_id TEXT NOT NULL,
+            place_id TEXT,
+            item_blob BLOB NOT NULL,
+            served_at TEXT NOT NULL,
+            expires_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, rec_id)
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_served_recs_expires ON served_recommendations(expires_at)")
+
+
+def _migrate_geocode_cache(c):
+    """v10: shared geocode cache (canonical query -> lat/lng, NULL for a negative result)."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            query_key TEXT PRIMARY KEY,
+            lat REAL,
+            lng REAL,
+            source TEXT,
+            expires_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_geocode_cache_expires ON geocode_cache(expires_at)")
+
+
+def _migrate_reverse_geocode_cache(c):
+    """v11: reverse geocode cache per geohash cell (city/state NULL for a negative result)."""
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS reverse_geocode_cache (
+            cell TEXT PRIMARY KEY,
+            city TEXT,
+            county TEXT,
+            state TEXT,
+            display_name TEXT,
+            source TEXT,
+            expires_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reverse_geocode_cache_expires ON reverse_geocode_cache(expires_at)")
+
+
+def _migrate_drop_upgrade_stats(c):
+    """
+    v12: clear the sqlite_stat1 rows an earlier v3 recorded at upgrade time (often '1 1 1'
+    for a table that has since grown), so planning falls back to SQLite's defaults until
+    refresh_planner_stats() samples real sizes.
+    """
+    if c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'").fetchone():
+        c.execute("DELETE FROM sqlite_stat1")
+        c.execute("ANALYZE sqlite_master")  # reload (now empty) statistics on this connection
+
+
+MIGRATIONS = [
+    (1, "base schema", _migrate_base_schema),
+    (2, "users.email_verified", _migrate_email_verified),
+    (3, "composite indexes for hot lookups", _migrate_composite_indexes),
+    (4, "compressed cached_recommendations payload", _migrate_cached_recs_blob),
+    (5, "auto_vacuum=INCREMENTAL", _migrate_incremental_vacuum),
+    (6, "user_category_affinity counters", _migrate_category_affinity),
+    (7, "places catalog", _migrate_places_catalog),
+    (8, "click rollups and recent recommendation lookups", _migrate_history_rollups),
+    (9, "served_recommendations", _migrate_served_recommendations),
+    (10, "geocode_cache", _migrate_geocode_cache),
+    (11, "reverse_geocode_cache", _migrate_reverse_geocode_cache),
+    (12, "drop planner statistics recorded at upgrade", _migrate_drop_upgrade_stats),
+]
+
+_MIGRATIONS_OUTSIDE_TRANSACTION = {_migrate_incremental_vacuum}
+
+
+def get_schema_version():
     with get_conn() as c:
-        try:
-            c.execute("SELECT email_verified FROM users LIMIT 1")
-        except sqlite3.OperationalError:
-            c.execute("ALTER TABLE users ADD COLUMN email_verified INTEGER NOT NULL DEFAULT 0")
-    print(f"[DB] Initialized SQLite at {DB_PATH}")
+        c.execute(
+            "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description TEXT, applied_at TEXT NOT NULL)"
+        )
+        row = c.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate():
+    """Apply pending migrations in order. Returns the resulting schema version."""
+    current = get_schema_version()
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        with get_conn() as c:
+            if step not in _MIGRATIONS_OUTSIDE_TRANSACTION and not c.in_transaction:
+                c.execute("BEGIN IMMEDIATE")
+            applied = c.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone()
+            if not applied:
+                step(c)
+                c.execute(
+                    "INSERT OR IGNORE INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now().isoformat())
+                )
+        if not applied:
+            print(f"[DB] Applied migration {version}: {description}")
+        current = version
+    return current
+
+
+# Hot per-user queries that must be served by an index (see check_query_plans)
+_HOT_QUERIES = [
+    ("visited_contains", "SELECT 1 FROM visited_history WHERE user_id = ? AND place_id = ?"),
+    ("remove_visited", "DELETE FROM visited_history WHERE user_id = ? AND place_id = ?"),
+    ("visited_by_user", "SELECT place_id, visited_at FROM visited_history WHERE user_id = ?"),
+    ("saved_contains", "SELECT 1 FROM saved_places WHERE user_id = ? AND place_id = ?"),
+    ("saved_by_user", "SELECT place_id FROM saved_places WHERE user_id = ?"),
+    ("get_feedback", "SELECT feedback_type FROM feedback WHERE user_id = ? AND place_id = ?"),
+    ("add_feedback_toggle", "DELETE FROM feedback WHERE user_id = ? AND place_id = ?"),
+    ("click_counts", "SELECT category, COUNT(*) as cnt FROM click_tracking WHERE user_id = ? AND category IS NOT NULL GROUP BY category"),
+    ("recent_recommendations", "SELECT place_id, rec_id, recommended_at, week FROM recent_recommendations WHERE user_id = ? AND recommended_at >= ? ORDER BY recommended_at DESC"),
+    ("recent_recommendation_by_rec_id", "SELECT place_id, rec_id, recommended_at, week FROM recent_recommendations WHERE user_id = ? AND rec_id = ? AND recommended_at >= ? ORDER BY recommended_at DESC LIMIT 1"),
+    ("served_recommendation", "SELECT place_id, item_blob, served_at FROM served_recommendations WHERE user_id = ? AND rec_id = ? AND expires_at >= ?"),
+    ("click_rollup_by_user", "SELECT category, SUM(clicks) FROM click_daily_rollup WHERE user_id = ? GROUP BY category"),
+    ("auth_tokens_by_user", "SELECT token FROM auth_tokens WHERE user_id = ?"),
+    ("geocode_cache", "SELECT lat, lng, source, expires_at FROM geocode_cache WHERE query_key = ? AND expires_at >= ?"),
+    ("reverse_geocode_cache", "SELECT city, county, state, display_name, source, expires_at FROM reverse_geocode_cache WHERE cell = ? AND expires_at >= ?"),
+]
+
+
+def check_query_plans():
+    """
+    Run EXPLAIN QUERY PLAN on the hot queries and return the ones that fall back to a
+    full table scan, as [{"name", "plan"}]. Empty list means every query uses an index.
+    """
+    problems = []
+    with get_conn() as c:
+        for name, sql in _HOT_QUERIES:
+            params = (None,) * sql.count("?")
+            plan = [row["detail"] for row in c.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+            if any(d.startswith("SCAN ") and "INDEX" not in d for d in plan):
+                problems.append({"name": name, "plan": plan})
+    return problems
+
+
+def init_db():
+    """Create tables and apply pending schema migrations."""
+    version = migrate()
+    for p in check_query_plans():
+        print(f"[DB] Query plan warning: {p['name']} does a table scan: {'; '.join(p['plan'])}")
+    print(f"[DB] Initialized SQLite at {DB_PATH} (schema v{version})")
 
 
 # ---------- Users ----------
@@ -297,18 +659,34 @@ def get_visited_list(user_id):
     ]
 
 
-def add_visited(user_id, place_id, visited_at=None, signal_type="manual", confidence=1.0):
+def add_visited(user_id, place_id, visited_at=None, signal_type="manual", confidence=1.0, category=None):
     visited_at = visited_at or datetime.now().isoformat()
     with get_conn() as c:
         c.execute(
-            "INSERT INTO visited_history (user_id, place_id, visited_at, signal_type, confidence) VALUES (?, ?, ?, ?, ?)",
-            (user_id, place_id, visited_at, signal_type, confidence)
+            "INSERT INTO visited_history (user_id, place_id, visited_at, signal_type, confidence, category) VALUES (?, ?, ?, ?, ?, ?)",
+            (user_id, place_id, visited_at, signal_type, confidence, category)
         )
+        _bump_affinity(c, user_id, category, weight=AFFINITY_WEIGHTS["visited"])
+
+
+def ensure_visited(user_id, place_id, visited_at=None, signal_type="manual", confidence=1.0, category=None):
+    """Add a visited row unless the place is already in the user's history (single transaction)."""
+    with get_conn() as c:
+        if c.execute("SELECT 1 FROM visited_history WHERE user_id = ? AND place_id = ?", (user_id, place_id)).fetchone():
+            return False
+        add_visited(user_id, place_id, visited_at=visited_at, signal_type=signal_type, confidence=confidence, category=category)
+    return True
 
 
 def remove_visited(user_id, place_id):
     with get_conn() as c:
+        rows = c.execute(
+            "SELECT category, COUNT(*) AS cnt FROM visited_history WHERE user_id = ? AND place_id = ? GROUP BY category",
+            (user_id, place_id)
+        ).fetchall()
         c.execute("DELETE FROM visited_history WHERE user_id = ? AND place_id = ?", (user_id, place_id))
+        for r in rows:
+            _bump_affinity(c, user_id, r["category"], weight=-AFFINITY_WEIGHTS["visited"] * r["cnt"])
 
 
 def visited_contains(user_id, place_id):
@@ -327,18 +705,34 @@ def get_saved_list(user_id):
     return [{"place_id": r["place_id"], "saved_at": r["saved_at"]} for r in rows]
 
 
-def add_saved(user_id, place_id, saved_at=None):
+def add_saved(user_id, place_id, saved_at=None, category=None):
     saved_at = saved_at or datetime.now().isoformat()
     with get_conn() as c:
         c.execute(
-            "INSERT INTO saved_places (user_id, place_id, saved_at) VALUES (?, ?, ?)",
-            (user_id, place_id, saved_at)
+            "INSERT INTO saved_places (user_id, place_id, saved_at, category) VALUES (?, ?, ?, ?)",
+            (user_id, place_id, saved_at, category)
         )
+        _bump_affinity(c, user_id, category, weight=AFFINITY_WEIGHTS["saved"])
+
+
+def ensure_saved(user_id, place_id, saved_at=None, category=None):
+    """Save a place unless it is already saved (single transaction)."""
+    with get_conn() as c:
+        if c.execute("SELECT 1 FROM saved_places WHERE user_id = ? AND place_id = ?", (user_id, place_id)).fetchone():
+            return False
+        add_saved(user_id, place_id, saved_at=saved_at, category=category)
+    return True
 
 
 def remove_saved(user_id, place_id):
     with get_conn() as c:
+        rows = c.execute(
+            "SELECT category, COUNT(*) AS cnt FROM saved_places WHERE user_id = ? AND place_id = ? GROUP BY category",
+            (user_id, place_id)
+        ).fetchall()
         c.execute("DELETE FROM saved_places WHERE user_id = ? AND place_id = ?", (user_id, place_id))
+        for r in rows:
+            _bump_affinity(c, user_id, r["category"], weight=-AFFINITY_WEIGHTS["saved"] * r["cnt"])
 
 
 def saved_contains(user_id, place_id):
@@ -348,11 +742,16 @@ def saved_contains(user_id, place_id):
 
 # ---------- Recent recommendations ----------
 
-def get_recent_recommendations_list(user_id):
+def _recent_cutoff(days=None):
+    return (datetime.now() - timedelta(days=days or RECENT_RECS_RETENTION_DAYS)).isoformat()
+
+
+def get_recent_recommendations_list(user_id, days=None):
+    """Recommendations shown in the last `days` (default RECENT_RECS_RETENTION_DAYS), newest first."""
     with get_conn() as c:
         rows = c.execute(
-            "SELECT place_id, rec_id, recommended_at, week FROM recent_recommendations WHERE user_id = ? ORDER BY recommended_at DESC",
-            (user_id,)
+            "SELECT place_id, rec_id, recommended_at, week FROM recent_recommendations WHERE user_id = ? AND recommended_at >= ? ORDER BY recommended_at DESC",
+            (user_id, _recent_cutoff(days))
         ).fetchall()
     return [
         {"place_id": r["place_id"], "rec_id": r["rec_id"], "recommended_at": r["recommended_at"], "week": r["week"]}
@@ -360,6 +759,17 @@ def get_recent_recommendations_list(user_id):
     ]
 
 
+def get_recent_recommendation(user_id, rec_id, days=None):
+    """Most recent recommendation with this rec_id for the user, or None (single index probe)."""
+    with get_conn() as c:
+        row = c.execute(
+            "SELECT place_id, rec_id, recommended_at, week FROM recent_recommendations "
+            "WHERE user_id = ? AND rec_id = ? AND recommended_at >= ? ORDER BY recommended_at DESC LIMIT 1",
+            (user_id, rec_id, _recent_cutoff(days))
+        ).fetchone()
+    return dict(row) if row else None
+
+
 def add_recent_recommendation(user_id, place_id, rec_id, week):
     now = datetime.now().isoformat()
     with get_conn() as c:
@@ -369,6 +779,53 @@ def add_recent_recommendation(user_id, place_id, rec_id, week):
         )
 
 
+# ---------- Served recommendations (rec_id -> snapshot) ----------
+
+def pack_served_items(items):
+    """Encode served items up front (see pack_recommendations) as rows for register_served_recommendations."""
+    return [
+        (item["rec_id"], item.get("place_id"), encode_items(item))
+        for item in items if isinstance(item, dict) and item.get("rec_id")
+    ]
+
+
+def register_served_recommendations(user_id, packed_rows, ttl_days=None):
+    """
+    Bulk upsert rows from pack_served_items. A rec_id served again for the same place takes
+    the newer snapshot; a rec_id already bound to another place keeps it (old cards must keep
+    resolving to what they showed).
+    """
+    if not packed_rows:
+        return
+    now = datetime.now()
+    expires_at = (now + timedelta(days=ttl_days or SERVED_RECS_TTL_DAYS)).isoformat()
+    with get_conn() as c:
+        c.executemany(
+            "INSERT INTO served_recommendations (user_id, rec_id, place_id, item_blob, served_at, expires_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(user_id, rec_id) DO UPDATE SET place_id = excluded.place_id, item_blob = excluded.item_blob, "
+            "served_at = excluded.served_at, expires_at = excluded.expires_at "
+            "WHERE served_recommendations.place_id = excluded.place_id",
+            [(user_id, rec_id, place_id, sqlite3.Binary(blob), now.isoformat(), expires_at)
+             for rec_id, place_id, blob in packed_rows]
+        )
+
+
+def get_served_recommendation(user_id, rec_id):
+    """{"place_id", "item", "served_at"} for an unexpired served rec_id, else None."""
+    with get_conn() as c:
+        row = c.execute(
+            "SELECT place_id, item_blob, served_at FROM served_recommendations WHERE user_id = ? AND rec_id = ? AND expires_at >= ?",
+            (user_id, rec_id, datetime.now().isoformat())
+        ).fetchone()
+    if not row:
+        return None
+    try:
+        item = decode_items(row["item_blob"])
+    except (ValueError, TypeError, zlib.error):
+        return None
+    return {"place_id": row["place_id"], "item": item, "served_at": row["served_at"]}
+
+
 # ---------- Auth tokens ----------
 
 def get_user_id_from_token(token):
@@ -472,6 +929,36 @@ def list_users_by_user_id():
     }
 
 
+def get_users_for_warming():
+    """
+    Every user with preferences plus their last activity (latest login token or click),
+    most recently active first; used by the cache warming scheduler.
+    """
+    with get_conn() as c:
+        rows = c.execute("""
+            SELECT u.user_id, u.identifier_type, u.email_digest, p.prefs_json,
+                   (SELECT MAX(created_at) FROM auth_tokens a WHERE a.user_id = u.user_id) AS last_login,
+                   (SELECT MAX(clicked_at) FROM click_tracking k WHERE k.user_id = u.user_id) AS last_click
+            FROM users u
+            INNER JOIN preferences p ON u.user_id = p.user_id
+        """).fetchall()
+    
+    result = []
+    for row in rows:
+        try:
+            prefs = json.loads(row["prefs_json"]) if row["prefs_json"] else {}
+        except (json.JSONDecodeError, TypeError):
+            prefs = {}
+        result.append({
+            "id": row["user_id"],
+            "preferences": prefs,
+            "email_digest": row["identifier_type"] in ('email', 'google') and row["email_digest"] != 0,
+            "last_active": max(filter(None, (row["last_login"], row["last_click"])), default=None),
+        })
+    result.sort(key=lambda u: u["last_active"] or "", reverse=True)
+    return result
+
+
 def get_all_users_with_preferences():
     """Get all users who have preferences set (for sending digest emails)."""
     with get_conn() as c:
@@ -503,29 +990,68 @@ def get_all_users_with_preferences():
 
 # ---------- Cached recommendations ----------
 
-def cache_recommendations(user_id, cache_key, items, expires_at=None):
-    """Cache recommendations for a user."""
-    from datetime import datetime, timedelta
-    
+# items_blob layout: one format-version byte followed by the payload.
+CACHE_FORMAT_ZLIB_JSON = 1
+CACHE_ZLIB_LEVEL = 6
+
+
+def encode_items(items):
+    """Serialize recommendation data (a list of item dicts, or one item) to a versioned, compressed blob."""
+    raw = json.dumps(items, separators=(",", ":")).encode("utf-8")
+    return bytes([CACHE_FORMAT_ZLIB_JSON]) + zlib.compress(raw, CACHE_ZLIB_LEVEL)
+
+
+def decode_items(blob):
+    """Inverse of encode_items. Raises ValueError on an unknown format byte."""
+    blob = bytes(blob)
+    if not blob:
+        raise ValueError("empty items blob")
+    if blob[0] == CACHE_FORMAT_ZLIB_JSON:
+        return json.loads(zlib.decompress(blob[1:]).decode("utf-8"))
+    raise ValueError(f"unknown items blob format {blob[0]}")
+
+
+def pack_recommendations(items):
+    """
+    Encode items for store_packed_recommendations. Done up front so the caller can hand
+    the result to the write-behind queue while it keeps using (and mutating) the items.
+    """
+    return {
+        "blob": encode_items(items),
+        "item_count": len(items),
+        "item_ids": json.dumps([i.get("place_id") for i in items if isinstance(i, dict)]),
+    }
+
+
+def store_packed_recommendations(user_id, cache_key, packed, expires_at=None):
+    """Upsert a payload from pack_recommendations into cached_recommendations."""
     now = datetime.now()
     expires_at = expires_at or (now + timedelta(hours=1)).isoformat()
-    
-    items_json = json.dumps(items)
-    
+    blob = sqlite3.Binary(packed["blob"])
     with get_conn() as c:
         c.execute(
-            "INSERT INTO cached_recommendations (user_id, cache_key, items_json, created_at, expires_at) VALUES (?, ?, ?, ?, ?) ON CONFLICT(user_id, cache_key) DO UPDATE SET items_json = ?, created_at = ?, expires_at = ?",
-            (user_id, cache_key, items_json, now.isoformat(), expires_at, items_json, now.isoformat(), expires_at)
+            "INSERT INTO cached_recommendations (user_id, cache_key, items_json, items_blob, item_count, item_ids, created_at, expires_at) "
+            "VALUES (?, ?, '', ?, ?, ?, ?, ?) "
+            "ON CONFLICT(user_id, cache_key) DO UPDATE SET items_json = '', items_blob = excluded.items_blob, "
+            "item_count = excluded.item_count, item_ids = excluded.item_ids, created_at = excluded.created_at, expires_at = excluded.expires_at",
+            (user_id, cache_key, blob, packed["item_count"], packed["item_ids"], now.isoformat(), expires_at)
         )
 
 
-def get_cached_recommendations(user_id, cache_key):
-    """Get cached recommendations for a user if they haven't expired."""
-    from datetime import datetime
-    
+def cache_recommendations(user_id, cache_key, items, expires_at=None):
+    """Cache recommendations for a user."""
+    store_packed_recommendations(user_id, cache_key, pack_recommendations(items), expires_at)
+
+
+def get_cached_recommendation_info(user_id, cache_key):
+    """
+    item_count, item_ids, created_at and expires_at of an unexpired cache row, or None.
+    Reads only the v4 metadata columns, never the payload. item_count/item_ids are None
+    for rows written before v4.
+    """
     with get_conn() as c:
         row = c.execute(
-            "SELECT items_json, created_at, expires_at FROM cached_recommendations WHERE user_id = ? AND cache_key = ?",
+            "SELECT item_count, item_ids, created_at, expires_at FROM cached_recommendations WHERE user_id = ? AND cache_key = ?",
             (user_id, cache_key)
         ).fetchone()
     
@@ -536,22 +1062,47 @@ def get_cached_recommendations(user_id, cache_key):
     try:
         expires_at = datetime.fromisoformat(row["expires_at"])
         if datetime.now() > expires_at:
-            # Clean up expired entry
-            with get_conn() as c:
-                c.execute("DELETE FROM cached_recommendations WHERE user_id = ? AND cache_key = ?", (user_id, cache_key))
             return None
     except (ValueError, TypeError):
         return None
     
+    return {
+        "item_count": row["item_count"],
+        "item_ids": json.loads(row["item_ids"]) if row["item_ids"] else None,
+        "created_at": row["created_at"],
+        "expires_at": row["expires_at"]
+    }
+
+
+def get_cached_recommendations(user_id, cache_key):
+    """
+    Get cached recommendations for a user if they haven't expired: the
+    get_cached_recommendation_info() fields plus the decoded "items". Expired and
+    empty rows are turned away from the metadata alone, without loading the payload.
+    Read-only: expired rows are left for purge_expired().
+    """
+    result = get_cached_recommendation_info(user_id, cache_key)
+    if not result or result["item_count"] == 0:
+        return None
+    
+    with get_conn() as c:
+        payload = c.execute(
+            "SELECT items_blob, items_json FROM cached_recommendations WHERE user_id = ? AND cache_key = ?",
+            (user_id, cache_key)
+        ).fetchone()
+    if not payload:
+        return None
     try:
-        items = json.loads(row["items_json"])
-        return {
-            "items": items,
-            "created_at": row["created_at"],
-            "expires_at": row["expires_at"]
-        }
-    except (json.JSONDecodeError, TypeError):
+        if payload["items_blob"] is not None:
+            items = decode_items(payload["items_blob"])
+        else:
+            items = json.loads(payload["items_json"])  # rows written before v4
+    except (ValueError, TypeError, zlib.error):
         return None
+    result["items"] = items
+    result["item_count"] = len(items)
+    result["item_ids"] = [i.get("place_id") for i in items if isinstance(i, dict)]
+    return result
 
 
 # ---------- Feedback (thumbs up/down) ----------
@@ -561,13 +1112,13 @@ def add_feedback(user_id, place_id, feedback_type, rec_id=None, category=None):
     now = datetime.now().isoformat()
     with get_conn() as c:
         # Remove any existing feedback for this user+place (toggle behavior)
+        _undo_feedback_affinity(c, user_id, place_id)
         c.execute("DELETE FROM feedback WHERE user_id = ? AND place_id = ?", (user_id, place_id))
         c.execute(
             "INSERT INTO feedback (user_id, place_id, rec_id, feedback_type, category, created_at) VALUES (?, ?, ?, ?, ?, ?)",
             (user_id, place_id, rec_id, feedback_type, category, now)
         )
-    # Invalidate affinity cache
-    invalidate_affinity_cache(user_id)
+        _bump_affinity(c, user_id, category, weight=AFFINITY_WEIGHTS.get(feedback_type, 0.0))
 
 
 def get_feedback(user_id, place_id):
@@ -592,8 +1143,8 @@ def get_all_feedback(user_id):
 
 def remove_feedback(user_id, place_id):
     with get_conn() as c:
+        _undo_feedback_affinity(c, user_id, place_id)
         c.execute("DELETE FROM feedback WHERE user_id = ? AND place_id = ?", (user_id, place_id))
-    invalidate_affinity_cache(user_id)
 
 
 # ---------- Click tracking ----------
@@ -605,69 +1156,367 @@ def add_click(user_id, place_id, rec_id=None, category=None):
             "INSERT INTO click_tracking (user_id, place_id, rec_id, category, clicked_at) VALUES (?, ?, ?, ?, ?)",
             (user_id, place_id, rec_id, category, now)
         )
+        _bump_affinity(c, user_id, category, clicks=1)
 
 
 def get_click_counts_by_category(user_id):
-    """Get click counts grouped by category."""
+    """Get click counts grouped by category (raw recent clicks plus the daily rollup)."""
     with get_conn() as c:
         rows = c.execute(
-            "SELECT category, COUNT(*) as cnt FROM click_tracking WHERE user_id = ? AND category IS NOT NULL GROUP BY category",
-            (user_id,)
+            "SELECT category, SUM(cnt) AS cnt FROM ("
+            "  SELECT category, COUNT(*) AS cnt FROM click_tracking WHERE user_id = ? AND category IS NOT NULL GROUP BY category"
+            "  UNION ALL SELECT category, SUM(clicks) FROM click_daily_rollup WHERE user_id = ? GROUP BY category"
+            ") GROUP BY category",
+            (user_id, user_id)
         ).fetchall()
     return {r["category"]: r["cnt"] for r in rows}
 
 
-# ---------- User affinity cache ----------
+def compact_clicks(batch_size=None, max_batches=None, pause_seconds=None):
+    """
+    Fold raw clicks older than CLICK_RAW_RETENTION_DAYS into click_daily_rollup and
+    delete them, oldest first, batch_size rows per transaction. Uncategorized clicks
+    carry no signal and are just dropped. Returns raw rows compacted.
+    """
+    batch_size = batch_size or JANITOR_BATCH_SIZE
+    max_batches = max_batches or JANITOR_MAX_BATCHES
+    pause_seconds = JANITOR_PAUSE_SECONDS if pause_seconds is None else pause_seconds
+    cutoff = (datetime.now() - timedelta(days=CLICK_RAW_RETENTION_DAYS)).isoformat()
+    compacted = 0
+    for i in range(max_batches):
+        with get_conn() as c:
+            ids = [r[0] for r in c.execute(
+                "SELECT id FROM click_tracking WHERE clicked_at < ? ORDER BY id LIMIT ?", (cutoff, batch_size)
+            )]
+            if not ids:
+                break
+            marks = ", ".join("?" * len(ids))
+            c.execute(
+                "INSERT INTO click_daily_rollup (user_id, category, day, clicks) "
+                f"SELECT user_id, category, substr(clicked_at, 1, 10), COUNT(*) FROM click_tracking "
+                f"WHERE id IN ({marks}) AND category IS NOT NULL GROUP BY user_id, category, substr(clicked_at, 1, 10) "
+                "ON CONFLICT(user_id, category, day) DO UPDATE SET clicks = clicks + excluded.clicks",
+                ids
+            )
+            c.execute(f"DELETE FROM click_tracking WHERE id IN ({marks})", ids)
+        compacted += len(ids)
+        if len(ids) < batch_size:
+            break
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    return compacted
+
+
+def compact_history():
+    """Retention pass for insert-only history tables. Returns {name: rows}."""
+    return {
+        "clicks_rolled_up": compact_clicks(),
+        "recent_recommendations": _delete_in_batches(
+            "recent_recommendations", "recommended_at < ?", (_recent_cutoff(),),
+            JANITOR_BATCH_SIZE, JANITOR_MAX_BATCHES, JANITOR_PAUSE_SECONDS
+        ),
+    }
+
+
+# ---------- Place catalog ----------
+
+PLACE_COLUMNS = ("place_id", "title", "category", "lat", "lng", "address", "photo_url",
+                 "source_url", "rating", "total_ratings", "price_flag", "source")
+
+
+def upsert_places(places):
+    """
+    Insert or refresh catalog rows (dicts keyed by PLACE_COLUMNS). A None field keeps
+    the stored value, so a sparse sighting never erases what an earlier one recorded.
+    """
+    if not places:
+        return
+    now = datetime.now().isoformat()
+    updates = ", ".join(f"{col} = COALESCE(excluded.{col}, {col})" for col in PLACE_COLUMNS[1:])
+    with get_conn() as c:
+        c.executemany(
+            f"INSERT INTO places ({', '.join(PLACE_COLUMNS)}, last_seen) VALUES ({', '.join('?' * (len(PLACE_COLUMNS) + 1))}) "
+            f"ON CONFLICT(place_id) DO UPDATE SET {updates}, last_seen = excluded.last_seen",
+            [tuple(p.get(col) for col in PLACE_COLUMNS) + (now,) for p in places if p.get("place_id")]
+        )
+
+
+def get_places(place_ids):
+    """Catalog rows for the given ids as {place_id: dict}; unknown ids are absent."""
+    place_ids = list(dict.fromkeys(pid for pid in place_ids if pid))
+    found = {}
+    with get_conn() as c:
+        for i in range(0, len(place_ids), 500):  # stay under SQLITE_MAX_VARIABLE_NUMBER
+            chunk = place_ids[i:i + 500]
+            rows = c.execute(
+                f"SELECT {', '.join(PLACE_COLUMNS)}, last_seen FROM places WHERE place_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            found.update((r["place_id"], dict(r)) for r in rows)
+    return found
+
+
+def get_place(place_id):
+    return get_places([place_id]).get(place_id)
 
-def get_affinity_cache(user_id):
-    """Get cached affinity scores. Returns dict or None if expired/missing."""
+
+# ---------- Geocode cache ----------
+
+def get_geocode(query_key):
+    """Unexpired geocode_cache row for a canonical query as a dict (lat/lng None = negative), or None."""
     with get_conn() as c:
         row = c.execute(
-            "SELECT affinity_json, computed_at FROM user_affinity_cache WHERE user_id = ?",
-            (user_id,)
+            "SELECT lat, lng, source, expires_at FROM geocode_cache WHERE query_key = ? AND expires_at >= ?",
+            (query_key, datetime.now().isoformat())
         ).fetchone()
-    if not row:
-        return None
-    # Check if older than 1 hour
-    try:
-        computed = datetime.fromisoformat(row["computed_at"])
-        if (datetime.now() - computed).total_seconds() > 3600:
-            return None
-    except (ValueError, TypeError):
-        return None
-    try:
-        return json.loads(row["affinity_json"])
-    except (json.JSONDecodeError, TypeError):
-        return None
+    return dict(row) if row else None
 
 
-def set_affinity_cache(user_id, affinity):
-    now = datetime.now().isoformat()
-    affinity_json = json.dumps(affinity)
+def put_geocode(query_key, lat, lng, source, expires_at):
     with get_conn() as c:
         c.execute(
-            "INSERT INTO user_affinity_cache (user_id, affinity_json, computed_at) VALUES (?, ?, ?) "
-            "ON CONFLICT(user_id) DO UPDATE SET affinity_json = ?, computed_at = ?",
-            (user_id, affinity_json, now, affinity_json, now)
+            "INSERT INTO geocode_cache (query_key, lat, lng, source, expires_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(query_key) DO UPDATE SET lat = excluded.lat, lng = excluded.lng, "
+            "source = excluded.source, expires_at = excluded.expires_at",
+            (query_key, lat, lng, source, expires_at)
         )
 
 
-def invalidate_affinity_cache(user_id):
+def get_reverse_geocode(cell):
+    """Unexpired reverse_geocode_cache row for a geohash cell as a dict (city/state None = negative), or None."""
     with get_conn() as c:
-        c.execute("DELETE FROM user_affinity_cache WHERE user_id = ?", (user_id,))
+        row = c.execute(
+            "SELECT city, county, state, display_name, source, expires_at FROM reverse_geocode_cache "
+            "WHERE cell = ? AND expires_at >= ?",
+            (cell, datetime.now().isoformat())
+        ).fetchone()
+    return dict(row) if row else None
 
 
-def clean_expired_cache():
-    """Clean up expired cached recommendations and photo cache."""
-    from datetime import datetime
-    
-    now = datetime.now().isoformat()
+def put_reverse_geocode(cell, city, county, state, display_name, source, expires_at):
     with get_conn() as c:
-        c.execute("DELETE FROM cached_recommendations WHERE expires_at < ?", (now,))
-        
-        # Clean photo cache older than 30 days
-        thirty_days_ago = (datetime.now() - timedelta(days=30)).isoformat()
-        c.execute("DELETE FROM place_photo_cache WHERE fetched_at < ?", (thirty_days_ago,))
+        c.execute(
+            "INSERT INTO reverse_geocode_cache (cell, city, county, state, display_name, source, expires_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(cell) DO UPDATE SET city = excluded.city, county = excluded.county, "
+            "state = excluded.state, display_name = excluded.display_name, "
+            "source = excluded.source, expires_at = excluded.expires_at",
+            (cell, city, county, state, display_name, source, expires_at)
+        )
+
+
+# ---------- Per-request user snapshot ----------
+
+def get_user_interactions(user_id):
+    """
+    Load everything the recommendation filters need about a user in one transaction:
+    visited rows, saved rows, feedback rows and normalized category affinity.
+    """
+    with get_conn() as c:
+        visited = c.execute(
+            "SELECT place_id, visited_at FROM visited_history WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        saved = c.execute(
+            "SELECT place_id FROM saved_places WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        feedback = c.execute(
+            "SELECT place_id, feedback_type, category FROM feedback WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        affinity = _read_affinity(c, user_id)
+    return {
+        "visited": [dict(r) for r in visited],
+        "saved": [r["place_id"] for r in saved],
+        "feedback": [dict(r) for r in feedback],
+        "affinity": affinity,
+    }
+
+
+# ---------- Category affinity ----------
+# Running counters per (user, category): weight sums the save/visit/feedback weights,
+# clicks is the raw click count (capped at read time). Writers above keep them in step
+# inside their own transaction; rebuild_category_affinity() recomputes from scratch.
+
+AFFINITY_WEIGHTS = {"saved": 0.3, "visited": 0.2, "thumbs_up": 0.4, "thumbs_down": -0.5}
+AFFINITY_CLICK_WEIGHT = 0.1
+AFFINITY_CLICK_CAP = 10
+
+
+def _bump_affinity(c, user_id, category, weight=0.0, clicks=0):
+    if not category or (not weight and not clicks):
+        return
+    c.execute(
+        "INSERT INTO user_category_affinity (user_id, category, weight, clicks, updated_at) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT(user_id, category) DO UPDATE SET weight = weight + excluded.weight, "
+        "clicks = MAX(clicks + excluded.clicks, 0), updated_at = excluded.updated_at",
+        (user_id, category, weight, clicks, datetime.now().isoformat())
+    )
+
+
+def _undo_feedback_affinity(c, user_id, place_id):
+    for r in c.execute(
+        "SELECT feedback_type, category FROM feedback WHERE user_id = ? AND place_id = ?", (user_id, place_id)
+    ).fetchall():
+        _bump_affinity(c, user_id, r["category"], weight=-AFFINITY_WEIGHTS.get(r["feedback_type"], 0.0))
+
+
+def _read_affinity(c, user_id):
+    rows = c.execute(
+        "SELECT category, weight, clicks FROM user_category_affinity WHERE user_id = ?", (user_id,)
+    ).fetchall()
+    affinity = {}
+    for r in rows:
+        score = r["weight"] + AFFINITY_CLICK_WEIGHT * min(r["clicks"], AFFINITY_CLICK_CAP)
+        if abs(score) > 1e-9:
+            affinity[r["category"]] = score
+    # Normalize to [-1, 1] range
+    if affinity:
+        max_abs = max(abs(v) for v in affinity.values()) or 1.0
+        if max_abs > 1.0:
+            affinity = {k: round(v / max_abs, 2) for k, v in affinity.items()}
+        else:
+            affinity = {k: round(v, 2) for k, v in affinity.items()}
+    return affinity
+
+
+def get_category_affinity(user_id):
+    """Normalized affinity scores, e.g. {"parks": 0.8, "museums": -0.2}; {} for new users."""
+    with get_conn() as c:
+        return _read_affinity(c, user_id)
+
+
+def _rebuild_affinity(c, user_id=None):
+    where = "category IS NOT NULL" + (" AND user_id = ?" if user_id else "")
+    # click_daily_rollup arrives in migration v8, after v6 first runs this
+    has_rollup = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'click_daily_rollup'").fetchone()
+    rollup = f"UNION ALL SELECT user_id, category, 0, clicks FROM click_daily_rollup WHERE {where}" if has_rollup else ""
+    params = (user_id,) * (5 if has_rollup else 4) if user_id else ()
+    if user_id:
+        c.execute("DELETE FROM user_category_affinity WHERE user_id = ?", (user_id,))
+    else:
+        c.execute("DELETE FROM user_category_affinity")
+    c.execute(f"""
+        INSERT INTO user_category_affinity (user_id, category, weight, clicks, updated_at)
+        SELECT user_id, category, SUM(w), SUM(n), ? FROM (
+            SELECT user_id, category, {AFFINITY_WEIGHTS["saved"]} AS w, 0 AS n FROM saved_places WHERE {where}
+            UNION ALL SELECT user_id, category, {AFFINITY_WEIGHTS["visited"]}, 0 FROM visited_history WHERE {where}
+            UNION ALL SELECT user_id, category,
+                CASE feedback_type WHEN 'thumbs_up' THEN {AFFINITY_WEIGHTS["thumbs_up"]}
+                                   WHEN 'thumbs_down' THEN {AFFINITY_WEIGHTS["thumbs_down"]} ELSE 0 END, 0
+                FROM feedback WHERE {where}
+            UNION ALL SELECT user_id, category, 0, 1 FROM click_tracking WHERE {where}
+            {rollup}
+        ) GROUP BY user_id, category
+    """, (datetime.now().isoformat(), *params))
+
+
+def rebuild_category_affinity(user_id=None):
+    """Recompute affinity counters from the interaction tables (one user, or everyone)."""
+    with get_conn() as c:
+        _rebuild_affinity(c, user_id)
+
+
+def clear_feedback_and_clicks(user_id):
+    """Delete a user's thumbs feedback and click history, keeping affinity in step."""
+    with get_conn() as c:
+        c.execute("DELETE FROM feedback WHERE user_id = ?", (user_id,))
+        c.execute("DELETE FROM click_tracking WHERE user_id = ?", (user_id,))
+        c.execute("DELETE FROM click_daily_rollup WHERE user_id = ?", (user_id,))
+        _rebuild_affinity(c, user_id)
+
+
+def _delete_in_batches(table, where, params, batch_size, max_batches, pause_seconds, key="rowid"):
+    """
+    Delete rows matching `where` at most batch_size per transaction, sleeping between
+    batches so request threads get the write lock in between. Returns rows deleted.
+    key: the row identity used to pick a batch; WITHOUT ROWID tables pass their primary key.
+    """
+    deleted = 0
+    for i in range(max_batches):
+        with get_conn() as c:
+            cur = c.execute(
+                f"DELETE FROM {table} WHERE ({key}) IN (SELECT {key} FROM {table} WHERE {where} LIMIT ?)",
+                (*params, batch_size)
+            )
+            n = cur.rowcount
+        deleted += n
+        if n < batch_size:
+            break
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    return deleted
+
+
+def purge_expired(batch_size=None, max_batches=None, pause_seconds=None):
+    """
+    Delete expired cache rows and tokens in small rate-limited batches.
+    Returns {table: rows_deleted}. A backlog larger than max_batches * batch_size
+    is simply finished by the next sweep.
+    """
+    batch_size = batch_size or JANITOR_BATCH_SIZE
+    max_batches = max_batches or JANITOR_MAX_BATCHES
+    pause_seconds = JANITOR_PAUSE_SECONDS if pause_seconds is None else pause_seconds
+    now = datetime.now()
+    rules = [
+        ("cached_recommendations", "expires_at < ?", (now.isoformat(),)),
+        ("place_photo_cache", "fetched_at < ?", ((now - timedelta(days=PHOTO_CACHE_TTL_DAYS)).isoformat(),)),
+        ("password_reset_tokens", "expires_at < ?", (now.isoformat(),)),
+        ("verification_tokens", "expires_at < ?", (now.isoformat(),)),
+        ("served_recommendations", "expires_at < ?", (now.isoformat(),), "user_id, rec_id"),
+        ("geocode_cache", "expires_at < ?", (now.isoformat(),), "query_key"),
+        ("reverse_geocode_cache", "expires_at < ?", (now.isoformat(),), "cell"),
+    ]
+    return {
+        table: _delete_in_batches(table, where, params, batch_size, max_batches, pause_seconds, *key)
+        for table, where, params, *key in rules
+    }
+
+
+def reclaim_space(max_pages=1000):
+    """
+    Return up to max_pages free pages to the OS (needs auto_vacuum=INCREMENTAL, see
+    migration v5). Returns pages freed.
+    """
+    with get_conn() as c:
+        freed = 0
+        if c.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            before = c.execute("PRAGMA freelist_count").fetchone()[0]
+            c.execute(f"PRAGMA incremental_vacuum({int(max_pages)})").fetchall()
+            freed = before - c.execute("PRAGMA freelist_count").fetchone()[0]
+    return freed
+
+
+def refresh_planner_stats():
+    """
+    Sampled ANALYZE of every table with at least STATS_MIN_ROWS rows whose size is
+    missing from sqlite_stat1 or has drifted STATS_DRIFT_FACTOR x from it. ANALYZE bumps
+    the schema cookie, so every pooled connection picks the new statistics up.
+    Returns the names of the tables analyzed.
+    """
+    analyzed = []
+    with get_conn() as c:
+        recorded = {}
+        if c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'").fetchone():
+            recorded = {row[0]: row[1] or 0 for row in c.execute(
+                "SELECT tbl, MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 GROUP BY tbl")}
+        tables = [row[0] for row in c.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        for table in tables:
+            rows = c.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            old = recorded.get(table)
+            if max(rows, old or 0) < STATS_MIN_ROWS:
+                continue
+            if old is None or rows > old * STATS_DRIFT_FACTOR or rows * STATS_DRIFT_FACTOR < old:
+                c.execute(f"ANALYZE {table}")
+                analyzed.append(table)
+    return analyzed
+
+
+def clean_expired_cache():
+    """
+    Clean up expired cached recommendations, served recommendation snapshots, photo cache,
+    geocode and reverse geocode cache rows, and password reset / verification tokens.
+    """
+    return purge_expired()
 
 
 # ---------- Place photo cache ----------
@@ -0,0 +1,90 @@
+"""
+Great-circle distance (haversine, miles) and drive-time estimates, for one point or
+for many at once.
+
+The batch functions take sequences of coordinates and run as NumPy array operations
+when NumPy is installed (requirements.txt), falling back to a loop over the scalar
+formula otherwise. They return plain Python lists either way, so results can go
+straight into JSON responses.
+"""
+
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EARTH_RADIUS_MILES = 3959
+MILES_PER_DEGREE_LAT = 69.0
+# Average speed (mph) behind every travel-time estimate
+AVG_SPEED_MPH = 25
+MIN_TRAVEL_MINUTES = 5
+
+
+def haversine_miles(lat1, lng1, lat2, lng2):
+    """Distance in miles between two points."""
+    lat1_rad, lat2_rad = math.radians(lat1), math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lng = math.radians(lng2 - lng1)
+    a = math.sin(delta_lat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lng / 2) ** 2
+    return EARTH_RADIUS_MILES * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def travel_minutes(distance_miles, avg_mph=AVG_SPEED_MPH):
+    """Estimated drive time in minutes for a distance, never under MIN_TRAVEL_MINUTES."""
+    if distance_miles <= 0:
+        return MIN_TRAVEL_MINUTES
+    return max(MIN_TRAVEL_MINUTES, int(round((distance_miles / avg_mph) * 60)))
+
+
+def distances_miles(lat, lng, lats, lngs):
+    """Distances in miles from (lat, lng) to each point of lats/lngs, as a list."""
+    if np is None:
+        return [haversine_miles(lat, lng, la, lo) for la, lo in zip(lats, lngs)]
+    lats_rad = np.radians(np.asarray(lats, dtype=float))
+    lngs_rad = np.radians(np.asarray(lngs, dtype=float))
+    lat_rad = math.radians(lat)
+    a = (np.sin((lats_rad - lat_rad) / 2) ** 2
+         + math.cos(lat_rad) * np.cos(lats_rad) * np.sin((lngs_rad - math.radians(lng)) / 2) ** 2)
+    return (EARTH_RADIUS_MILES * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))).tolist()
+
+
+def travel_minutes_many(distances, avg_mph=AVG_SPEED_MPH):
+    """travel_minutes() for each distance, as a list of ints."""
+    if np is None:
+        return [travel_minutes(d, avg_mph) for d in distances]
+    minutes = np.rint(np.asarray(distances, dtype=float) / avg_mph * 60)
+    return np.maximum(minutes, MIN_TRAVEL_MINUTES).astype(int).tolist()
+
+
+def measure(lat, lng, lats, lngs, avg_mph=AVG_SPEED_MPH):
+    """(distances in miles, travel minutes) from (lat, lng) to each point, in one pass."""
+    dists = distances_miles(lat, lng, lats, lngs)
+    return dists, travel_minutes_many(dists, avg_mph)
+
+
+def bounding_box(lat, lng, radius_miles):
+    """(south, west, north, east) of a box containing every point within radius_miles."""
+    lat_delta = radius_miles / MILES_PER_DEGREE_LAT
+    lng_delta = radius_miles / (MILES_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+    return lat - lat_delta, lng - lng_delta, lat + lat_delta, lng + lng_delta
+
+
+def within_radius(lat, lng, lats, lngs, radius_miles):
+    """
+    [(index, distance in miles)] for the points within radius_miles of (lat, lng), in
+    input order. A bounding-box test discards far points before any trigonometry.
+    """
+    south, west, north, east = bounding_box(lat, lng, radius_miles)
+    if np is None:
+        candidates = [i for i, (la, lo) in enumerate(zip(lats, lngs))
+                      if south <= la <= north and west <= lo <= east]
+    else:
+        lat_arr, lng_arr = np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float)
+        in_box = (lat_arr >= south) & (lat_arr <= north) & (lng_arr >= west) & (lng_arr <= east)
+        candidates = np.flatnonzero(in_box).tolist()
+    if not candidates:
+        return []
+    dists = distances_miles(lat, lng, [lats[i] for i in candidates], [lngs[i] for i in candidates])
+    return [(i, d) for i, d in zip(candidates, dists) if d <= radius_miles]
@@ -0,0 +1,347 @@
+"""
+Offline gazetteer: US place names, ZIP centroids and a nearest-place index from a
+memory-mapped file.
+
+The file (GAZETTEER_PATH, default data/gazetteer.bin) is built by
+scripts/build_gazetteer.py from GeoNames dumps plus data/gazetteer_seed.csv. Layout,
+all little-endian:
+
+  header   magic b'GAZ1', version u16, reserved u16, n_names u32, n_zips u32,
+           blob_len u32, n_points u32 (version 1 files: reserved, always 0)
+  names    n_names x (key_offset u32, key_len u16, pad u16, lat_e5 i32, lng_e5 i32),
+           sorted by key bytes
+  zips     n_zips x (zip u32, lat_e5 i32, lng_e5 i32), sorted by zip
+  points   n_points x (cell u32, lat_e5 i32, lng_e5 i32, name_offset u32, name_len u16,
+           state 2s), sorted by cell: a 0.1 degree grid cell, for reverse lookups
+  blob     the name keys (ASCII) and point display names (UTF-8)
+
+Name keys are normalized (normalize_name) as "name,st" plus a bare "name" for the
+best-known place of that name, so lookups are a binary search over the mapped
+arrays and the file is shared between worker processes through the page cache.
+"""
+
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import unicodedata
+
+GAZETTEER_PATH = os.environ.get(
+    'GAZETTEER_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer.bin'))
+
+_MAGIC = b'GAZ1'
+_VERSION = 2
+_HEADER = struct.Struct('<4sHHIIII')
+_NAME = struct.Struct('<IHxxii')
+_ZIP = struct.Struct('<Iii')
+_POINT = struct.Struct('<IiiIH2s')
+_SCALE = 100000
+_GRID = 10          # point cells per degree
+_GRID_COLS = 360 * _GRID
+_KM_PER_DEGREE = 111.2
+
+# Farthest a place centroid may be from a point for nearest_place() to name it
+GAZETTEER_NEAREST_MAX_KM = float(os.environ.get('GAZETTEER_NEAREST_MAX_KM', '15'))
+
+US_STATES = {
+    'alabama': 'AL', 'alaska': 'AK', 'arizona': 'AZ', 'arkansas': 'AR', 'california': 'CA',
+    'colorado': 'CO', 'connecticut': 'CT', 'delaware': 'DE', 'district of columbia': 'DC',
+    'florida': 'FL', 'georgia': 'GA', 'hawaii': 'HI', 'idaho': 'ID', 'illinois': 'IL',
+    'indiana': 'IN', 'iowa': 'IA', 'kansas': 'KS', 'kentucky': 'KY', 'louisiana': 'LA',
+    'maine': 'ME', 'maryland': 'MD', 'massachusetts': 'MA', 'michigan': 'MI', 'minnesota': 'MN',
+    'mississippi': 'MS', 'missouri': 'MO', 'montana': 'MT', 'nebraska': 'NE', 'nevada': 'NV',
+    'new hampshire': 'NH', 'new jersey': 'NJ', 'new mexico': 'NM', 'new york': 'NY',
+    'north carolina': 'NC', 'north dakota': 'ND', 'ohio': 'OH', 'oklahoma': 'OK', 'oregon': 'OR',
+    'pennsylvania': 'PA', 'rhode island': 'RI', 'south carolina': 'SC', 'south dakota': 'SD',
+    'tennessee': 'TN', 'texas': 'TX', 'utah': 'UT', 'vermont': 'VT', 'virginia': 'VA',
+    'washington': 'WA', 'west virginia': 'WV', 'wisconsin': 'WI', 'wyoming': 'WY',
+    'puerto rico': 'PR',
+}
+_STATE_CODES = set(US_STATES.values())
+_STATE_NAMES = {code: ' '.join(w if w == 'of' else w.capitalize() for w in name.split())
+                for name, code in US_STATES.items()}
+
+_COUNTRY_PARTS = {'usa', 'us', 'u s a', 'united states', 'united states of america'}
+_ZIP_RE = re.compile(r'\b(\d{5})(?:-\d{4})?\b')
+# A house number followed by a street name: "123 Main St", "4500 W. Elm Ave"
+_STREET_RE = re.compile(r'^\s*\d+[a-z]?(?:-\d+)?\s+[a-z]', re.IGNORECASE)
+
+_lock = threading.Lock()
+_instance = None
+_load_failed = False
+_stats = {'name_hits': 0, 'name_misses': 0, 'zip_hits': 0, 'zip_misses': 0, 'point_hits': 0, 'point_misses': 0}
+
+
+def normalize_name(name):
+    """Lowercase ASCII with punctuation dropped: 'St. Helena' -> 'st helena', 'Saint Paul' -> 'st paul'."""
+    text = unicodedata.normalize('NFKD', str(name or '')).encode('ascii', 'ignore').decode('ascii').lower()
+    text = text.replace('&', ' and ')
+    text = re.sub(r"[.'`]", '', text)
+    text = re.sub(r'[^a-z0-9]+', ' ', text).strip()
+    text = re.sub(r'^(saint|ste?) ', 'st ', text)
+    text = re.sub(r'^(mount|mt) ', 'mt ', text)
+    return re.sub(r'^(fort|ft) ', 'ft ', text)
+
+
+def state_code(value):
+    """Two-letter code for a state name or code ('California', 'ca' -> 'CA'), else None."""
+    text = normalize_name(value)
+    if text.upper() in _STATE_CODES:
+        return text.upper()
+    return US_STATES.get(text)
+
+
+def state_name(code):
+    """Full state name for a two-letter code ('CA' -> 'California'), else None."""
+    return _STATE_NAMES.get(str(code or '').upper())
+
+
+def _cell(lat, lng):
+    return int((lat + 90) * _GRID) * _GRID_COLS + int((lng + 180) * _GRID) % _GRID_COLS
+
+
+def name_key(name, state=None):
+    name = normalize_name(name)
+    return f"{name},{state.lower()}" if state else name
+
+
+class Gazetteer:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.n_names, self.n_zips, blob_len, self.n_points = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version not in (1, _VERSION):
+            raise ValueError(f"not a gazetteer file (magic={magic!r}, version={version})")
+        self._names_at = _HEADER.size
+        self._zips_at = self._names_at + self.n_names * _NAME.size
+        self._points_at = self._zips_at + self.n_zips * _ZIP.size
+        self._blob_at = self._points_at + self.n_points * _POINT.size
+        if self._blob_at + blob_len > len(self._mm):
+            raise ValueError("truncated gazetteer file")
+
+    def _key(self, i):
+        offset, length, _, _ = _NAME.unpack_from(self._mm, self._names_at + i * _NAME.size)
+        start = self._blob_at + offset
+        return self._mm[start:start + length]
+
+    def name(self, key):
+        """(lat, lng) for an exact normalized key, or None."""
+        target = key.encode('ascii', 'ignore')
+        lo, hi = 0, self.n_names
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_names and self._key(lo) == target:
+            _, _, lat, lng = _NAME.unpack_from(self._mm, self._names_at + lo * _NAME.size)
+            return (lat / _SCALE, lng / _SCALE)
+        return None
+
+    def zip(self, code):
+        """(lat, lng) centroid for a 5-digit ZIP (int), or None."""
+        lo, hi = 0, self.n_zips
+        while lo < hi:
+            mid = (lo + hi) // 2
+            zip_code, lat, lng = _ZIP.unpack_from(self._mm, self._zips_at + mid * _ZIP.size)
+            if zip_code == code:
+                return (lat / _SCALE, lng / _SCALE)
+            if zip_code < code:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def _first_point(self, cell):
+        """Index of the first point with a cell >= cell."""
+        lo, hi = 0, self.n_points
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if struct.unpack_from('<I', self._mm, self._points_at + mid * _POINT.size)[0] < cell:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def nearest(self, lat, lng, max_km):
+        """(name, state_code, distance_km) of the closest point within max_km, or None."""
+        if not self.n_points:
+            return None
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        row_span = int(math.ceil(max_km / _KM_PER_DEGREE * _GRID))
+        col_span = min(int(math.ceil(max_km / (_KM_PER_DEGREE * cos_lat) * _GRID)), _GRID_COLS // 2)
+        row, col = int((lat + 90) * _GRID), int((lng + 180) * _GRID)
+        best = None
+        for r in range(max(row - row_span, 0), min(row + row_span, 180 * _GRID) + 1):
+            # Cells of one grid row are contiguous, so each row is one range scan
+            i = self._first_point(r * _GRID_COLS + max(col - col_span, 0))
+            end = r * _GRID_COLS + min(col + col_span, _GRID_COLS - 1)
+            while i < self.n_points:
+                cell, p_lat, p_lng, offset, length, state = _POINT.unpack_from(self._mm, self._points_at + i * _POINT.size)
+                if cell > end:
+                    break
+                # Equirectangular distance: plenty for ranking points a few km apart
+                d_lat = p_lat / _SCALE - lat
+                d_lng = (p_lng / _SCALE - lng) * cos_lat
+                km = math.hypot(d_lat, d_lng) * _KM_PER_DEGREE
+                if km <= max_km and (best is None or km < best[2]):
+                    best = (offset, length, km, state)
+                i += 1
+        if best is None:
+            return None
+        offset, length, km, state = best
+        start = self._blob_at + offset
+        return self._mm[start:start + length].decode('utf-8'), state.decode('ascii'), km
+
+
+def write(path, names, zips, points=()):
+    """
+    Write a gazetteer file atomically. names: {key: (lat, lng)} with keys from name_key();
+    zips: {int_zip: (lat, lng)}; points: (display name, state code, lat, lng) tuples for
+    nearest_place().
+    """
+    keys = sorted(names, key=lambda k: k.encode('ascii'))
+    blob = bytearray()
+    name_rows = bytearray()
+    for key in keys:
+        raw = key.encode('ascii')
+        lat, lng = names[key]
+        name_rows += _NAME.pack(len(blob), len(raw), round(lat * _SCALE), round(lng * _SCALE))
+        blob += raw
+    zip_rows = bytearray()
+    for code in sorted(zips):
+        lat, lng = zips[code]
+        zip_rows += _ZIP.pack(code, round(lat * _SCALE), round(lng * _SCALE))
+    point_rows = bytearray()
+    points = sorted(points, key=lambda p: (_cell(p[2], p[3]), p[0]))
+    for name, state, lat, lng in points:
+        raw = name.encode('utf-8')[:0xFFFF]
+        point_rows += _POINT.pack(_cell(lat, lng), round(lat * _SCALE), round(lng * _SCALE),
+                                  len(blob), len(raw), state.upper().encode('ascii')[:2])
+        blob += raw
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, 0, len(keys), len(zips), len(blob), len(points)))
+        f.write(name_rows)
+        f.write(zip_rows)
+        f.write(point_rows)
+        f.write(blob)
+    os.replace(tmp_path, path)
+    return len(keys), len(zips), len(points)
+
+
+def _get():
+    global _instance, _load_failed
+    if _instance is not None or _load_failed:
+        return _instance
+    with _lock:
+        if _instance is None and not _load_failed:
+            try:
+                _instance = Gazetteer(GAZETTEER_PATH)
+                print(f"[GAZETTEER] Loaded {_instance.n_names} names, {_instance.n_zips} ZIPs, "
+                      f"{_instance.n_points} places for reverse lookups from {GAZETTEER_PATH}")
+            except (OSError, ValueError) as e:
+                _load_failed = True
+                print(f"[GAZETTEER] Unavailable ({e}); geocoding falls back to Nominatim")
+    return _instance
+
+
+def lookup_zip(code):
+    gaz = _get()
+    try:
+        result = gaz.zip(int(code)) if gaz else None
+    except (TypeError, ValueError):
+        result = None
+    _stats['zip_hits' if result else 'zip_misses'] += 1
+    return result
+
+
+def lookup_place(name, state=None):
+    """
+    Centroid of a place by name. With a state only that state's place matches; without
+    one, the best-known place of that name (seed entries, then the most populous).
+    """
+    gaz = _get()
+    result = None
+    if gaz and normalize_name(name):
+        result = gaz.name(name_key(name, state))
+    _stats['name_hits' if result else 'name_misses'] += 1
+    return result
+
+
+def is_street_address(query):
+    """True for strings with a house-number + street part ('123 Main St, Fremont, CA')."""
+    return any(_STREET_RE.match(part) for part in str(query or '').split(','))
+
+
+def geocode(query):
+    """
+    (lat, lng) for a ZIP, 'City', 'City, ST', 'Venue, City, State ZIP' and similar, from the
+    gazetteer only: a trailing ZIP wins, otherwise the comma parts are tried from the end,
+    skipping country / state parts and street lines. None if nothing matches.
+    """
+    text = re.sub(r'\([^)]*\)', '', str(query or '')).strip()
+    if not text:
+        return None
+    parts = [p.strip() for p in text.split(',') if p.strip()]
+    while parts and normalize_name(parts[-1]) in _COUNTRY_PARTS:
+        parts.pop()
+    if not parts:
+        return None
+
+    zip_match = _ZIP_RE.search(parts[-1])
+    if zip_match:
+        result = lookup_zip(zip_match.group(1))
+        if result:
+            return result
+
+    state = None
+    last = _ZIP_RE.sub('', parts[-1]).strip()
+    if state_code(last) and (len(parts) > 1 or not last.isalpha() or len(last) == 2):
+        state = state_code(last)
+        parts.pop()
+    elif last != parts[-1]:
+        # "Fremont CA 94536" without a comma before the state
+        words = last.rsplit(' ', 1)
+        if len(words) == 2 and state_code(words[1]):
+            state = state_code(words[1])
+            parts[-1] = words[0]
+
+    for part in reversed(parts):
+        if _STREET_RE.match(part):
+            continue
+        result = lookup_place(part, state)
+        if result:
+            return result
+    return None
+
+
+def nearest_place(lat, lng, max_km=GAZETTEER_NEAREST_MAX_KM):
+    """(city, state_code) of the closest indexed place within max_km of a point, or None."""
+    gaz = _get()
+    try:
+        found = gaz.nearest(float(lat), float(lng), max_km) if gaz else None
+    except (TypeError, ValueError):
+        found = None
+    _stats['point_hits' if found else 'point_misses'] += 1
+    return found[:2] if found else None
+
+
+def available():
+    return _get() is not None
+
+
+def get_metrics():
+    gaz = _get()
+    return {
+        'path': GAZETTEER_PATH,
+        'available': gaz is not None,
+        'names': gaz.n_names if gaz else 0,
+        'zips': gaz.n_zips if gaz else 0,
+        'points': gaz.n_points if gaz else 0,
+        **_stats,
+    }
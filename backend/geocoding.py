@@ -0,0 +1,324 @@
+"""
+Geocode cache shared by every worker: canonical query -> (lat, lng), or a negative
+result. Backed by the `geocode_cache` table (db.py, written through the write-behind
+queue) with an in-process LRU in front. Positive and negative results get separate
+TTLs, so a transient upstream miss is retried after GEOCODE_NEGATIVE_TTL_SECONDS
+instead of sticking until restart.
+
+geocode() / geocode_many() are the full forward pipeline every caller uses: raw
+coordinates, then the offline gazetteer, then this cache, then Nominatim through the
+shared scheduler (nominatim.py).
+
+reverse() answers city/state for a point. Points are quantized to a geohash cell
+(REVERSE_GEOHASH_PRECISION, ~5 km at the default 5), so every point in a neighbourhood
+shares one `reverse_geocode_cache` row; unseen cells use the gazetteer's nearest place
+and only go to Nominatim where the gazetteer knows nothing close by.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import db
+import gazetteer
+import nominatim
+import write_queue
+
+GEOCODE_LRU_SIZE = int(os.environ.get('GEOCODE_LRU_SIZE', '5000'))
+GEOCODE_TTL_SECONDS = int(os.environ.get('GEOCODE_TTL_SECONDS', str(30 * 86400)))
+GEOCODE_NEGATIVE_TTL_SECONDS = int(os.environ.get('GEOCODE_NEGATIVE_TTL_SECONDS', '3600'))
+REVERSE_GEOHASH_PRECISION = int(os.environ.get('REVERSE_GEOHASH_PRECISION', '5'))
+
+_GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+_COORDS_RE = re.compile(r'^(-?\d+\.\d+)\s*,\s*(-?\d+\.\d+)$')
+_STATE_SUFFIX_RE = re.compile(r',\s*[A-Z]{2}\s*(\d{5})?$')
+_COUNTRY_SUFFIX_RE = re.compile(r'(,\s*(usa|u\.s\.a\.?|us|united states( of america)?))+$')
+
+_lru = OrderedDict()   # canonical key -> (coords or None, expires_at unix time)
+_reverse_lru = OrderedDict()   # geohash cell -> (place dict or None, expires_at unix time)
+_lock = threading.Lock()
+_stats = {'lru_hits': 0, 'db_hits': 0, 'misses': 0, 'negative_hits': 0, 'stored': 0, 'stored_negative': 0,
+          'reverse_cell_hits': 0, 'reverse_gazetteer': 0, 'reverse_network': 0, 'reverse_failed': 0}
+
+
+def canonical_key(query):
+    """
+    One key per place however it is spelled: lowercase, single spaces, pipe-separated
+    venue strings as comma parts, no empty parts and no trailing country.
+    'Venue | Oakland,  CA, USA' -> 'venue, oakland, ca'
+    """
+    text = str(query or '').lower().replace('|', ',')
+    parts = [' '.join(part.split()) for part in text.split(',')]
+    text = ', '.join(part for part in parts if part)
+    return _COUNTRY_SUFFIX_RE.sub('', text).strip(' ,')
+
+
+def _remember(cache, key, value, expires_at):
+    # Caller holds _lock
+    cache[key] = (value, expires_at)
+    cache.move_to_end(key)
+    while len(cache) > GEOCODE_LRU_SIZE:
+        cache.popitem(last=False)
+
+
+def lookup(query):
+    """
+    (hit, coords) for a query: hit is False when nothing unexpired is cached; on a hit,
+    coords is (lat, lng) or None for a cached negative result.
+    """
+    key = canonical_key(query)
+    if not key:
+        return False, None
+    now = time.time()
+    with _lock:
+        cached = _lru.get(key)
+        if cached is not None:
+            coords, expires_at = cached
+            if expires_at > now:
+                _lru.move_to_end(key)
+                _stats['lru_hits'] += 1
+                if coords is None:
+                    _stats['negative_hits'] += 1
+                return True, coords
+            del _lru[key]
+    row = db.get_geocode(key)
+    with _lock:
+        if row is None:
+            _stats['misses'] += 1
+            return False, None
+        coords = (row['lat'], row['lng']) if row['lat'] is not None and row['lng'] is not None else None
+        _remember(_lru, key, coords, datetime.fromisoformat(row['expires_at']).timestamp())
+        _stats['db_hits'] += 1
+        if coords is None:
+            _stats['negative_hits'] += 1
+    return True, coords
+
+
+def store(query, coords, source='nominatim'):
+    """Cache a result for every worker: coords=(lat, lng), or None for 'no such place'."""
+    key = canonical_key(query)
+    if not key:
+        return
+    ttl = GEOCODE_TTL_SECONDS if coords else GEOCODE_NEGATIVE_TTL_SECONDS
+    expires_at = datetime.now() + timedelta(seconds=ttl)
+    lat, lng = coords if coords else (None, None)
+    with _lock:
+        _remember(_lru, key, tuple(coords) if coords else None, expires_at.timestamp())
+        _stats['stored' if coords else 'stored_negative'] += 1
+    write_queue.enqueue_shared('put_geocode', key, lat, lng, source, expires_at.isoformat())
+
+
+def _coordinates(query):
+    """(lat, lng) when the query is already a coordinate pair ("37.7922, -122.4583")."""
+    match = _COORDS_RE.match(query)
+    if match:
+        lat, lng = float(match.group(1)), float(match.group(2))
+        if -90 <= lat <= 90 and -180 <= lng <= 180:
+            return (lat, lng)
+    return None
+
+
+def _search_text(query):
+    """The string sent to Nominatim: US ZIPs and 'City, ST' forms get ', USA' appended."""
+    if (query.isdigit() and len(query) == 5) or _STATE_SUFFIX_RE.search(query.upper()):
+        return f"{query}, USA"
+    return query
+
+
+def _offline(query):
+    """
+    (done, coords) without touching the network. done is False when Nominatim should
+    still be asked; coords is then the gazetteer's city centroid (or None) as fallback.
+    Street addresses are never done offline unless cached, so they get a precise point.
+    """
+    coords = _coordinates(query)
+    if coords:
+        return True, coords
+    street = gazetteer.is_street_address(query)
+    place = gazetteer.geocode(query)
+    if place and not street:
+        return True, place
+    hit, cached = lookup(query)
+    if hit:
+        return True, cached or place
+    return False, place
+
+
+def _store_answer(query, data, place):
+    """Cache a Nominatim search answer; None (no answer) is not cached, [] is a negative entry."""
+    if data is None:
+        return place
+    if not data:
+        print(f"[GEOCODE] No results for '{query}'")
+        store(query, None)
+        return place
+    try:
+        coords = (float(data[0]["lat"]), float(data[0]["lon"]))
+    except (KeyError, TypeError, ValueError):
+        return place
+    store(query, coords)
+    print(f"[GEOCODE] Found: '{query}' -> {coords}")
+    return coords
+
+
+def needs_network(query):
+    """True when geocode(query) would have to ask Nominatim."""
+    query = (query or "").strip()
+    return bool(query) and not _offline(query)[0]
+
+
+def geocode(query, network=True, timeout=nominatim.NOMINATIM_WAIT_SECONDS):
+    """
+    (lat, lng) for a ZIP, place name, address or coordinate string, or None.
+    network=False answers from the gazetteer and cache only. Nominatim failures
+    (throttling, HTTP errors, no answer within timeout) are not cached.
+    """
+    query = (query or "").strip()
+    if not query:
+        return None
+    done, coords = _offline(query)
+    if done or not network:
+        return coords
+    print(f"[GEOCODE] Searching for: '{query}'")
+    return _store_answer(query, nominatim.search(_search_text(query), timeout=timeout), coords)
+
+
+def geocode_many(queries, timeout):
+    """
+    Geocode a batch within timeout seconds: offline answers first, the rest through the
+    Nominatim queue at batch priority. Returns {query: (lat, lng) or None}; queries
+    Nominatim did not get to in time fall back to their offline answer.
+    """
+    results, pending = {}, {}
+    for query in dict.fromkeys((q or "").strip() for q in queries):
+        if not query:
+            continue
+        done, coords = _offline(query)
+        results[query] = coords
+        if not done:
+            pending[query] = _search_text(query)
+    if pending and timeout > 0:
+        answers = nominatim.search_many(list(pending.values()), timeout)
+        for query, text in pending.items():
+            results[query] = _store_answer(query, answers.get(text), results[query])
+    return results
+
+
+def geohash(lat, lng, precision=REVERSE_GEOHASH_PRECISION):
+    """Standard base32 geohash of a point: nearby points share a prefix."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def _place(city, county, state, display_name, source, cell):
+    state_code = gazetteer.state_code(state) if state else None
+    return {'city': city or None, 'county': county or None, 'state': state or None,
+            'state_code': state_code, 'display_name': display_name or None, 'source': source, 'cell': cell}
+
+
+def _lookup_cell(cell):
+    """(hit, place) from the reverse LRU / db for a geohash cell; place None = cached negative."""
+    now = time.time()
+    with _lock:
+        cached = _reverse_lru.get(cell)
+        if cached is not None:
+            place, expires_at = cached
+            if expires_at > now:
+                _reverse_lru.move_to_end(cell)
+                return True, place
+            del _reverse_lru[cell]
+    row = db.get_reverse_geocode(cell)
+    if row is None:
+        return False, None
+    place = None
+    if row['city'] or row['county'] or row['state']:
+        place = _place(row['city'], row['county'], row['state'], row['display_name'], row['source'], cell)
+    with _lock:
+        _remember(_reverse_lru, cell, place, datetime.fromisoformat(row['expires_at']).timestamp())
+    return True, place
+
+
+def _store_cell(cell, place):
+    ttl = GEOCODE_TTL_SECONDS if place else GEOCODE_NEGATIVE_TTL_SECONDS
+    expires_at = datetime.now() + timedelta(seconds=ttl)
+    with _lock:
+        _remember(_reverse_lru, cell, place, expires_at.timestamp())
+    place = place or {}
+    write_queue.enqueue_shared('put_reverse_geocode', cell, place.get('city'), place.get('county'),
+                               place.get('state'), place.get('display_name'), 'nominatim', expires_at.isoformat())
+
+
+def reverse(lat, lng, network=True, timeout=nominatim.NOMINATIM_WAIT_SECONDS):
+    """
+    City-level place for a point: {'city', 'county', 'state', 'state_code', 'display_name',
+    'source', 'cell'}, or None. Tries the cell cache, then the gazetteer's nearest place,
+    then (network=True) Nominatim at city zoom, whose answer is cached for the whole cell.
+    Nominatim failures are not cached; "nothing here" is, for GEOCODE_NEGATIVE_TTL_SECONDS.
+    """
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+    cell = geohash(lat, lng)
+    hit, place = _lookup_cell(cell)
+    if hit:
+        with _lock:
+            _stats['reverse_cell_hits'] += 1
+        return place
+
+    nearest = gazetteer.nearest_place(lat, lng)
+    if nearest:
+        city, code = nearest
+        state = gazetteer.state_name(code) or code
+        with _lock:
+            _stats['reverse_gazetteer'] += 1
+        return _place(city, None, state, f"{city}, {state}, United States", 'gazetteer', cell)
+
+    data = nominatim.reverse(lat, lng, zoom=10, timeout=timeout) if network else None
+    if data is None:
+        with _lock:
+            _stats['reverse_failed'] += 1
+        return None
+    addr = data.get('address') or {}
+    place = None
+    if addr:
+        place = _place(addr.get('city') or addr.get('town') or addr.get('village'), addr.get('county'),
+                       addr.get('state'), data.get('display_name'), 'nominatim', cell)
+    with _lock:
+        _stats['reverse_network'] += 1
+    _store_cell(cell, place)
+    return place
+
+
+def get_metrics():
+    with _lock:
+        lookups = _stats['lru_hits'] + _stats['db_hits'] + _stats['misses']
+        return {
+            'lru_size': len(_lru),
+            'reverse_lru_size': len(_reverse_lru),
+            'reverse_geohash_precision': REVERSE_GEOHASH_PRECISION,
+            'lru_capacity': GEOCODE_LRU_SIZE,
+            'ttl_seconds': GEOCODE_TTL_SECONDS,
+            'negative_ttl_seconds': GEOCODE_NEGATIVE_TTL_SECONDS,
+            'hit_rate': round((_stats['lru_hits'] + _stats['db_hits']) / lookups, 3) if lookups else None,
+            **_stats,
+        }
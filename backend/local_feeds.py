@@ -7,12 +7,17 @@ All items are normalized to the same shape as recommendation items for merging.
 import os
 import re
 import hashlib
+import threading
+from collections import OrderedDict
 import xml.etree.ElementTree as ET
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from urllib.request import urlopen, Request
 from urllib.error import URLError, HTTPError
 
+from concurrency import fan_out, sources
+import geocoding
+import distance
+
 try:
     import requests
 except ImportError:
@@ -38,6 +43,27 @@ TRIPADVISOR_API_KEY = os.environ.get("TRIPADVISOR_API_KEY", "").strip() or None
 _description_cache = {}  # key: url -> {"description": str, "timestamp": datetime}
 DESCRIPTION_CACHE_TTL_SECONDS = 86400  # 24 hours
 
+# Raw per-source results, keyed by (source, rounded location, radius). Filled by sources
+# that answer in time and by stragglers that finish after the fan-out deadline, so the
+# next request for the same area doesn't wait on that source again. Written from request
+# threads and from straggler callbacks on worker threads, so guarded by _source_cache_lock;
+# kept in write order so the oldest entries are evicted first.
+_source_cache = OrderedDict()  # key: (task name, lat, lng, radius) -> {"items": list, "timestamp": datetime}
+_source_cache_lock = threading.Lock()
+SOURCE_CACHE_TTL_SECONDS = int(os.environ.get("LOCAL_FEEDS_SOURCE_CACHE_TTL_SECONDS", "600"))
+# Fetchers swallow their own errors and return [], so an empty result may be a transient
+# failure rather than "nothing here": it is only trusted briefly
+SOURCE_CACHE_EMPTY_TTL_SECONDS = int(os.environ.get("LOCAL_FEEDS_SOURCE_CACHE_EMPTY_TTL_SECONDS", "60"))
+SOURCE_CACHE_MAX_ENTRIES = 1000
+# Total time allowed for the source fan-out, and the share of a caller's deadline kept
+# back for normalization/geocoding after it
+FETCH_TIMEOUT = 6
+NORMALIZE_RESERVE_SECONDS = 1.5
+# Below this much time left, normalization only geocodes from lookup tables and caches
+GEOCODE_NETWORK_MIN_SECONDS = 1.0
+# Longest normalization waits on the Nominatim queue for item locations it can't resolve offline
+NORMALIZE_GEOCODE_BUDGET_SECONDS = float(os.environ.get("LOCAL_FEEDS_GEOCODE_BUDGET_SECONDS", "8"))
+
 
 def fetch_event_description(url, timeout=5):
     """
@@ -1372,8 +1398,6 @@ def normalize_feed_item_to_recommendation(item, index, user_lat, user_lng, week_
     location_type = _detect_location_type(location_str)
     print(f"[NORMALIZE] '{title}' location_type={location_type}, location='{location_str}'")
     
-    from math import radians, sin, cos, sqrt, atan2
-    
     # Handle based on location type
     if location_type == "none":
         # No location info - mark as n/a
@@ -1396,15 +1420,8 @@ def normalize_feed_item_to_recommendation(item, index, user_lat, user_lng, week_
         
         if geocoded:
             # Calculate distance but mark as estimated (city center, not exact venue)
-            R = 3959
-            lat1, lng1 = radians(user_lat), radians(user_lng)
-            lat2, lng2 = radians(lat), radians(lng)
-            dlat = lat2 - lat1
-            dlng = lng2 - lng1
-            a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
-            c = 2 * atan2(sqrt(a), sqrt(1 - a))
-            distance_miles = R * c
-            travel_time_min = max(5, int(round((distance_miles / 25) * 60)))
+            distance_miles = distance.haversine_miles(user_lat, user_lng, lat, lng)
+            travel_time_min = distance.travel_minutes(distance_miles)
             distance_is_estimated = True
             print(f"[NORMALIZE] City-level distance for '{title}': ~{distance_miles:.1f}mi (estimated)")
         else:
@@ -1450,15 +1467,8 @@ def normalize_feed_item_to_recommendation(item, index, user_lat, user_lng, week_
         
         if geocoded:
             # Calculate exact distance
-            R = 3959
-            lat1, lng1 = radians(user_lat), radians(user_lng)
-            lat2, lng2 = radians(lat), radians(lng)
-            dlat = lat2 - lat1
-            dlng = lng2 - lng1
-            a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
-            c = 2 * atan2(sqrt(a), sqrt(1 - a))
-            distance_miles = R * c
-            travel_time_min = max(5, int(round((distance_miles / 25) * 60)))
+            distance_miles = distance.haversine_miles(user_lat, user_lng, lat, lng)
+            travel_time_min = distance.travel_minutes(distance_miles)
             print(f"[NORMALIZE] Calculated distance for '{title}': {distance_miles:.1f}mi, {travel_time_min}min")
         else:
             # Couldn't geocode - mark as n/a
@@ -1473,9 +1483,9 @@ def normalize_feed_item_to_recommendation(item, index, user_lat, user_lng, week_
         distance_miles = float(item["distance_miles"])
         travel_time_min = item.get("travel_time_min")
         if travel_time_min is None or not isinstance(travel_time_min, (int, float)):
-            travel_time_min = max(5, int(round((distance_miles / 25) * 60)))
+            travel_time_min = distance.travel_minutes(distance_miles)
         else:
-            travel_time_min = max(5, int(travel_time_min))
+            travel_time_min = max(distance.MIN_TRAVEL_MINUTES, int(travel_time_min))
         distance_is_estimated = False
         distance_is_na = False
         if lat is None:
@@ -1506,11 +1516,17 @@ def normalize_feed_item_to_recommendation(item, index, user_lat, user_lng, week_
         distance_value = round(distance_miles, 1)
         travel_time_value = travel_time_min
     
+    # Coordinates of the venue itself (None when we only had the user's location as a stand-in)
+    if geocoded:
+        place_lat, place_lng = lat, lng
+    else:
+        place_lat, place_lng = item.get("lat"), item.get("lng")
+    
     # Get event date from item (may be pub_date, start_at, date, etc.)
     event_date = item.get("pub_date") or item.get("start_at") or item.get("date") or item.get("event_date") or ""
     
     return {
-        "rec_id": f"lf_{week_str}_{index}",
+        "rec_id": f"lf_{week_str}_{place_id}",
         "type": "event",
         "place_id": place_id,
         "title": title,
@@ -1530,6 +1546,8 @@ def normalize_feed_item_to_recommendation(item, index, user_lat, user_lng, week_
         "event_link": link,
         "event_date": event_date,
         "google_maps_url": f"https://www.google.com/maps/search/?api=1&query={lat},{lng}" if lat and lng else link,
+        "lat": place_lat,
+        "lng": place_lng,
         "address": location_str or "",
         "rating": 0,
         "total_ratings": 0,
@@ -1625,7 +1643,7 @@ def fetch_yelp_places(user_lat, user_lng, radius_miles=25, categories=None, limi
                 "source_url": biz.get("url", "https://www.yelp.com"),
                 "category": our_cat,
                 "distance_miles": distance_mi,
-                "travel_time_min": max(5, int(round((distance_mi / 25) * 60))) if distance_mi else None,
+                "travel_time_min": distance.travel_minutes(distance_mi) if distance_mi else None,
                 "price_flag": price_str,
                 "kid_friendly": our_cat == "family" or "kids" in " ".join(biz_cats),
             })
@@ -1737,14 +1755,8 @@ def fetch_osm_places(user_lat, user_lng, radius_miles=10, limit=15):
     if not requests:
         return []
     try:
-        from math import radians, cos
         # Build bounding box from radius
-        lat_delta = radius_miles / 69.0
-        lng_delta = radius_miles / (69.0 * max(cos(radians(user_lat)), 0.01))
-        south = user_lat - lat_delta
-        north = user_lat + lat_delta
-        west = user_lng - lng_delta
-        east = user_lng + lng_delta
+        south, west, north, east = distance.bounding_box(user_lat, user_lng, radius_miles)
 
         # Overpass QL query for interesting POIs
         query = f"""
@@ -1770,7 +1782,7 @@ out center {limit * 3};
         data = r.json()
         elements = data.get("elements", [])
         items = []
-        from math import radians as rad, sin, cos as cos_f, sqrt, atan2
+        named = []
         for el in elements:
             tags = el.get("tags", {})
             name = tags.get("name")
@@ -1781,15 +1793,11 @@ out center {limit * 3};
             lng = el.get("lon") or (el.get("center", {}) or {}).get("lon")
             if lat is None or lng is None:
                 continue
-            # Calculate distance
-            R = 3959
-            la1, lo1 = rad(user_lat), rad(user_lng)
-            la2, lo2 = rad(lat), rad(lng)
-            dlat = la2 - la1
-            dlng = lo2 - lo1
-            a = sin(dlat / 2) ** 2 + cos_f(la1) * cos_f(la2) * sin(dlng / 2) ** 2
-            c = 2 * atan2(sqrt(a), sqrt(1 - a))
-            dist_mi = round(R * c, 1)
+            named.append((tags, name, lat, lng))
+        # Distances for all POIs in one batch
+        dists, travels = distance.measure(user_lat, user_lng, [p[2] for p in named], [p[3] for p in named])
+        for (tags, name, lat, lng), dist, travel_min in zip(named, dists, travels):
+            dist_mi = round(dist, 1)
             # Map OSM tags to category
             our_cat = "nature"
             if tags.get("tourism") == "museum":
@@ -1812,7 +1820,7 @@ out center {limit * 3};
                 "source_url": gmaps_url,
                 "category": our_cat,
                 "distance_miles": dist_mi,
-                "travel_time_min": max(5, int(round((dist_mi / 25) * 60))),
+                "travel_time_min": travel_min,
                 "price_flag": "free",
                 "kid_friendly": tags.get("leisure") == "playground" or our_cat == "family",
             })
@@ -1826,39 +1834,15 @@ out center {limit * 3};
 
 
 def _reverse_geocode_city_state(lat, lng):
-    """Reverse geocode lat/lng to (city, state_abbr) using OSM Nominatim."""
-    try:
-        r = requests.get(
-            "https://nominatim.openstreetmap.org/reverse",
-            params={"lat": lat, "lon": lng, "format": "json", "zoom": 10},
-            headers={"User-Agent": "ActivityPlanner/1.0"},
-            timeout=3,
-        )
-        if r.status_code == 200:
-            addr = r.json().get("address", {})
-            city = addr.get("city") or addr.get("town") or addr.get("village") or ""
-            state = addr.get("state", "")
-            # Convert state to 2-letter abbreviation
-            _state_abbr = {
-                "Alabama": "AL", "Alaska": "AK", "Arizona": "AZ", "Arkansas": "AR",
-                "California": "CA", "Colorado": "CO", "Connecticut": "CT", "Delaware": "DE",
-                "Florida": "FL", "Georgia": "GA", "Hawaii": "HI", "Idaho": "ID",
-                "Illinois": "IL", "Indiana": "IN", "Iowa": "IA", "Kansas": "KS",
-                "Kentucky": "KY", "Louisiana": "LA", "Maine": "ME", "Maryland": "MD",
-                "Massachusetts": "MA", "Michigan": "MI", "Minnesota": "MN", "Mississippi": "MS",
-                "Missouri": "MO", "Montana": "MT", "Nebraska": "NE", "Nevada": "NV",
-                "New Hampshire": "NH", "New Jersey": "NJ", "New Mexico": "NM", "New York": "NY",
-                "North Carolina": "NC", "North Dakota": "ND", "Ohio": "OH", "Oklahoma": "OK",
-                "Oregon": "OR", "Pennsylvania": "PA", "Rhode Island": "RI", "South Carolina": "SC",
-                "South Dakota": "SD", "Tennessee": "TN", "Texas": "TX", "Utah": "UT",
-                "Vermont": "VT", "Virginia": "VA", "Washington": "WA", "West Virginia": "WV",
-                "Wisconsin": "WI", "Wyoming": "WY",
-            }
-            abbr = _state_abbr.get(state, state[:2].lower() if state else "")
-            return city, abbr
-    except Exception:
-        pass
-    return None, None
+    """
+    (city, state_abbr) for lat/lng from the per-geohash-cell reverse cache or the gazetteer's
+    nearest place; Nominatim only for cells neither knows (see geocoding.reverse).
+    """
+    place = geocoding.reverse(lat, lng, timeout=3)
+    if not place:
+        return None, None
+    state = place["state"] or ""
+    return place["city"] or "", place["state_code"] or (state[:2].lower() if state else "")
 
 
 def fetch_eventbrite_public(user_lat, user_lng, radius_miles=25, limit=10):
@@ -1997,18 +1981,9 @@ def fetch_patch_events(user_lat, user_lng, limit=10):
             (37.7749, -122.4194, "san-francisco"),
         ]
         # Find closest cities
-        from math import radians, sin, cos, sqrt, atan2
-        city_dists = []
-        for clat, clng, slug in bay_area_cities:
-            R = 3959
-            la1, lo1 = radians(user_lat), radians(user_lng)
-            la2, lo2 = radians(clat), radians(clng)
-            dlat = la2 - la1
-            dlng = lo2 - lo1
-            a = sin(dlat / 2) ** 2 + cos(la1) * cos(la2) * sin(dlng / 2) ** 2
-            c = 2 * atan2(sqrt(a), sqrt(1 - a))
-            city_dists.append((R * c, slug))
-        city_dists.sort()
+        dists = distance.distances_miles(user_lat, user_lng, [c[0] for c in bay_area_cities],
+                                         [c[1] for c in bay_area_cities])
+        city_dists = sorted(zip(dists, (c[2] for c in bay_area_cities)))
         # Try the 3 closest cities
         items = []
         headers = {"User-Agent": "ActivityPlanner/1.0 (Local Feeds)"}
@@ -2099,7 +2074,7 @@ def fetch_tripadvisor_places(user_lat, user_lng, radius_miles=25, limit=10):
                 "source_url": ta_url or "https://www.tripadvisor.com",
                 "category": "attractions",
                 "distance_miles": dist_val,
-                "travel_time_min": max(5, int(round((dist_val / 25) * 60))) if dist_val else None,
+                "travel_time_min": distance.travel_minutes(dist_val) if dist_val else None,
                 "price_flag": "$",
                 "kid_friendly": False,
             })
@@ -2130,10 +2105,9 @@ def fetch_alltrails_trails(user_lat, user_lng, radius_miles=25, limit=10):
             timeout=4,
         )
         if r.status_code == 200:
-            from math import radians, sin, cos, sqrt, atan2
             data = r.json()
-            parks = data.get("data", [])
-            for park in parks:
+            parks = []
+            for park in data.get("data", []):
                 name = park.get("fullName", "")
                 if not name:
                     continue
@@ -2141,18 +2115,13 @@ def fetch_alltrails_trails(user_lat, user_lng, radius_miles=25, limit=10):
                 plng = float(park.get("longitude") or 0)
                 if plat == 0 and plng == 0:
                     continue
-                # Calculate distance
-                R = 3959
-                la1, lo1 = radians(user_lat), radians(user_lng)
-                la2, lo2 = radians(plat), radians(plng)
-                dlat = la2 - la1
-                dlng = lo2 - lo1
-                a = sin(dlat / 2) ** 2 + cos(la1) * cos(la2) * sin(dlng / 2) ** 2
-                c = 2 * atan2(sqrt(a), sqrt(1 - a))
-                dist = R * c
-                if dist > radius_miles:
-                    continue
-                travel_min = max(5, int(round((dist / 25) * 60)))
+                parks.append((park, name, plat, plng))
+            # Parks within the radius, measured as one batch (bounding-box prefilter first)
+            nearby = distance.within_radius(user_lat, user_lng, [p[2] for p in parks], [p[3] for p in parks],
+                                            radius_miles)
+            travels = distance.travel_minutes_many([dist for _, dist in nearby])
+            for (i, dist), travel_min in zip(nearby, travels):
+                park, name = parks[i][0], parks[i][1]
                 addresses = park.get("addresses", [])
                 addr = ""
                 if addresses:
@@ -2292,11 +2261,47 @@ def get_local_feed_config():
     }
 
 
+def _source_cache_key(name, user_lat, user_lng, radius_miles):
+    return (name, round(user_lat, 2), round(user_lng, 2), int(radius_miles))
+
+
+def _store_source_result(key, items):
+    with _source_cache_lock:
+        _source_cache[key] = {"items": items or [], "timestamp": datetime.now()}
+        _source_cache.move_to_end(key)
+        # Drop the oldest entries; the cache only has to bridge consecutive requests
+        while len(_source_cache) > SOURCE_CACHE_MAX_ENTRIES:
+            _source_cache.popitem(last=False)
+
+
+def _cached_source_result(key):
+    """The cached entry for key while still fresh (empty results expire sooner), else None."""
+    with _source_cache_lock:
+        cached = _source_cache.get(key)
+    if cached is None:
+        return None
+    ttl = SOURCE_CACHE_TTL_SECONDS if cached["items"] else SOURCE_CACHE_EMPTY_TTL_SECONDS
+    if (datetime.now() - cached["timestamp"]).total_seconds() >= ttl:
+        return None
+    return cached
+
+
 def get_local_feed_recommendations(profile, user_lat, user_lng, geocode_fn=None, max_items=5,
-                                   max_travel_min=None, max_radius_miles=None, week_str=None):
+                                   max_travel_min=None, max_radius_miles=None, week_str=None,
+                                   deadline=None):
     """
     Fetch from all configured local feeds, normalize to recommendation items,
     rank by relevance, filter by travel/radius, and return top items.
+    deadline: optional concurrency.Deadline; the source fan-out stops waiting in time to
+    leave NORMALIZE_RESERVE_SECONDS (at most a quarter of what is left) for normalization,
+    and sources still running when it returns store their results in _source_cache for the
+    next call.
+    geocode_fn(location_str, network=True) defaults to geocoding.geocode. Items are first
+    normalized with network=False; locations still unknown are then geocoded as one batch
+    through the Nominatim queue (geocoding.geocode_many) for at most
+    NORMALIZE_GEOCODE_BUDGET_SECONDS, stopping GEOCODE_NETWORK_MIN_SECONDS before the
+    deadline, and their items normalized again. Trimmed stages are recorded on the
+    deadline ('local_feeds', 'geocoding').
     
     Sources:
     - Luma (lu.ma events)
@@ -2307,124 +2312,14 @@ def get_local_feed_recommendations(profile, user_lat, user_lng, geocode_fn=None,
     - RSS/Atom feeds (if configured)
     """
     from datetime import datetime
-    from math import radians, sin, cos, sqrt, atan2
-    import time as _time
     week_str = week_str or f"{datetime.now().year}-{datetime.now().isocalendar()[1]:02d}"
     config = get_local_feed_config()
     raw_items = []
     radius_miles = max_radius_miles or 25
     user_interests = (profile or {}).get("interests", [])
 
-    # Build a default geocode function if none provided
     if geocode_fn is None:
-        # Bay Area city lookup table to avoid Nominatim calls for common locations
-        _BAY_AREA_CITIES = {
-            "san francisco": (37.7749, -122.4194), "sf": (37.7749, -122.4194),
-            "oakland": (37.8044, -122.2712), "berkeley": (37.8716, -122.2727),
-            "san jose": (37.3382, -121.8863), "fremont": (37.5485, -121.9886),
-            "newark": (37.5316, -122.0392), "hayward": (37.6688, -122.0808),
-            "union city": (37.5934, -122.0438), "milpitas": (37.4323, -121.8996),
-            "sunnyvale": (37.3688, -122.0363), "santa clara": (37.3541, -121.9552),
-            "mountain view": (37.3861, -122.0839), "palo alto": (37.4419, -122.1430),
-            "redwood city": (37.4852, -122.2364), "san mateo": (37.5630, -122.3255),
-            "daly city": (37.6879, -122.4702), "concord": (37.9780, -122.0311),
-            "walnut creek": (37.9101, -122.0652), "pleasanton": (37.6624, -121.8747),
-            "livermore": (37.6819, -121.7680), "dublin": (37.7022, -121.9358),
-            "alameda": (37.7652, -122.2416), "richmond": (37.9358, -122.3477),
-            "san leandro": (37.7249, -122.1561), "castro valley": (37.6941, -122.0864),
-            "emeryville": (37.8313, -122.2852), "albany": (37.8869, -122.2978),
-            "el cerrito": (37.9161, -122.3122), "kensington": (37.9105, -122.2802),
-            "piedmont": (37.8243, -122.2318), "sausalito": (37.8591, -122.4853),
-            "tiburon": (37.8735, -122.4567), "mill valley": (37.9060, -122.5450),
-            "san rafael": (37.9735, -122.5311), "napa": (38.2975, -122.2869),
-            "sonoma": (38.2919, -122.4580), "santa cruz": (36.9741, -122.0308),
-            "half moon bay": (37.4636, -122.4286), "pacifica": (37.6138, -122.4869),
-            "danville": (37.8218, -121.9999), "san ramon": (37.7799, -121.9780),
-            "martinez": (38.0194, -122.1341), "antioch": (38.0049, -121.8058),
-            "pittsburg": (38.0280, -121.8847), "brentwood": (37.9317, -121.6961),
-            "tracy": (37.7397, -121.4252), "saratoga": (37.2638, -122.0230),
-            "los gatos": (37.2358, -121.9624), "campbell": (37.2872, -121.9500),
-            "los altos": (37.3852, -122.1141), "atherton": (37.4613, -122.1979),
-            "woodside": (37.4299, -122.2539), "portola valley": (37.3841, -122.2352),
-            "south san francisco": (37.6547, -122.4077), "san bruno": (37.6305, -122.4111),
-            "millbrae": (37.5985, -122.3872), "burlingame": (37.5841, -122.3660),
-            "san carlos": (37.5072, -122.2605), "belmont": (37.5202, -122.2758),
-            "foster city": (37.5585, -122.2711),
-        }
-        _geocode_cache = {}  # location_str -> (lat, lng, timestamp)
-        _GEOCODE_CACHE_TTL = 3600  # 1 hour
-        _last_nominatim_call = [0.0]  # mutable for closure
-
-        def _default_geocode_fn(location_str):
-            if not location_str:
-                return None
-            # Check cache
-            cached = _geocode_cache.get(location_str)
-            if cached:
-                lat, lng, ts = cached
-                if _time.time() - ts < _GEOCODE_CACHE_TTL:
-                    return (lat, lng)
-
-            # Try Bay Area lookup table first
-            loc_lower = location_str.lower().strip()
-            # Extract city name: try "City, ST" pattern or just the string
-            import re as _re
-            city_match = _re.match(r'^([^,]+)', loc_lower)
-            city_name = city_match.group(1).strip() if city_match else loc_lower
-            # Also try matching after last comma for "Venue, City, CA" patterns
-            parts = [p.strip() for p in loc_lower.split(',')]
-            for part in parts:
-                clean = _re.sub(r'\b(ca|california)\b', '', part).strip()
-                if clean in _BAY_AREA_CITIES:
-                    coords = _BAY_AREA_CITIES[clean]
-                    _geocode_cache[location_str] = (coords[0], coords[1], _time.time())
-                    return coords
-            if city_name in _BAY_AREA_CITIES:
-                coords = _BAY_AREA_CITIES[city_name]
-                _geocode_cache[location_str] = (coords[0], coords[1], _time.time())
-                return coords
-
-            # Try extracting city from complex addresses by looking at last
-            # few comma-separated parts (e.g. "Venue, 123 St (in Place), Danville, CA")
-            # Strip parenthetical content first, then try last city-like parts
-            clean_str = _re.sub(r'\([^)]*\)', '', loc_lower)
-            clean_parts = [_re.sub(r'\b(ca|california)\b', '', p).strip() for p in clean_str.split(',')]
-            clean_parts = [p for p in clean_parts if p]
-            # Try from the end (most likely to be city)
-            for part in reversed(clean_parts):
-                # Strip numbers/zip codes to get just the city name
-                city_candidate = _re.sub(r'\b\d{5}(-\d{4})?\b', '', part).strip()
-                city_candidate = _re.sub(r'^\d+\s+', '', city_candidate).strip()
-                if city_candidate in _BAY_AREA_CITIES:
-                    coords = _BAY_AREA_CITIES[city_candidate]
-                    _geocode_cache[location_str] = (coords[0], coords[1], _time.time())
-                    return coords
-
-            # Fall back to Nominatim (rate limited: 1 req/sec)
-            if not requests:
-                return None
-            elapsed = _time.time() - _last_nominatim_call[0]
-            if elapsed < 1.0:
-                _time.sleep(1.0 - elapsed)
-            try:
-                resp = requests.get(
-                    "https://nominatim.openstreetmap.org/search",
-                    params={"q": location_str, "format": "json", "limit": 1},
-                    headers={"User-Agent": "ActivityPlanner/1.0"},
-                    timeout=3,
-                )
-                _last_nominatim_call[0] = _time.time()
-                if resp.status_code == 200:
-                    data = resp.json()
-                    if data:
-                        lat, lng = float(data[0]["lat"]), float(data[0]["lon"])
-                        _geocode_cache[location_str] = (lat, lng, _time.time())
-                        return (lat, lng)
-            except Exception as e:
-                print(f"[GEOCODE] Nominatim error for '{location_str}': {e}")
-            return None
-
-        geocode_fn = _default_geocode_fn
+        geocode_fn = geocoding.geocode
 
     print(f"[LOCAL_FEEDS] Fetching from all sources for ({user_lat}, {user_lng}), radius={radius_miles}mi (parallel)")
 
@@ -2549,25 +2444,44 @@ def get_local_feed_recommendations(profile, user_lat, user_lng, geocode_fn=None,
         _fetch_yelp, _fetch_ticketmaster, _fetch_osm,
         _fetch_tripadvisor, _fetch_eventbrite_pub, _fetch_alltrails, _fetch_parks_rec,
     ]
-    # Early return: stop waiting after timeout so we return fast with available results.
-    FETCH_TIMEOUT = 6
-    with ThreadPoolExecutor(max_workers=min(4, len(tasks))) as executor:
-        futures = {executor.submit(t): t.__name__ for t in tasks}
-        try:
-            for future in as_completed(futures, timeout=FETCH_TIMEOUT):
-                try:
-                    items = future.result()
-                    raw_items.extend(items)
-                    name = futures.get(future, "unknown")
-                    if items:
-                        print(f"[LOCAL_FEEDS] {name}: {len(items)} items")
-                except Exception as e:
-                    print(f"[LOCAL_FEEDS] Parallel fetch error: {e}")
-        except (TimeoutError, Exception) as e:
-            if 'TimeoutError' in type(e).__name__ or 'unfinished' in str(e):
-                print(f"[LOCAL_FEEDS] Fetch timeout ({FETCH_TIMEOUT}s) - returning {len(raw_items)} items from completed sources")
-            else:
-                print(f"[LOCAL_FEEDS] Parallel fetch error: {e}")
+    # Sources answered recently (in time or late) are served from _source_cache
+    to_fetch = {}
+    cached_sources = 0
+    for task in tasks:
+        key = _source_cache_key(task.__name__, user_lat, user_lng, radius_miles)
+        cached = _cached_source_result(key)
+        if cached:
+            raw_items.extend(cached["items"])
+            cached_sources += 1
+        else:
+            to_fetch[task.__name__] = task
+    if cached_sources:
+        print(f"[LOCAL_FEEDS] {cached_sources} sources served from cache, fetching {len(to_fetch)}")
+
+    # Stop waiting at the deadline and return with what has arrived; stragglers keep
+    # running and land in _source_cache
+    timeout = FETCH_TIMEOUT
+    if deadline is not None:
+        reserve = min(NORMALIZE_RESERVE_SECONDS, deadline.remaining() * 0.25)
+        timeout = max(0.0, min(FETCH_TIMEOUT, deadline.remaining() - reserve))
+
+    def _late(name, items):
+        _store_source_result(_source_cache_key(name, user_lat, user_lng, radius_miles), items)
+        print(f"[LOCAL_FEEDS] {name} finished after the deadline: cached {len(items or [])} items")
+
+    results, errors, pending = fan_out(to_fetch, timeout, on_late=_late, executor=sources.executor(),
+                                       name="local-feeds") if to_fetch else ({}, {}, [])
+    for name, items in results.items():
+        _store_source_result(_source_cache_key(name, user_lat, user_lng, radius_miles), items)
+        if items:
+            raw_items.extend(items)
+            print(f"[LOCAL_FEEDS] {name}: {len(items)} items")
+    for name, e in errors.items():
+        print(f"[LOCAL_FEEDS] Parallel fetch error in {name}: {e}")
+    if pending:
+        print(f"[LOCAL_FEEDS] Fetch timeout ({timeout:.1f}s) - returning {len(raw_items)} items, still waiting on {', '.join(pending)}")
+        if deadline is not None:
+            deadline.cut('local_feeds')
 
     print(f"[LOCAL_FEEDS] Total raw items from all sources: {len(raw_items)}")
 
@@ -2594,15 +2508,47 @@ def get_local_feed_recommendations(profile, user_lat, user_lng, geocode_fn=None,
             user_state = "CA"
         print(f"[LOCAL_FEEDS] Extracted user state: {user_state} from '{addr}'")
 
-    # Normalize to recommendation shape and filter by distance/travel
-    recs = []
-    for i, item in enumerate(raw_items):
+    def _normalize(i, item, item_geocode_fn):
         rec = normalize_feed_item_to_recommendation(
-            item, i, user_lat, user_lng, week_str, geocode_fn=geocode_fn, user_state=user_state
+            item, i, user_lat, user_lng, week_str, geocode_fn=item_geocode_fn, user_state=user_state
         )
         # Preserve kid_friendly from source if present
         if item.get("kid_friendly"):
             rec["kid_friendly"] = True
+        return rec
+
+    def _offline_geocode(location_str):
+        return geocode_fn(location_str, network=False)
+
+    # Normalize from the gazetteer and geocode cache, noting the locations that need Nominatim
+    needs_lookup = {}  # item index -> location strings
+    normalized = []
+    for i, item in enumerate(raw_items):
+        def _noting_geocode(location_str, i=i):
+            if geocoding.needs_network(location_str):
+                needs_lookup.setdefault(i, []).append(location_str)
+            return _offline_geocode(location_str)
+        normalized.append(_normalize(i, item, _noting_geocode))
+
+    # One batch through the shared Nominatim queue, then renormalize the items it resolved
+    if needs_lookup:
+        wanted = list(dict.fromkeys(s for strings in needs_lookup.values() for s in strings))
+        budget = NORMALIZE_GEOCODE_BUDGET_SECONDS
+        if deadline is not None:
+            budget = min(budget, deadline.remaining() - GEOCODE_NETWORK_MIN_SECONDS)
+        if budget > 0:
+            geocoding.geocode_many(wanted, budget)
+        unresolved = [s for s in wanted if geocoding.needs_network(s)]
+        print(f"[LOCAL_FEEDS] Nominatim batch: {len(wanted) - len(unresolved)}/{len(wanted)} "
+              f"locations resolved in {max(budget, 0):.1f}s budget")
+        if unresolved and deadline is not None:
+            deadline.cut('geocoding')
+        for i in needs_lookup:
+            normalized[i] = _normalize(i, raw_items[i], _offline_geocode)
+
+    # Filter by distance/travel
+    recs = []
+    for rec in normalized:
         # Filter by travel time/distance (skip items with n/a since we can't verify)
         travel_time = rec.get("travel_time_min")
         distance = rec.get("distance_miles")
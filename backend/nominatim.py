@@ -0,0 +1,269 @@
+"""
+Process-wide scheduler for every OpenStreetMap Nominatim request (search and reverse).
+
+Nominatim's usage policy allows one request per second, so all traffic goes through
+one dispatcher thread that:
+
+  - spends tokens from a bucket refilled at NOMINATIM_RATE_PER_SECOND
+  - shares one request among callers asking the same thing while it is queued or in flight
+  - serves interactive callers before batch ones (priority follows the caller's
+    concurrency lane unless given)
+  - backs off after a 429/503 for Retry-After seconds (or an exponential cooldown)
+    and resumes on its own
+  - drops queued requests every caller has stopped waiting for
+
+search() / reverse() return the parsed JSON, or None when Nominatim could not answer
+in time (cooldown, HTTP error, timeout). search_many() runs a list of queries through
+the same queue within one time budget.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError, wait
+from email.utils import parsedate_to_datetime
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+from concurrency import current_lane
+
+NOMINATIM_BASE_URL = os.environ.get('NOMINATIM_BASE_URL', 'https://nominatim.openstreetmap.org')
+NOMINATIM_USER_AGENT = os.environ.get('NOMINATIM_USER_AGENT', 'ActivityPlanner/1.0')
+NOMINATIM_RATE_PER_SECOND = float(os.environ.get('NOMINATIM_RATE_PER_SECOND', '1'))
+NOMINATIM_BURST = int(os.environ.get('NOMINATIM_BURST', '1'))
+NOMINATIM_TIMEOUT_SECONDS = float(os.environ.get('NOMINATIM_TIMEOUT_SECONDS', '4'))
+NOMINATIM_WAIT_SECONDS = float(os.environ.get('NOMINATIM_WAIT_SECONDS', '6'))
+NOMINATIM_COOLDOWN_SECONDS = float(os.environ.get('NOMINATIM_COOLDOWN_SECONDS', '30'))
+NOMINATIM_MAX_COOLDOWN_SECONDS = float(os.environ.get('NOMINATIM_MAX_COOLDOWN_SECONDS', '900'))
+NOMINATIM_MAX_QUEUE = int(os.environ.get('NOMINATIM_MAX_QUEUE', '500'))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+
+class _Request:
+    __slots__ = ('key', 'path', 'params', 'future', 'priority', 'wait_until', 'queued_at')
+
+    def __init__(self, key, path, params, priority, wait_until):
+        self.key = key
+        self.path = path
+        self.params = params
+        self.future = Future()
+        self.priority = priority
+        self.wait_until = wait_until   # latest time any caller is still waiting
+        self.queued_at = time.monotonic()
+
+
+class NominatimScheduler:
+    def __init__(self, rate=NOMINATIM_RATE_PER_SECOND, burst=NOMINATIM_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._cooldown_until = 0.0
+        self._failures = 0              # consecutive 429/503 answers
+        self._cond = threading.Condition()
+        self._heap = []                 # (priority, seq, request); stale entries skipped
+        self._pending = {}              # key -> queued or in-flight request
+        self._seq = itertools.count()
+        self._thread = None
+        self._stats = {'requests': 0, 'shared': 0, 'ok': 0, 'errors': 0, 'throttled': 0,
+                       'cooldowns': 0, 'expired': 0, 'rejected': 0, 'wait_ms_total': 0.0}
+
+    # -- public --
+
+    def submit(self, key, path, params, priority=None, timeout=NOMINATIM_WAIT_SECONDS):
+        """Queue a request (or join the identical one already pending). Returns a Future, or None if refused."""
+        priority = self._default_priority() if priority is None else priority
+        now = time.monotonic()
+        with self._cond:
+            if self._cooldown_until - now > timeout:
+                self._stats['rejected'] += 1
+                return None
+            req = self._pending.get(key)
+            if req is not None:
+                self._stats['shared'] += 1
+                req.wait_until = max(req.wait_until, now + timeout)
+                if priority < req.priority:
+                    req.priority = priority
+                    heapq.heappush(self._heap, (priority, next(self._seq), req))
+                return req.future
+            if len(self._pending) >= NOMINATIM_MAX_QUEUE:
+                self._stats['rejected'] += 1
+                return None
+            req = _Request(key, path, params, priority, now + timeout)
+            self._pending[key] = req
+            heapq.heappush(self._heap, (priority, next(self._seq), req))
+            self._ensure_thread()
+            self._cond.notify()
+            return req.future
+
+    def call(self, key, path, params, priority=None, timeout=NOMINATIM_WAIT_SECONDS):
+        """submit() and wait up to timeout seconds. Returns the parsed JSON or None."""
+        fut = self.submit(key, path, params, priority, timeout)
+        if fut is None:
+            return None
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeoutError:
+            return None
+
+    def stats(self):
+        with self._cond:
+            done = self._stats['ok'] + self._stats['errors'] + self._stats['throttled']
+            return {
+                'rate_per_second': self.rate,
+                'queued': len(self._pending),
+                'cooldown_remaining_s': round(max(0.0, self._cooldown_until - time.monotonic()), 1),
+                'consecutive_throttles': self._failures,
+                'wait_ms_avg': round(self._stats['wait_ms_total'] / done, 1) if done else None,
+                **{k: v for k, v in self._stats.items() if k != 'wait_ms_total'},
+            }
+
+    # -- dispatcher --
+
+    @staticmethod
+    def _default_priority():
+        return PRIORITY_INTERACTIVE if current_lane() == 'interactive' else PRIORITY_BATCH
+
+    def _ensure_thread(self):
+        # Caller holds _cond
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='nominatim', daemon=True)
+            self._thread.start()
+
+    def _next_request(self):
+        """Block until a request may be sent now; returns it (removed from the heap)."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                # Skip superseded heap entries and requests nobody waits for any more
+                while self._heap:
+                    priority, _, req = self._heap[0]
+                    if req.future.done() or self._pending.get(req.key) is not req or priority != req.priority:
+                        heapq.heappop(self._heap)
+                    elif req.wait_until <= now:
+                        heapq.heappop(self._heap)
+                        del self._pending[req.key]
+                        self._stats['expired'] += 1
+                        req.future.set_result(None)
+                    else:
+                        break
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+                self._refilled_at = now
+                delay = max(self._cooldown_until - now, (1 - self._tokens) / self.rate if self._tokens < 1 else 0)
+                if delay > 0:
+                    self._cond.wait(min(delay, self._heap[0][2].wait_until - now))
+                    continue
+                self._tokens -= 1
+                return heapq.heappop(self._heap)[2]
+
+    def _run(self):
+        while True:
+            req = self._next_request()
+            result = self._send(req)
+            with self._cond:
+                self._pending.pop(req.key, None)
+                self._stats['wait_ms_total'] += (time.monotonic() - req.queued_at) * 1000
+            req.future.set_result(result)
+
+    def _send(self, req):
+        if not requests:
+            return None
+        with self._cond:
+            self._stats['requests'] += 1
+        try:
+            r = requests.get(f"{NOMINATIM_BASE_URL}/{req.path}", params=req.params,
+                             headers={"User-Agent": NOMINATIM_USER_AGENT}, timeout=NOMINATIM_TIMEOUT_SECONDS)
+        except Exception as e:
+            print(f"[NOMINATIM] {req.path} error for {req.key[1:]}: {e}")
+            with self._cond:
+                self._stats['errors'] += 1
+            return None
+        if r.status_code in (429, 503):
+            self._throttled(r.headers.get('Retry-After'))
+            return None
+        with self._cond:
+            self._failures = 0
+            self._stats['ok' if r.status_code == 200 else 'errors'] += 1
+        if r.status_code != 200:
+            print(f"[NOMINATIM] HTTP {r.status_code} for {req.path} {req.key[1:]}")
+            return None
+        try:
+            return r.json()
+        except ValueError:
+            return None
+
+    def _throttled(self, retry_after):
+        seconds = _parse_retry_after(retry_after)
+        with self._cond:
+            self._failures += 1
+            self._stats['throttled'] += 1
+            self._stats['cooldowns'] += 1
+            if seconds is None:
+                seconds = NOMINATIM_COOLDOWN_SECONDS * 2 ** (self._failures - 1)
+            seconds = min(seconds, NOMINATIM_MAX_COOLDOWN_SECONDS)
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + seconds)
+        print(f"[NOMINATIM] Throttled - pausing all requests for {seconds:.0f}s")
+
+
+def _parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+scheduler = NominatimScheduler()
+
+
+def search(q, priority=None, timeout=NOMINATIM_WAIT_SECONDS):
+    """Forward geocode: Nominatim's result list ([] for no match), or None if it could not answer."""
+    return scheduler.call(('search', q.lower()), 'search', {"q": q, "format": "json", "limit": 1},
+                          priority, timeout)
+
+
+def reverse(lat, lng, zoom=None, priority=None, timeout=NOMINATIM_WAIT_SECONDS):
+    """Reverse geocode: Nominatim's result dict, or None if it could not answer."""
+    params = {"lat": lat, "lon": lng, "format": "json"}
+    if zoom is not None:
+        params["zoom"] = zoom
+    return scheduler.call(('reverse', round(lat, 5), round(lng, 5), zoom), 'reverse', params, priority, timeout)
+
+
+def search_many(queries, timeout, priority=PRIORITY_BATCH):
+    """
+    Forward geocode several queries through the shared queue, waiting at most timeout
+    seconds in total. Returns {query: result list or None}; queries that did not get an
+    answer in time map to None and are dropped from the queue.
+    """
+    futures = {}
+    for q in dict.fromkeys(queries):
+        fut = scheduler.submit(('search', q.lower()), 'search', {"q": q, "format": "json", "limit": 1},
+                               priority, timeout)
+        if fut is not None:
+            futures[fut] = q
+    results = {q: None for q in queries}
+    if futures:
+        done, _ = wait(futures, timeout=timeout)
+        for fut in done:
+            results[futures[fut]] = fut.result()
+    return results
+
+
+def get_metrics():
+    return scheduler.stats()
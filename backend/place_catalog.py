@@ -0,0 +1,100 @@
+"""
+Place catalog: place_id -> title, category, location and display fields for every
+place or event we have recommended. Backed by the `places` table (db.py) with an
+in-process LRU in front, so category lookups for clicks/feedback and the
+visited/saved detail views are a dict hit instead of a scan over MOCK_PLACES and
+the warm cache.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import db
+import write_queue
+
+CATALOG_LRU_SIZE = int(os.environ.get('PLACE_CATALOG_LRU_SIZE', '5000'))
+
+_lru = OrderedDict()   # place_id -> catalog row (dict)
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'remembered': 0}
+
+
+def row_from_item(item, source=None):
+    """Map a recommendation item (Google, local feed or mock shape) to a catalog row."""
+    place_id = item.get('place_id')
+    if not place_id:
+        return None
+    return {
+        'place_id': place_id,
+        'title': item.get('title') or item.get('name'),
+        'category': item.get('category'),
+        'lat': item.get('lat'),
+        'lng': item.get('lng'),
+        'address': item.get('address') or None,
+        'photo_url': item.get('photo_url') or None,
+        'source_url': item.get('google_maps_url') or item.get('source_url') or None,
+        'rating': item.get('rating'),
+        'total_ratings': item.get('total_ratings'),
+        'price_flag': item.get('price_flag'),
+        'source': source or item.get('source'),
+    }
+
+
+def _put(row):
+    # Caller holds _lock. Merge so a sparse sighting keeps fields learned earlier.
+    prev = _lru.pop(row['place_id'], None)
+    if prev:
+        row = {**prev, **{k: v for k, v in row.items() if v is not None}}
+    _lru[row['place_id']] = row
+    while len(_lru) > CATALOG_LRU_SIZE:
+        _lru.popitem(last=False)
+
+
+def remember(items, source=None):
+    """Record items in the LRU now and upsert them into the places table via the write-behind queue."""
+    rows = [r for r in (row_from_item(i, source) for i in items or [] if isinstance(i, dict)) if r]
+    if not rows:
+        return 0
+    with _lock:
+        for row in rows:
+            _put(dict(row))
+        _stats['remembered'] += len(rows)
+    write_queue.enqueue_shared('upsert_places', rows)
+    return len(rows)
+
+
+def get_many(place_ids):
+    """{place_id: row} for known places, from the LRU first and the db for the rest."""
+    found, missing = {}, []
+    with _lock:
+        for pid in place_ids:
+            row = _lru.get(pid)
+            if row is not None:
+                _lru.move_to_end(pid)
+                found[pid] = row
+            elif pid:
+                missing.append(pid)
+        _stats['hits'] += len(found)
+        _stats['misses'] += len(missing)
+    if missing:
+        loaded = db.get_places(missing)
+        with _lock:
+            for row in loaded.values():
+                _put(row)
+        found.update(loaded)
+    return found
+
+
+def get(place_id):
+    return get_many([place_id]).get(place_id)
+
+
+def category_for(place_id):
+    row = get(place_id)
+    return row.get('category') if row else None
+
+
+def get_metrics():
+    with _lock:
+        return {'lru_size': len(_lru), 'lru_capacity': CATALOG_LRU_SIZE, **_stats}
@@ -24,6 +24,10 @@ try:
 except ImportError:
     pass
 
+# Restore the web server's cache snapshot but never write it back: this process's
+# caches would otherwise replace the server's snapshot when it exits
+os.environ.setdefault('CACHE_SNAPSHOT_READ_ONLY', '1')
+
 from app import send_all_friday_digests
 
 if __name__ == '__main__':
@@ -0,0 +1,163 @@
+"""
+Bounded in-memory warm cache for recommendation results.
+
+Entries are {'items', 'sources', 'timestamp'} dicts keyed by the warm cache key
+(see app._get_warm_cache_key), optionally with the pre-selection 'candidates' they
+were ranked from (see app._warm_entry). The cache enforces both an entry budget and an
+approximate byte budget. Eviction samples the least recently used entries and
+drops the one with the worst size / (hits + 1), so large, rarely read entries go
+first. All access is serialized with an RLock; every public method is safe to
+call from request threads and background refreshers alike.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+WARM_CACHE_MAX_ENTRIES = int(os.environ.get('WARM_CACHE_MAX_ENTRIES', '500'))
+WARM_CACHE_MAX_BYTES = int(os.environ.get('WARM_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+WARM_CACHE_EVICTION_SAMPLE = int(os.environ.get('WARM_CACHE_EVICTION_SAMPLE', '8'))
+
+
+def estimate_size(value):
+    """Approximate payload size in bytes (serialized JSON length of the items and any kept candidates)."""
+    try:
+        return sum(len(json.dumps(value[field], default=str))
+                   for field in ('items', 'candidates') if value.get(field))
+    except (TypeError, ValueError):
+        return 0
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'hits', 'stored_at')
+
+    def __init__(self, value, size):
+        self.value = value
+        self.size = size
+        self.hits = 0
+        self.stored_at = time.time()
+
+
+class WarmCache:
+    def __init__(self, max_entries=WARM_CACHE_MAX_ENTRIES, max_bytes=WARM_CACHE_MAX_BYTES,
+                 sample_size=WARM_CACHE_EVICTION_SAMPLE):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sample_size = max(1, sample_size)
+        self._entries = OrderedDict()  # key -> _Entry, least recently used first
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._counters = {'hits': 0, 'misses': 0, 'inserts': 0, 'evictions': 0,
+                          'evicted_bytes': 0, 'expired': 0, 'rejected': 0}
+
+    def get(self, key):
+        """Return the cached value (and mark it recently used) or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self._counters['hits'] += 1
+            return entry.value
+
+    def peek(self, key):
+        """Like get() but without touching recency or counters."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.value if entry else None
+
+    def put(self, key, value, size=None):
+        """Insert or replace an entry, evicting others to stay within budget. Returns False if too large to cache."""
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            if size > self.max_bytes:
+                self._counters['rejected'] += 1
+                self._remove(key)
+                return False
+            old = self._entries.get(key)
+            entry = _Entry(value, size)
+            if old is not None:
+                entry.hits = old.hits  # keep popularity across refreshes
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += size
+            self._counters['inserts'] += 1
+            self._evict(protect=key)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._remove(key)
+            return entry.value if entry else default
+
+    def prune_older_than(self, max_age_seconds):
+        """Drop entries stored more than max_age_seconds ago. Returns how many were dropped."""
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            stale = [k for k, e in self._entries.items() if e.stored_at < cutoff]
+            for k in stale:
+                self._remove(k)
+            self._counters['expired'] += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def values(self):
+        with self._lock:
+            return [e.value for e in self._entries.values()]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hit_rate': round(self._counters['hits'] / lookups, 3) if lookups else None,
+                **self._counters,
+            }
+
+    # -- internals (caller holds the lock) --
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        return entry
+
+    def _evict(self, protect=None):
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            victim, worst = None, -1.0
+            for i, (k, e) in enumerate(self._entries.items()):
+                if i >= self.sample_size:
+                    break
+                if k == protect:
+                    continue
+                cost = e.size / (e.hits + 1)
+                if cost > worst:
+                    victim, worst = k, cost
+            if victim is None:
+                break
+            entry = self._remove(victim)
+            self._counters['evictions'] += 1
+            self._counters['evicted_bytes'] += entry.size
@@ -0,0 +1,250 @@
+"""
+Activity-aware pre-warming of the recommendation warm cache.
+
+Every WARMING_TICK_SECONDS the scheduler ranks users and warms the most urgent ones
+within an upstream budget (at most WARMING_CONCURRENCY at once, WARMING_MAX_PER_HOUR
+per rolling hour, spread evenly across ticks):
+
+  0. users whose notification_time_local is within WARMING_NOTIFICATION_LEAD_MINUTES
+     and whose entry would be stale by then
+  1. digest subscribers in the lead window before the Friday digest
+  2. users active (login or click) in the last WARMING_ACTIVE_DAYS whose entry is
+     missing or about to expire, most recently active first
+
+The scheduler only knows about callbacks (list users, entry age, warm one user), so
+app.py owns every cache and fetch detail.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+WARMING_ENABLED = os.environ.get('WARMING_ENABLED', '1') != '0'
+WARMING_TICK_SECONDS = int(os.environ.get('WARMING_TICK_SECONDS', '60'))
+WARMING_CONCURRENCY = int(os.environ.get('WARMING_CONCURRENCY', '2'))
+WARMING_MAX_PER_HOUR = int(os.environ.get('WARMING_MAX_PER_HOUR', '120'))
+WARMING_ACTIVE_DAYS = int(os.environ.get('WARMING_ACTIVE_DAYS', '14'))
+WARMING_NOTIFICATION_LEAD_MINUTES = int(os.environ.get('WARMING_NOTIFICATION_LEAD_MINUTES', '10'))
+WARMING_USERS_REFRESH_SECONDS = int(os.environ.get('WARMING_USERS_REFRESH_SECONDS', '300'))
+WARMING_DEFAULT_TZ = os.environ.get('WARMING_DEFAULT_TZ', 'America/Los_Angeles')
+# Friday digest cron time (send_friday_digest.py), in WARMING_DEFAULT_TZ
+DIGEST_WEEKDAY = int(os.environ.get('DIGEST_WEEKDAY', '4'))
+DIGEST_TIME_LOCAL = os.environ.get('DIGEST_TIME_LOCAL', '09:00')
+DIGEST_WARM_LEAD_MINUTES = int(os.environ.get('DIGEST_WARM_LEAD_MINUTES', '30'))
+
+PRIORITY_NOTIFICATION = 0
+PRIORITY_DIGEST = 1
+PRIORITY_ACTIVE = 2
+
+
+def _local_now(tz_name):
+    if ZoneInfo is not None:
+        try:
+            return datetime.now(ZoneInfo(tz_name or WARMING_DEFAULT_TZ)).replace(tzinfo=None)
+        except Exception:
+            pass
+    return datetime.now()
+
+
+def _seconds_until(local_now, hhmm):
+    """Seconds from local_now until today's HH:MM (negative once it has passed), or None if unparseable."""
+    try:
+        hour, minute = (int(p) for p in str(hhmm).split(':')[:2])
+    except (TypeError, ValueError):
+        return None
+    target = local_now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return (target - local_now).total_seconds()
+
+
+def _parse_ts(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+class WarmingScheduler:
+    def __init__(self, list_users, entry_age, warm_user, fresh_seconds, stale_seconds,
+                 tick_seconds=WARMING_TICK_SECONDS, concurrency=WARMING_CONCURRENCY,
+                 max_per_hour=WARMING_MAX_PER_HOUR, executor=None):
+        """
+        list_users() -> [{'id', 'preferences', 'last_active', 'email_digest'}]
+        entry_age(user_id, prefs) -> age in seconds of the user's warm entry, or None
+        warm_user(user_id, prefs) -> fetch and cache recommendations for one user
+        executor: where warms run (anything with submit(fn, *args)); defaults to a private pool
+        """
+        self.list_users = list_users
+        self.entry_age = entry_age
+        self.warm_user = warm_user
+        self.fresh_seconds = fresh_seconds
+        self.stale_seconds = stale_seconds
+        self.tick_seconds = tick_seconds
+        self.concurrency = max(1, concurrency)
+        self.max_per_hour = max_per_hour
+        self.per_tick = max(1, math.ceil(max_per_hour * tick_seconds / 3600.0))
+        self._executor = executor or ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='warming')
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._started_at = deque()   # start times of warms in the last hour
+        self._last_attempt = {}      # user_id -> time of last warm attempt
+        self._users = []
+        self._users_loaded_at = 0.0
+        self._thread = None
+        self._stats = {'ticks': 0, 'warmed': 0, 'empty': 0, 'errors': 0, 'budget_deferred': 0,
+                       'by_reason': {'notification': 0, 'digest': 0, 'active': 0},
+                       'last_tick': None, 'last_planned': 0}
+
+    # -- planning --
+
+    def _users_snapshot(self):
+        now = time.time()
+        if not self._users or now - self._users_loaded_at > WARMING_USERS_REFRESH_SECONDS:
+            self._users = self.list_users()
+            self._users_loaded_at = now
+        return self._users
+
+    def plan(self, now=None):
+        """Users that need warming now, most urgent first: [(priority, reason, user)]."""
+        now = now or datetime.now()
+        active_cutoff = now - timedelta(days=WARMING_ACTIVE_DAYS)
+        digest_local = _local_now(WARMING_DEFAULT_TZ)
+        until_digest = _seconds_until(digest_local, DIGEST_TIME_LOCAL)
+        digest_window = (digest_local.weekday() == DIGEST_WEEKDAY and until_digest is not None
+                         and 0 <= until_digest <= DIGEST_WARM_LEAD_MINUTES * 60)
+        notify_lead = WARMING_NOTIFICATION_LEAD_MINUTES * 60
+        retry_after = max(self.fresh_seconds, self.tick_seconds)
+
+        planned = []
+        for user in self._users_snapshot():
+            user_id = user.get('id')
+            prefs = user.get('preferences') or {}
+            if not user_id or not prefs:
+                continue
+            if time.time() - self._last_attempt.get(user_id, 0) < retry_after:
+                continue
+            age = self.entry_age(user_id, prefs)
+
+            until_notify = None
+            if prefs.get('notification_time_local'):
+                local_now = _local_now(prefs.get('timezone'))
+                until_notify = _seconds_until(local_now, prefs['notification_time_local'])
+            if until_notify is not None and 0 <= until_notify <= notify_lead:
+                # Warm if the entry would no longer be served when the notification goes out
+                if age is None or age + until_notify >= self.stale_seconds:
+                    planned.append((PRIORITY_NOTIFICATION, 'notification', until_notify, user))
+                continue
+
+            if digest_window and user.get('email_digest'):
+                if age is None or age + until_digest >= self.stale_seconds:
+                    planned.append((PRIORITY_DIGEST, 'digest', until_digest, user))
+                continue
+
+            last_active = _parse_ts(user.get('last_active'))
+            if last_active and last_active >= active_cutoff:
+                if age is None or age >= self.stale_seconds - self.tick_seconds:
+                    planned.append((PRIORITY_ACTIVE, 'active', -last_active.timestamp(), user))
+
+        planned.sort(key=lambda p: (p[0], p[2]))
+        return [(priority, reason, user) for priority, reason, _, user in planned]
+
+    # -- execution --
+
+    def _budget_left(self):
+        # Caller holds _lock
+        cutoff = time.time() - 3600
+        while self._started_at and self._started_at[0] < cutoff:
+            self._started_at.popleft()
+        return min(self.per_tick,
+                   self.max_per_hour - len(self._started_at),
+                   self.concurrency - len(self._in_flight))
+
+    def _warm(self, reason, user):
+        user_id = user['id']
+        try:
+            items = self.warm_user(user_id, user.get('preferences') or {})
+            with self._lock:
+                self._stats['warmed' if items else 'empty'] += 1
+                self._stats['by_reason'][reason] += 1
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            print(f"[WARMING] Error warming {user_id} ({reason}): {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(user_id)
+
+    def tick(self):
+        """Plan once and submit as many warms as the budget allows. Returns how many were started."""
+        planned = self.plan()
+        started = 0
+        with self._lock:
+            self._stats['ticks'] += 1
+            self._stats['last_tick'] = datetime.now().isoformat()
+            self._stats['last_planned'] = len(planned)
+            budget = self._budget_left()
+            for _, reason, user in planned:
+                if user['id'] in self._in_flight:
+                    continue
+                if started >= budget:
+                    self._stats['budget_deferred'] += 1
+                    continue
+                try:
+                    self._executor.submit(self._warm, reason, user)
+                except RuntimeError:
+                    # Lane queue full (concurrency.LaneFull) or executor shut down: next tick
+                    self._stats['budget_deferred'] += 1
+                    continue
+                self._in_flight.add(user['id'])
+                self._last_attempt[user['id']] = time.time()
+                self._started_at.append(time.time())
+                started += 1
+        if started:
+            print(f"[WARMING] Started {started} of {len(planned)} planned warms")
+        return started
+
+    def start(self, initial_delay=2):
+        if not WARMING_ENABLED:
+            print("[WARMING] Disabled")
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def _run():
+            time.sleep(initial_delay)
+            while True:
+                try:
+                    self.tick()
+                except Exception as e:
+                    print(f"[WARMING] Tick error: {e}")
+                time.sleep(self.tick_seconds)
+
+        self._thread = threading.Thread(target=_run, name='cache-warming', daemon=True)
+        self._thread.start()
+        print(f"[WARMING] Scheduler started (every {self.tick_seconds}s, {self.concurrency} concurrent, "
+              f"{self.max_per_hour}/hour)")
+
+    def stats(self):
+        with self._lock:
+            cutoff = time.time() - 3600
+            return {
+                'enabled': WARMING_ENABLED,
+                'tick_seconds': self.tick_seconds,
+                'concurrency': self.concurrency,
+                'max_per_hour': self.max_per_hour,
+                'per_tick': self.per_tick,
+                'in_flight': len(self._in_flight),
+                'started_last_hour': sum(1 for t in self._started_at if t >= cutoff),
+                'users_known': len(self._users),
+                **{k: (dict(v) if isinstance(v, dict) else v) for k, v in self._stats.items()},
+            }
@@ -0,0 +1,251 @@
+"""
+Write-behind buffer for high-frequency writes (clicks, feedback, visited,
+saved, recommendation cache). Request handlers enqueue a db helper call and return
+immediately; a background thread applies queued calls in a single SQLite
+transaction every FLUSH_INTERVAL_MS or once FLUSH_BATCH_SIZE calls are waiting.
+"""
+
+import atexit
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import db
+
+WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND_ENABLED', '1') != '0'
+FLUSH_INTERVAL_MS = int(os.environ.get('WRITE_BEHIND_FLUSH_MS', '200'))
+FLUSH_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', '100'))
+MAX_QUEUE_SIZE = int(os.environ.get('WRITE_BEHIND_MAX_QUEUE', '10000'))
+# Users whose interaction version is tracked; the least recently active are forgotten beyond this
+MAX_TRACKED_USERS = int(os.environ.get('INTERACTION_VERSION_MAX_USERS', '20000'))
+
+# db helpers that may be deferred. Removals go through the queue as well so they
+# are applied in order with the adds they undo.
+ALLOWED_OPS = {
+    'add_click',
+    'add_feedback', 'remove_feedback',
+    'add_visited', 'ensure_visited', 'remove_visited',
+    'add_saved', 'ensure_saved', 'remove_saved',
+    'store_packed_recommendations', 'register_served_recommendations',
+    'upsert_places', 'put_geocode', 'put_reverse_geocode',
+}
+
+# Ops that change what a user should be recommended (history, feedback, affinity).
+# Enqueuing one bumps the user's interaction version, which warm cache entries
+# compare against to decide whether to re-rank (see app._rerank_warm_entry).
+INTERACTION_OPS = {
+    'add_click',
+    'add_feedback', 'remove_feedback',
+    'add_visited', 'ensure_visited', 'remove_visited',
+    'add_saved', 'ensure_saved', 'remove_saved',
+}
+
+# Versions come from one sequence seeded with the boot time, so versions recorded
+# by an earlier process (e.g. in a restored cache snapshot) never match new ones.
+_version_seq = itertools.count(int(time.time() * 1000))
+_boot_version = next(_version_seq)
+_interaction_versions = OrderedDict()   # user_id -> version of the latest interaction, oldest first
+_interaction_lock = threading.Lock()
+# Version reported for users not in _interaction_versions. Moved forward whenever users are
+# forgotten, so entries ranked before then never match again (one extra re-rank, never a stale one).
+_untracked_version = _boot_version
+
+_cond = threading.Condition()
+_flush_lock = threading.Lock()  # serializes flushes so batches commit in enqueue order
+_queue = deque()                # (op, user_id or None, args, kwargs)
+_in_flight = []                 # batch taken off the queue and not yet committed
+_pending_by_user = {}
+_worker = None
+_worker_pid = None
+_stopping = False
+
+_metrics = {
+    'enqueued': 0,
+    'flushed': 0,
+    'batches': 0,
+    'failed': 0,
+    'sync_writes': 0,
+    'max_depth': 0,
+    'last_batch_size': 0,
+    'last_flush_ms': 0.0,
+}
+
+
+def enqueue(op, user_id, *args, **kwargs):
+    """Queue db.<op>(user_id, *args, **kwargs). Falls back to a synchronous write when disabled or full."""
+    _enqueue(op, user_id, (user_id,) + args, kwargs)
+
+
+def enqueue_shared(op, *args, **kwargs):
+    """Queue db.<op>(*args, **kwargs) for data not owned by one user (e.g. the place catalog)."""
+    _enqueue(op, None, args, kwargs)
+
+
+def interaction_version(user_id):
+    """Opaque token that changes whenever an interaction for user_id is enqueued."""
+    with _interaction_lock:
+        return _interaction_versions.get(user_id, _untracked_version)
+
+
+def note_interaction(user_id):
+    """Bump user_id's interaction version (for changes made outside the queue, e.g. an affinity reset)."""
+    global _untracked_version
+    with _interaction_lock:
+        _interaction_versions[user_id] = next(_version_seq)
+        _interaction_versions.move_to_end(user_id)
+        if len(_interaction_versions) > MAX_TRACKED_USERS:
+            # Forget the oldest tenth in one go so the untracked version moves rarely
+            for _ in range(max(1, MAX_TRACKED_USERS // 10)):
+                _interaction_versions.popitem(last=False)
+            _untracked_version = next(_version_seq)
+
+
+def _enqueue(op, user_id, args, kwargs):
+    if op not in ALLOWED_OPS:
+        raise ValueError(f"Operation not allowed in write-behind queue: {op}")
+    if op in INTERACTION_OPS and user_id is not None:
+        note_interaction(user_id)
+    if not WRITE_BEHIND_ENABLED or _stopping:
+        _metrics['sync_writes'] += 1
+        getattr(db, op)(*args, **kwargs)
+        return
+    _ensure_worker()
+    with _cond:
+        full = len(_queue) >= MAX_QUEUE_SIZE
+        if not full:
+            _queue.append((op, user_id, args, kwargs))
+            if user_id is not None:
+                _pending_by_user[user_id] = _pending_by_user.get(user_id, 0) + 1
+            _metrics['enqueued'] += 1
+            _metrics['max_depth'] = max(_metrics['max_depth'], len(_queue))
+            if len(_queue) == 1 or len(_queue) >= FLUSH_BATCH_SIZE:
+                _cond.notify()
+    if full:
+        # Back-pressure: drain what is queued (keeps ordering), then write inline
+        print(f"[WRITE_QUEUE] Queue full ({MAX_QUEUE_SIZE}), writing {op} synchronously")
+        flush()
+        _metrics['sync_writes'] += 1
+        getattr(db, op)(*args, **kwargs)
+
+
+def flush():
+    """Apply everything queued so far in one transaction. Returns number of ops applied."""
+    with _flush_lock:
+        global _in_flight
+        with _cond:
+            batch = list(_queue)
+            _queue.clear()
+            _in_flight = batch
+        if not batch:
+            return 0
+        start = time.time()
+        try:
+            with db.get_conn():
+                for op, _, args, kwargs in batch:
+                    getattr(db, op)(*args, **kwargs)
+        except Exception as e:
+            # One bad op must not lose the whole batch: retry each in its own transaction
+            print(f"[WRITE_QUEUE] Batch of {len(batch)} failed ({e}), retrying individually")
+            for op, user_id, args, kwargs in batch:
+                try:
+                    getattr(db, op)(*args, **kwargs)
+                except Exception as op_err:
+                    _metrics['failed'] += 1
+                    print(f"[WRITE_QUEUE] Dropped {op} for {user_id}: {op_err}")
+        with _cond:
+            _in_flight = []
+            for _, user_id, _, _ in batch:
+                if user_id is None:
+                    continue
+                left = _pending_by_user.get(user_id, 0) - 1
+                if left > 0:
+                    _pending_by_user[user_id] = left
+                else:
+                    _pending_by_user.pop(user_id, None)
+        _metrics['flushed'] += len(batch)
+        _metrics['batches'] += 1
+        _metrics['last_batch_size'] = len(batch)
+        _metrics['last_flush_ms'] = round((time.time() - start) * 1000, 2)
+        return len(batch)
+
+
+def pending_args(op, user_id):
+    """
+    Arguments (after user_id) of the calls to op still waiting for user_id, oldest first,
+    so readers can see queued writes without forcing a flush.
+    """
+    with _cond:
+        calls = _in_flight + list(_queue)
+    return [args[1:] for queued_op, queued_user, args, _ in calls if queued_op == op and queued_user == user_id]
+
+
+def flush_user(user_id):
+    """Read-your-writes: flush now if this user has queued writes."""
+    if _pending_by_user.get(user_id):
+        flush()
+
+
+def get_metrics():
+    with _cond:
+        depth = len(_queue)
+        users = len(_pending_by_user)
+    return {
+        'enabled': WRITE_BEHIND_ENABLED,
+        'queue_depth': depth,
+        'users_pending': users,
+        'users_tracked': len(_interaction_versions),
+        'flush_interval_ms': FLUSH_INTERVAL_MS,
+        'batch_size': FLUSH_BATCH_SIZE,
+        **_metrics,
+    }
+
+
+def shutdown():
+    """Stop the flusher thread and write out anything still queued."""
+    global _stopping
+    with _cond:
+        _stopping = True
+        _cond.notify_all()
+    worker = _worker
+    if worker is not None and worker.is_alive() and worker is not threading.current_thread():
+        worker.join(timeout=5)
+    flushed = flush()
+    if flushed:
+        print(f"[WRITE_QUEUE] Flushed {flushed} pending writes on shutdown")
+
+
+def _run():
+    interval = FLUSH_INTERVAL_MS / 1000.0
+    while True:
+        with _cond:
+            if not _queue and not _stopping:
+                _cond.wait()
+            if _stopping:
+                return
+            # Give the batch a chance to fill, unless it already has
+            if len(_queue) < FLUSH_BATCH_SIZE:
+                _cond.wait(timeout=interval)
+            if _stopping:
+                return
+        try:
+            flush()
+        except Exception as e:
+            print(f"[WRITE_QUEUE] Flush error: {e}")
+
+
+def _ensure_worker():
+    """Start the flusher thread lazily (and again in forked gunicorn workers)."""
+    global _worker, _worker_pid
+    if _worker is not None and _worker_pid == os.getpid() and _worker.is_alive():
+        return
+    with _cond:
+        if _worker is not None and _worker_pid == os.getpid() and _worker.is_alive():
+            return
+        _worker = threading.Thread(target=db.closes_conn(_run), name='write-behind', daemon=True)
+        _worker_pid = os.getpid()
+        _worker.start()
+
+
+atexit.register(shutdown)
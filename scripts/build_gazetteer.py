@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Build backend/data/gazetteer.bin (see backend/gazetteer.py) from GeoNames.
+
+Inputs (https://download.geonames.org/export/):
+  --places  dump/US.zip or dump/cities500.zip (or the extracted .txt): populated places
+            (feature class P, US rows); also GeoNames cities JSON as bundled by the
+            geonamescache package (data/cities500.json)
+  --zips    zip/US.zip (or the extracted US.txt): ZIP code centroids; also the
+            zips.json.bz2 bundled by the zipcodes package (1.x)
+  --seed    backend/data/gazetteer_seed.csv: aliases and local overrides (name,state,lat,lng,alias);
+            these win over GeoNames, including for bare names ("dublin" -> Dublin, CA)
+
+Populated places with at least --min-population people, plus non-alias seed rows, also
+go into the nearest-place index used for reverse geocoding. Cities named only in the
+ZIP file get the mean of their ZIP centroids.
+
+The committed file was built with
+  python scripts/build_gazetteer.py --places cities500.json --zips zips.json.bz2
+(geonamescache 3.0.2, zipcodes 1.2.0). Other ways to run it:
+
+  python scripts/build_gazetteer.py --download           # fetch both GeoNames files
+  python scripts/build_gazetteer.py --places US.zip --zips US-zip.zip
+  python scripts/build_gazetteer.py                      # seed only
+
+--download is best effort: if GeoNames cannot be reached the existing output file is
+left as it is and the script still exits 0, so a deploy keeps the committed gazetteer.
+
+GeoNames data is CC BY 4.0; the zipcodes package (and its data) is MIT licensed.
+"""
+
+import argparse
+import bz2
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import urllib.request
+import zipfile
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND)
+
+import gazetteer  # noqa: E402
+
+PLACES_URL = 'https://download.geonames.org/export/dump/US.zip'
+ZIPS_URL = 'https://download.geonames.org/export/zip/US.zip'
+DEFAULT_SEED = os.path.join(BACKEND, 'data', 'gazetteer_seed.csv')
+
+
+def _open_text(path):
+    """Lines of a GeoNames dump, read from the .zip as published or an extracted .txt."""
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as zf:
+            name = next(n for n in zf.namelist() if n.endswith('.txt') and not n.startswith('readme'))
+            with zf.open(name) as f:
+                yield from io.TextIOWrapper(f, encoding='utf-8')
+    else:
+        with open(path, encoding='utf-8') as f:
+            yield from f
+
+
+def _place_rows(path):
+    """(name, asciiname, state, lat, lng, population) for each US populated place."""
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            rows = json.load(f)
+        for row in rows.values() if isinstance(rows, dict) else rows:
+            if row.get('countrycode') == 'US':
+                yield (row['name'], row.get('asciiname') or row['name'], row['admin1code'].upper(),
+                       float(row['latitude']), float(row['longitude']), int(row.get('population') or 0))
+        return
+    for line in _open_text(path):
+        cols = line.rstrip('\n').split('\t')
+        if len(cols) < 15 or cols[6] != 'P' or cols[8] != 'US':
+            continue
+        yield cols[1], cols[2], cols[10].upper(), float(cols[4]), float(cols[5]), int(cols[14] or 0)
+
+
+def load_places(path, names, populations, points, min_population):
+    """
+    GeoNames places: keep populated places, keyed by name/asciiname with their state;
+    places of at least min_population also become nearest-place points.
+    """
+    count = 0
+    for name, asciiname, state, lat, lng, population in _place_rows(path):
+        for n in {name, asciiname}:
+            if not gazetteer.normalize_name(n):
+                continue
+            for key in (gazetteer.name_key(n, state), gazetteer.name_key(n)):
+                if population > populations.get(key, -1):
+                    names[key] = (lat, lng)
+                    populations[key] = population
+        if population >= min_population and gazetteer.normalize_name(name):
+            points[gazetteer.name_key(name, state)] = (name, state, lat, lng)
+        count += 1
+    return count
+
+
+def _zip_rows(path):
+    """(zip, city, state, lat, lng) for each ZIP code with a centroid."""
+    if path.endswith('.json.bz2') or path.endswith('.json'):
+        with (bz2.open(path, 'rt', encoding='utf-8') if path.endswith('.bz2') else open(path, encoding='utf-8')) as f:
+            rows = json.load(f)
+        for row in rows:
+            if row.get('active', True) and row.get('lat') and row.get('long') and row['zip_code'].isdigit():
+                yield int(row['zip_code']), row['city'], row['state'], float(row['lat']), float(row['long'])
+        return
+    for line in _open_text(path):
+        cols = line.rstrip('\n').split('\t')
+        if len(cols) < 11 or not cols[1].isdigit() or not cols[9] or not cols[10]:
+            continue
+        yield int(cols[1]), cols[2], cols[4], float(cols[9]), float(cols[10])
+
+
+def load_zips(path, names):
+    """ZIP centroids; cities not already in names are added at the mean of their ZIPs."""
+    zips, cities = {}, {}
+    for code, city, state, lat, lng in _zip_rows(path):
+        zips[code] = (lat, lng)
+        if city and gazetteer.normalize_name(city):
+            cities.setdefault((city, state.upper()), []).append((lat, lng))
+    for (city, state), coords in cities.items():
+        centroid = (sum(c[0] for c in coords) / len(coords), sum(c[1] for c in coords) / len(coords))
+        for key in (gazetteer.name_key(city, state), gazetteer.name_key(city)):
+            names.setdefault(key, centroid)
+    return zips
+
+
+def _download(url, directory, filename):
+    """Fetch url into directory; None (with a warning) when it cannot be reached."""
+    path = os.path.join(directory, filename)
+    print(f"Downloading {url}")
+    try:
+        urllib.request.urlretrieve(url, path)
+    except OSError as e:
+        print(f"WARNING: download failed ({e})")
+        return None
+    return path
+
+
+def load_seed(path, names, points):
+    count = 0
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            coords = (float(row['lat']), float(row['lng']))
+            key = gazetteer.name_key(row['name'], row['state'])
+            names[key] = coords
+            names[gazetteer.name_key(row['name'])] = coords
+            if not row.get('alias'):
+                points[key] = (row['name'], row['state'], *coords)
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--places', help='GeoNames dump/US.zip, cities500.zip, their .txt, or cities500.json')
+    parser.add_argument('--zips', help='GeoNames zip/US.zip or US.txt, or zipcodes zips.json.bz2')
+    parser.add_argument('--seed', default=DEFAULT_SEED)
+    parser.add_argument('--min-population', type=int, default=1000,
+                        help='smallest GeoNames place kept for reverse lookups (default 1000)')
+    parser.add_argument('--download', action='store_true', help='fetch the GeoNames files first')
+    parser.add_argument('--output', default=gazetteer.GAZETTEER_PATH)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.download:
+            args.places = args.places or _download(PLACES_URL, tmp, 'places.zip')
+            args.zips = args.zips or _download(ZIPS_URL, tmp, 'zips.zip')
+            if not (args.places and args.zips):
+                print(f"Keeping the existing {args.output}")
+                return
+
+        names, populations, zips, points = {}, {}, {}, {}
+        if args.places:
+            print(f"Places: {load_places(args.places, names, populations, points, args.min_population)} populated places")
+        if args.zips:
+            zips = load_zips(args.zips, names)
+            print(f"ZIPs: {len(zips)} centroids")
+        if args.seed and os.path.exists(args.seed):
+            print(f"Seed: {load_seed(args.seed, names, points)} entries")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    n_names, n_zips, n_points = gazetteer.write(args.output, names, zips, points.values())
+    print(f"Wrote {args.output}: {n_names} name keys, {n_zips} ZIPs, {n_points} points "
+          f"({os.path.getsize(args.output)} bytes)")
+
+
+if __name__ == '__main__':
+    main()